@@ -1,21 +1,47 @@
 import asyncio
+import itertools
 import sys
+import threading
 import os
+import time
+import weakref
 from typing import Optional
 
 # 添加 main 目录到模块搜索路径
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'main'))
 
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Request, Response, Header
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 
 # 导入 main 模块的函数
 import main
+import fast_json
 import interactive_game as ig
+from decision_parser import extract_reason
+from outcome_store import OutcomeStore
+from trend_analysis import analyze_trends
+from cancellation import CancelToken, Cancelled, use_token
+from run_stats import logger
+from jobs import Job, JobNotFound, queue_from_env
+from session_store import SessionConflict, SessionNotFound
+from admission import Overloaded, admission_from_env
+from config.api_config import get_call_load, use_call_owner
+from metrics import get_registry
 
-app = FastAPI()
+class FastJSONResponse(JSONResponse):
+    """用 fast_json 编码的 JSON 响应；内容已是编码好的 bytes 时原样发送"""
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return fast_json.dumps(content)
+
+
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # 允许前端跨域请求
 app.add_middleware(
@@ -25,16 +51,138 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 压缩较大的响应（完整状态、任务事件）；推送流（text/event-stream）不压缩，事件到达即发送
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
+
+
+@app.exception_handler(Overloaded)
+async def _overloaded_handler(request: Request, exc: Overloaded):
+    # 超出准入预算：429，Retry-After 按模型调用的排队深度估算
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.reason, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(JobNotFound)
+async def _job_not_found_handler(request: Request, exc: JobNotFound):
+    # 任务不存在或已结束并被丢弃：404
+    return JSONResponse(status_code=404, content={"detail": str(exc)})
+
+
+@app.exception_handler(SessionNotFound)
+async def _session_not_found_handler(request: Request, exc: SessionNotFound):
+    # 会话不存在，或已被删除、超时移除、淘汰：404，客户端应重新创建会话
+    return JSONResponse(status_code=404, content={"detail": str(exc)})
+
+
+@app.exception_handler(SessionConflict)
+async def _session_conflict_handler(request: Request, exc: SessionConflict):
+    # 会话在其他进程中被推进或删除，本次修改未保存：409，客户端取最新状态后重试
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+
+@app.on_event("startup")
+def _install_call_limiter():
+    # 按 AMPHOREUS_MAX_LLM_CALLS 限制本进程的并发模型调用
+    _admission.install_call_limiter()
+
+
+@app.on_event("startup")
+def _start_session_sweeper():
+    # 定期移除空闲超时的交互式会话，长时间运行时内存保持平稳
+    ig.get_session_store().start_sweeper()
+
+
+@app.on_event("shutdown")
+def _stop_session_sweeper():
+    ig.get_session_store().stop_sweeper()
+
+
+@app.on_event("shutdown")
+def _stop_jobs():
+    # 取消未结束的后台任务，等待工作线程退出
+    _jobs.shutdown()
+
+
+# 本进程中所有 /api/run_game 运行与后台任务的结局，每次运行一个 run_id，供 /api/analysis/trends 实时分析。
+# 后台任务在工作线程中写入，读写都持有 _outcomes_lock
+_outcomes = OutcomeStore()
+_outcomes_lock = threading.Lock()
+_run_ids = itertools.count()
+
+
+class _OutcomeRecorder:
+    """把一次运行的事件逐个写入 _outcomes"""
+
+    def __init__(self):
+        self.run_id = next(_run_ids)
+        self.persuaded_at = {}
+
+    def feed(self, event: dict):
+        event_type = event.get('type')
+        if event_type == 'handover_redecision' and event.get('decision') == '1':
+            self.persuaded_at[event.get('char_id')] = event.get('attempt', 0)
+        elif event_type == 'round_end':
+            with _outcomes_lock:
+                _outcomes.append(event.get('final_result', {}), event.get('robbed_characters', []),
+                                 round_num=event.get('round_num', 0), run_id=self.run_id,
+                                 persuaded_at=self.persuaded_at,
+                                 memory_chars=sum(event.get('memory_chars', {}).values()))
+            self.persuaded_at = {}
+
+
+# 每个后台任务一个结局记录器，随任务对象回收
+_job_recorders: "weakref.WeakKeyDictionary[Job, _OutcomeRecorder]" = weakref.WeakKeyDictionary()
+
+
+def _record_job_event(job: Job, event: dict):
+    recorder = _job_recorders.get(job)
+    if recorder is None:
+        recorder = _job_recorders[job] = _OutcomeRecorder()
+    recorder.feed(event)
+
+
+# 后台模拟任务队列（/api/jobs）：工作线程数与任务合计的请求并发由环境变量配置，见 jobs.py
+_jobs = queue_from_env(on_event=_record_job_event)
+
+# 准入控制：并发模型调用、调用排队深度、同时运行的模拟数与每个客户端的调用数，见 admission.py
+_admission = admission_from_env()
+
+
+def _client_id(request: Request) -> str:
+    """按客户端地址区分调用方"""
+    return request.client.host if request.client else "unknown"
+
+
+# 运行指标（/metrics）：请求耗时与推送流订阅数在此记录，模型调用与解析指标见 metrics.py
+_metrics = get_registry()
+_HTTP_LATENCY = _metrics.histogram(
+    "amphoreus_http_request_duration_seconds", "HTTP 请求耗时（推送流只计到开始推送）",
+    labels=("method", "route", "status"),
+)
+_SSE_SUBSCRIBERS = _metrics.gauge("amphoreus_sse_subscribers", "当前的推送流订阅数", labels=("stream",))
+
+# 每路推送流的事件缓冲上限：浏览器读得慢时模拟暂停在 put 上，不再继续调用模型
+STREAM_QUEUE_SIZE = 16
+# 没有新事件时检查客户端是否已断开的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 1.0
+
 # 定义配置参数模型（用于文档）
 class GameConfig(BaseModel):
     max_iterations: int = 6
     max_persuasions: int = 3
+    seed: Optional[int] = None
+    temperature: Optional[float] = None
 
 
 # ===== 交互式玩家扮演模式 =====
 
 class InteractiveGameConfig(BaseModel):
     max_rounds: int = 1
+    seed: Optional[int] = None
+    temperature: Optional[float] = None
 
 
 class ChooseCharacterRequest(BaseModel):
@@ -46,67 +194,87 @@ class DecisionRequest(BaseModel):
     reason: Optional[str] = None
 
 
-def extract_reason_from_message(message: str) -> str:
+async def _produce_events(queue: asyncio.Queue, token: CancelToken, owner: Optional[str] = None, **kwargs):
     """
-    从消息中提取 reason 字段
-    如果消息是 JSON 格式且包含 reason 字段，则返回 reason 的内容
-    否则返回原消息
+    在独立任务中运行模拟，把事件放入有界队列，正常结束时放入 None，出错时放入异常
+
+    队列满时在 put 处等待，模拟随之暂停；token 取消后尚未发出的模型调用不再进行。
+    模型调用计入调用方 owner 的负载（见 admission.py）。
     """
-    if not message or not isinstance(message, str):
-        return message or ""
-    
-    message = message.strip()
-    
-    # 检查是否是 JSON 格式（以 { 开头）
-    if message.startswith('{') and 'reason' in message:
-        try:
-            import json
-            import re
-            
-            # 尝试提取 reason 字段的值
-            # 匹配 'reason': '...' 或 "reason": "..." 格式
-            pattern = r"['\"]reason['\"]\s*:\s*['\"](.+?)['\"](?:,|\})"
-            match = re.search(pattern, message, re.DOTALL)
-            if match:
-                return match.group(1).strip()
-            
-            # 如果正则提取失败，尝试 json 解析
-            try:
-                data = json.loads(message)
-                if isinstance(data, dict) and 'reason' in data:
-                    return str(data['reason']).strip()
-            except json.JSONDecodeError:
-                pass
-                
-        except Exception:
-            pass
-    
-    return message
+    try:
+        with use_token(token), use_call_owner(owner):
+            async for event in main.eternal_regression_realtime_streaming_async(**kwargs):
+                await queue.put(event)
+    except Cancelled:
+        return
+    except Exception as e:
+        await queue.put(e)
+        return
+    await queue.put(None)
 
 
-async def run_game_stream(max_iterations: int = 6, max_persuasions: int = 3):
+async def run_game_stream(max_iterations: int = 6, max_persuasions: int = 3, seed: Optional[int] = None,
+                          temperature: Optional[float] = None, request: Optional[Request] = None,
+                          format: str = "text", owner: Optional[str] = None, lease=None):
     """
     运行永劫回归游戏流
     
-    调用 main.py 中的 eternal_regression_realtime_streaming 函数，
-    将生成器产生的事件转换为 SSE 格式返回给前端
+    调用 main.py 中的 eternal_regression_realtime_streaming_async 异步生成器，
+    将产生的事件转换为 SSE 格式返回给前端；LLM 调用在线程中进行，不阻塞事件循环。
+
+    模拟在单独的任务中运行，经由有界队列把事件交给本生成器。客户端断开时
+    （StreamingResponse 关闭本生成器，或轮询 request.is_disconnected() 发现断开）
+    取消令牌并取消该任务：尚未发出的模型调用不再进行，在途调用的结果被丢弃，
+    角色的 HTTP 会话随之关闭。
+
+    format 为 "json" 时每条消息的 data 是一个完整事件的 JSON（不截断理由与劝说文本，
+    截断与排版交给前端）；默认 "text" 为下面的终端风格文本。
+
+    lease 为准入控制分配的模拟名额，推送流结束时释放。
     """
-    # 启动游戏流
-    yield "data: >>> 启动永劫回归测试程序\n\n"
-    yield f"data: >>> === 开始永劫回归测试，共 {max_iterations} 轮迭代 ===\n\n"
-    
+    as_json = format == "json"
+    if not as_json:
+        # 启动游戏流
+        yield "data: >>> 启动永劫回归测试程序\n\n"
+        yield f"data: >>> === 开始永劫回归测试，共 {max_iterations} 轮迭代 ===\n\n"
+
+    recorder = _OutcomeRecorder()
+
+    token = CancelToken()
+    queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    producer = asyncio.create_task(_produce_events(
+        queue,
+        token,
+        owner=owner,
+        rounds=max_iterations,
+        max_persuasion_attempts=max_persuasions,
+        seed=seed,
+        temperature=temperature,
+    ))
+
+    _SSE_SUBSCRIBERS.inc(stream="run_game")
     try:
-        # 调用 main.py 的流式生成器
-        event_generator = main.eternal_regression_realtime_streaming(
-            rounds=max_iterations,
-            max_persuasion_attempts=max_persuasions
-        )
-        
-        # 遍历所有事件并转换为 SSE 格式
-        for event in event_generator:
+        # 逐个取出事件并转换为 SSE 格式
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=DISCONNECT_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                if request is not None and await request.is_disconnected():
+                    break
+                continue
+            if event is None:
+                break
+            if isinstance(event, Exception):
+                raise event
+
             event_type = event.get('type', '')
-            
-            if event_type == 'start':
+            # 写入结局存储，供趋势分析接口使用
+            recorder.feed(event)
+
+            if as_json:
+                yield b"data: " + fast_json.dumps(event) + b"\n\n"
+
+            elif event_type == 'start':
                 # 游戏开始
                 pass  # 已在上面输出
                 
@@ -127,7 +295,7 @@ async def run_game_stream(max_iterations: int = 6, max_persuasions: int = 3):
                 message = event.get('message', '')
                 decision_text = "逐火" if decision == '1' else "不逐火"
                 # 提取 reason 字段
-                reason_text = extract_reason_from_message(message)
+                reason_text = extract_reason(message, default=message)
                 yield f"data: >>> [{char_name}] 决定: {decision_text}\n"
                 yield f"data:    理由: {reason_text[:200]}{'...' if len(reason_text) > 200 else ''}\n\n"
             
@@ -148,7 +316,7 @@ async def run_game_stream(max_iterations: int = 6, max_persuasions: int = 3):
                 message = event.get('message', '')
                 decision_text = "交出火种" if decision == '1' else "拒绝交出"
                 # 提取 reason 字段
-                reason_text = extract_reason_from_message(message)
+                reason_text = extract_reason(message, default=message)
                 yield f"data: >>> [{char_name}] 回应: {decision_text}\n"
                 yield f"data:    理由: {reason_text[:200]}{'...' if len(reason_text) > 200 else ''}\n\n"
             
@@ -180,6 +348,7 @@ async def run_game_stream(max_iterations: int = 6, max_persuasions: int = 3):
                 final_result = event.get('final_result', {})
                 robbed = event.get('robbed_characters', [])
                 memory_count = event.get('memory_count', {})
+
                 
                 yield f"data: >>> [第 {round_num} 轮结果统计]\n"
                 for char_id, status in final_result.items():
@@ -193,12 +362,20 @@ async def run_game_stream(max_iterations: int = 6, max_persuasions: int = 3):
             elif event_type == 'complete':
                 total_rounds = event.get('total_rounds', 0)
                 yield f"data: >>> 永劫回归测试完成！共执行 {total_rounds} 轮迭代\n\n"
-            
-            # 让出控制权，避免阻塞
-            await asyncio.sleep(0.01)
+
     
     except Exception as e:
-        yield f"data: >>> 发生错误: {str(e)}\n\n"
+        if as_json:
+            yield _sse_message({"type": "error", "message": str(e)})
+        else:
+            yield f"data: >>> 发生错误: {str(e)}\n\n"
+    finally:
+        # 正常结束时任务已完成；客户端断开时在此取消仍在运行的模拟
+        token.cancel()
+        producer.cancel()
+        _SSE_SUBSCRIBERS.dec(stream="run_game")
+        if lease is not None:
+            lease.release()
     
     # 结束标志
     yield "data: [DONE]\n\n"
@@ -206,8 +383,12 @@ async def run_game_stream(max_iterations: int = 6, max_persuasions: int = 3):
 
 @app.get("/api/run_game")
 async def start_game_endpoint(
+    request: Request,
     max_iterations: int = 6,
-    max_persuasions: int = 3
+    max_persuasions: int = 3,
+    seed: Optional[int] = None,
+    temperature: Optional[float] = None,
+    format: str = "text",
 ):
     """
     对外暴露的 API 接口 (GET)
@@ -215,17 +396,399 @@ async def start_game_endpoint(
     参数:
     - max_iterations: 迭代次数，默认6
     - max_persuasions: 最大劝说次数，默认3
+    - seed: 随机种子（可选），用于复现一次运行
+    - temperature: 模型采样温度（可选）
+    - format: "text"（默认，终端风格文本）或 "json"（每条消息一个完整事件）
     
-    返回 StreamingResponse，media_type 为 text/event-stream
+    返回 StreamingResponse，media_type 为 text/event-stream；
+    同时运行的模拟或模型调用排队超出预算时返回 429（见 admission.py）
     """
+    client = _client_id(request)
+    lease = _admission.admit_simulation(client)
+    stream = run_game_stream(max_iterations, max_persuasions, seed=seed, temperature=temperature, request=request,
+                             format=format, owner=client, lease=lease)
+    # 生成器从未开始（客户端在第一块数据之前断开、响应在迭代前出错）时 finally 不会执行，
+    # 生成器被回收时同样释放名额（release 只生效一次）
+    weakref.finalize(stream, lease.release)
     return StreamingResponse(
-        run_game_stream(max_iterations, max_persuasions),
+        stream,
         media_type="text/event-stream"
     )
 
 
+@app.get("/api/analysis/trends")
+def get_trend_analysis():
+    """
+    对本进程中已完成的全部 /api/run_game 轮次做趋势分析
+
+    返回状态转移概率、交出/强夺率曲线、劝说存活曲线与记忆规模相关性（见 trend_analysis.py）。
+    普通函数，由 FastAPI 在线程池中执行：numpy / pandas 分析不占用事件循环；
+    锁内只复制结局矩阵，推送流与后台任务写入结局时不必等待分析结束。
+    """
+    with _outcomes_lock:
+        outcomes = _outcomes.copy()
+    return {
+        "total_rounds": len(outcomes),
+        "trends": analyze_trends(outcomes),
+    }
+
+
+# ===== 后台模拟任务 API =====
+
+def _sse_message(message: dict) -> bytes:
+    """把一条推送消息编码为 SSE 格式（data 为一行 JSON）"""
+    return b"data: " + fast_json.dumps(message) + b"\n\n"
+
+
+def _sse_event(index: int, encoded_event: bytes) -> bytes:
+    """event 类型的推送消息，直接拼接事件添加时的编码结果"""
+    return b'data: {"type":"event","index":%d,"event":%s}\n\n' % (index, encoded_event)
+
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(config: GameConfig, request: Request):
+    """
+    提交一次后台模拟，立即返回任务摘要（含 job_id）
+
+    任务排队等待工作线程，同时运行的任务数有上限；事件保存在服务端，
+    可以用 /api/jobs/{job_id}/events 订阅，断开后再次订阅也能从头取回。
+    未结束的任务计入同时运行的模拟数，超出预算时返回 429。
+    """
+    client = _client_id(request)
+    lease = _admission.admit_simulation(client)
+    job = _jobs.submit(
+        rounds=config.max_iterations,
+        max_persuasion_attempts=config.max_persuasions,
+        seed=config.seed,
+        temperature=config.temperature,
+        owner=client,
+    )
+
+    def release_when_done():
+        if job.done:
+            lease.release()
+
+    job.add_listener(release_when_done)
+    # 任务可能在注册监听器之前就已结束（例如立即被取消）
+    release_when_done()
+    return job.summary()
+
+
+@app.get("/api/jobs")
+async def list_jobs():
+    """全部任务的摘要与各状态的任务数"""
+    return {
+        "counts": _jobs.counts(),
+        "jobs": [job.summary() for job in _jobs.jobs()],
+    }
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, since: Optional[int] = None):
+    """
+    任务摘要；提供 since 时附带第 since 个之后的事件
+    """
+    job = _jobs.get(job_id)
+    result = job.summary()
+    if since is None:
+        return result
+    since = min(max(since, 0), result["events_total"])
+    result["events_since"] = since
+    events = job.encoded_events(since, result["events_total"])
+    return FastJSONResponse(fast_json.with_field(fast_json.dumps(result), "events", fast_json.join_array(events)))
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    取消任务：排队中的不再运行，运行中的停止后续模型调用
+    """
+    return _jobs.cancel(job_id).summary()
+
+
+async def job_event_stream(job: Job, since: int, request: Request):
+    """
+    任务推送流：先补发 since 之后的事件，之后每产生一个事件就推送，任务结束后关闭
+
+    消息类型：event（index 为事件下标）与 status（任务摘要，状态变化时发送）。
+    客户端断开只结束推送，不影响任务本身。
+    """
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def notify():
+        # 在任务线程中调用，转到事件循环中唤醒
+        try:
+            loop.call_soon_threadsafe(changed.set)
+        except RuntimeError:
+            pass
+
+    job.add_listener(notify)
+    sent = min(max(since, 0), len(job.events))
+    last_status = None
+    _SSE_SUBSCRIBERS.inc(stream="job")
+    try:
+        while True:
+            changed.clear()
+            # 先读状态再读事件：任务在最后一个事件之后才结束，已结束时读到的事件必然完整
+            done = job.done
+            events = job.encoded_events(sent)
+            for offset, encoded in enumerate(events):
+                yield _sse_event(sent + offset, encoded)
+            sent += len(events)
+            if job.status != last_status:
+                last_status = job.status
+                yield _sse_message({"type": "status", "job": job.summary()})
+            if done:
+                break
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=DISCONNECT_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+    finally:
+        job.remove_listener(notify)
+        _SSE_SUBSCRIBERS.dec(stream="job")
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request, since: int = 0):
+    """
+    订阅任务事件（SSE），每条消息的 data 为一行 JSON，见 job_event_stream
+
+    参数:
+    - since: 客户端已有的事件数，从该下标开始补发
+    """
+    job = _jobs.get(job_id)
+    return StreamingResponse(job_event_stream(job, since, request), media_type="text/event-stream")
+
+
 # ===== 交互式玩家扮演模式 API =====
 
+# 每个会话一把 asyncio 锁：同一会话的请求依次执行，不同会话的请求在线程池中并行。
+# 锁只被正在处理该会话请求的协程引用，没有请求时自动回收。
+_session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _session_lock(session_id: str) -> asyncio.Lock:
+    lock = _session_locks.get(session_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _session_locks[session_id] = lock
+    return lock
+
+
+async def _run_session(session_id: str, method: str, *args, since: Optional[int] = None,
+                       owner: Optional[str] = None):
+    """
+    在线程池中执行会话方法（其中包含阻塞的模型调用），不占用事件循环
+
+    等待同一会话的前一个请求时只挂起协程，不占用线程池中的线程。
+    执行后保存会话（使用 SQLite 存储时写入新状态与新事件，即使方法出错也保存已产生的变化；
+    此时保存冲突只记录，向调用方抛出方法本身的异常）。
+    提供 since 时只返回客户端尚未拿到的事件（见 GameSession._state_response）。
+    返回的状态由 GameSession.state_json 编码，事件不再重复编码。
+    模型调用计入调用方 owner 的负载。
+    """
+    lock = _session_lock(session_id)
+    async with lock:
+        # 在锁内取会话：使用持久化存储时可能读到其他进程刚保存的新状态，推送通道随之换到新对象
+        session = await run_in_threadpool(ig.get_session, session_id)
+        channel = _session_channels.get(session_id)
+        if channel is not None:
+            channel.rebind(session)
+        try:
+            with use_call_owner(owner):
+                await run_in_threadpool(getattr(session, method), *args)
+        except BaseException:
+            try:
+                await run_in_threadpool(ig.save_session, session)
+            except SessionConflict as e:
+                logger.warning("会话 %s 执行 %s 出错，已产生的变化未保存: %s", session_id, method, e)
+            raise
+        await run_in_threadpool(ig.save_session, session)
+        return FastJSONResponse(session.state_json(since))
+
+
+class _SessionChannel:
+    """
+    一个会话的推送通道
+
+    会话在工作线程中每产生一个事件就通知通道，通道唤醒所有订阅者（/events 推送流），
+    AI 的每个决策、劝说与强夺在产生时即推送给客户端，不必等整个阶段结束。
+    以 background 方式提交的请求在后台任务中执行，执行中的请求数与出错信息也经推送流发出。
+    """
+
+    def __init__(self, session: ig.GameSession):
+        self.session = session
+        self.loop = asyncio.get_running_loop()
+        self.pending = 0
+        self.errors: list = []
+        self._tasks = set()
+        self._waiters = set()
+        session.add_listener(self._notify)
+
+    @property
+    def busy(self) -> bool:
+        return self.pending > 0
+
+    def _notify(self):
+        # 在工作线程中调用，转到事件循环中唤醒订阅者
+        try:
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def _wake(self):
+        for waiter in self._waiters:
+            waiter.set()
+
+    def rebind(self, session: ig.GameSession):
+        """
+        换到重新加载的会话对象
+
+        使用 SQLite 存储时，其他进程推进会话后本进程会重新加载出一个新对象；
+        已订阅的推送流随通道换到新对象上，继续收到之后的事件。
+        """
+        if session is self.session:
+            return
+        self.session.remove_listener(self._notify)
+        self.session = session
+        session.add_listener(self._notify)
+        self._wake()
+
+    async def refresh(self) -> bool:
+        """重新取会话并换到最新的对象；会话已被删除 / 超时移除时返回 False"""
+        lock = _session_lock(self.session.session_id)
+        if lock.locked():
+            # 本进程正有请求在执行，它取会话时会换到最新的对象
+            return True
+        async with lock:
+            try:
+                session = await run_in_threadpool(ig.get_session_store().peek, self.session.session_id)
+            except SessionNotFound:
+                return False
+            self.rebind(session)
+        return True
+
+    def submit(self, method: str, *args, owner: Optional[str] = None):
+        """在后台任务中执行会话方法（与同步请求共用会话锁，依次执行）"""
+        self.pending += 1
+        task = asyncio.create_task(self._run(method, *args, owner=owner))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self._wake()
+
+    async def _run(self, method: str, *args, owner: Optional[str] = None):
+        try:
+            await _run_session(self.session.session_id, method, *args, owner=owner)
+        except Exception as e:
+            logger.warning("会话 %s 后台执行 %s 出错: %s", self.session.session_id, method, e)
+            self.errors.append({"action": method, "message": str(e)})
+        finally:
+            self.pending -= 1
+            self._wake()
+
+    async def stream(self, since: int, request: Request):
+        """
+        推送流：先补发 since 之后的事件，之后每有变化就推送
+
+        消息类型：
+        - event: 一条游戏事件，index 为它在事件流中的下标
+        - state: 不含事件的状态快照（字段同 /state，另有 busy 表示是否有请求在执行），仅在变化时发送
+        - error: 后台请求出错（只推送订阅之后发生的错误）
+        """
+        changed = asyncio.Event()
+        self._waiters.add(changed)
+        sent = since
+        errors_seen = len(self.errors)
+        last_snapshot = None
+        _SSE_SUBSCRIBERS.inc(stream="session")
+        try:
+            while True:
+                # 先清除再读取：读取期间的新变化会再次唤醒
+                changed.clear()
+                state = self.session._state_response(sent, include_events=False)
+                total = state.pop("events_total")
+                for offset, encoded in enumerate(self.session.encoded_events(sent, total)):
+                    yield _sse_event(sent + offset, encoded)
+                sent = total
+                state.pop("events_since")
+                state["busy"] = self.busy
+
+                # 版本随每个事件递增，比较快照时忽略
+                snapshot = {key: value for key, value in state.items() if key != "version"}
+                if snapshot != last_snapshot:
+                    last_snapshot = snapshot
+                    yield _sse_message({"type": "state", "state": state})
+
+                for error in self.errors[errors_seen:]:
+                    yield _sse_message({"type": "error", **error})
+                errors_seen = len(self.errors)
+
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=DISCONNECT_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    # 客户端断开，或会话已被删除 / 超时移除；
+                    # 使用 SQLite 存储时同时发现其他进程推进的新状态（查询在线程池中进行）
+                    if await request.is_disconnected():
+                        break
+                    if not await self.refresh():
+                        break
+        finally:
+            self._waiters.discard(changed)
+            _SSE_SUBSCRIBERS.dec(stream="session")
+
+
+# 推送通道由会话的监听器持有，随会话一起回收（重新加载会话时通道换到新对象上，见 rebind）
+_session_channels: "weakref.WeakValueDictionary[str, _SessionChannel]" = weakref.WeakValueDictionary()
+
+
+async def _session_channel(session_id: str) -> _SessionChannel:
+    """
+    取出会话的推送通道，没有时创建
+
+    创建时持有会话锁并在线程池中取会话：SQLite 存储的查询与重新加载不阻塞事件循环，
+    也不会拿到正在执行的请求即将替换的旧会话对象。
+    """
+    channel = _session_channels.get(session_id)
+    if channel is not None:
+        return channel
+    async with _session_lock(session_id):
+        session = await run_in_threadpool(ig.get_session, session_id)
+        # 等待锁期间可能已有其他请求创建了通道
+        channel = _session_channels.get(session_id)
+        if channel is None:
+            channel = _SessionChannel(session)
+            _session_channels[session_id] = channel
+        else:
+            channel.rebind(session)
+    return channel
+
+
+async def _session_action(request: Request, session_id: str, method: str, *args, since: Optional[int] = None,
+                          background: bool = False):
+    """
+    执行推进游戏的请求
+
+    background 为 True 时立即返回 202，请求在后台执行，事件经 /events 推送流送达；
+    否则等待执行完毕，返回状态（同 _run_session）。
+    模型调用排队或该客户端的调用超出预算时返回 429，会话状态不变，客户端可稍后重试。
+    """
+    client = _client_id(request)
+    _admission.check(client)
+    if not background:
+        return await _run_session(session_id, method, *args, since=since, owner=client)
+    channel = await _session_channel(session_id)
+    channel.submit(method, *args, owner=client)
+    return JSONResponse(status_code=202, content={
+        "session_id": session_id,
+        "accepted": method,
+        "version": channel.session.version,
+    })
+
+
 @app.post("/api/game/create")
 async def create_interactive_game(config: InteractiveGameConfig):
     """
@@ -233,12 +796,15 @@ async def create_interactive_game(config: InteractiveGameConfig):
     
     参数:
     - max_rounds: 最大回合数，默认1
+    - seed: 随机种子（可选），用于复现一局
+    - temperature: 模型采样温度（可选）
     
     返回:
     - session_id: 会话ID
     - stage: 当前阶段 (created)
     """
-    session_id = ig.create_session(max_rounds=config.max_rounds)
+    session_id = await run_in_threadpool(ig.create_session, max_rounds=config.max_rounds, seed=config.seed,
+                                         temperature=config.temperature)
     return {
         "session_id": session_id,
         "stage": "created",
@@ -247,28 +813,30 @@ async def create_interactive_game(config: InteractiveGameConfig):
 
 
 @app.post("/api/game/{session_id}/start")
-async def start_interactive_game(session_id: str):
+async def start_interactive_game(session_id: str, request: Request, since: Optional[int] = None,
+                                 background: bool = False):
     """
     开始游戏：返回开场文案、神谕和可选角色列表
     """
-    session = ig.get_session(session_id)
-    return session.start()
+    return await _session_action(request, session_id, "start", since=since, background=background)
 
 
 @app.post("/api/game/{session_id}/choose")
-async def choose_character(session_id: str, req: ChooseCharacterRequest):
+async def choose_character(session_id: str, request: Request, req: ChooseCharacterRequest,
+                           since: Optional[int] = None, background: bool = False):
     """
     玩家选择扮演的角色
     
     参数:
     - char_id: 角色ID（不能是缇宝 HapLotes405）
     """
-    session = ig.get_session(session_id)
-    return session.choose_character(req.char_id)
+    return await _session_action(request, session_id, "choose_character", req.char_id, since=since,
+                                 background=background)
 
 
 @app.post("/api/game/{session_id}/fire_decision")
-async def submit_fire_decision(session_id: str, req: DecisionRequest):
+async def submit_fire_decision(session_id: str, request: Request, req: DecisionRequest,
+                               since: Optional[int] = None, background: bool = False):
     """
     玩家提交逐火决策
     
@@ -279,12 +847,13 @@ async def submit_fire_decision(session_id: str, req: DecisionRequest):
     - decision: "1" 表示逐火，"0" 表示不逐火
     - reason: 决策理由（可选，不填由AI生成）
     """
-    session = ig.get_session(session_id)
-    return session.submit_fire_decision(req.decision, req.reason)
+    return await _session_action(request, session_id, "submit_fire_decision", req.decision, req.reason,
+                                 since=since, background=background)
 
 
 @app.post("/api/game/{session_id}/handover_decision")
-async def submit_handover_decision(session_id: str, req: DecisionRequest):
+async def submit_handover_decision(session_id: str, request: Request, req: DecisionRequest,
+                                   since: Optional[int] = None, background: bool = False):
     """
     玩家提交交火种决策
     
@@ -295,12 +864,13 @@ async def submit_handover_decision(session_id: str, req: DecisionRequest):
     - decision: "1" 表示交出火种，"0" 表示拒绝
     - reason: 决策理由（可选，不填由AI生成）
     """
-    session = ig.get_session(session_id)
-    return session.submit_handover_decision(req.decision, req.reason)
+    return await _session_action(request, session_id, "submit_handover_decision", req.decision, req.reason,
+                                 since=since, background=background)
 
 
 @app.post("/api/game/{session_id}/handover_redecision")
-async def submit_handover_redecision(session_id: str, req: DecisionRequest):
+async def submit_handover_redecision(session_id: str, request: Request, req: DecisionRequest,
+                                     since: Optional[int] = None, background: bool = False):
     """
     盗火行者劝说后，玩家再次提交交火种决策
     
@@ -308,26 +878,117 @@ async def submit_handover_redecision(session_id: str, req: DecisionRequest):
     - decision: "1" 表示改变主意交出火种，"0" 表示仍然拒绝
     - reason: 决策理由（可选，不填由AI生成）
     """
-    session = ig.get_session(session_id)
-    return session.submit_handover_redecision(req.decision, req.reason)
+    return await _session_action(request, session_id, "submit_handover_redecision", req.decision, req.reason,
+                                 since=since, background=background)
 
 
 @app.post("/api/game/{session_id}/continue")
-async def continue_interactive_game(session_id: str):
+async def continue_interactive_game(session_id: str, request: Request, since: Optional[int] = None,
+                                    background: bool = False):
     """
     回合结束后继续下一回合，或结束游戏
     """
-    session = ig.get_session(session_id)
-    return session.continue_game()
+    return await _session_action(request, session_id, "continue_game", since=since, background=background)
 
 
 @app.get("/api/game/{session_id}/state")
-async def get_interactive_game_state(session_id: str):
+async def get_interactive_game_state(
+    session_id: str,
+    since: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
+):
     """
     获取当前游戏状态
+
+    不等待会话锁，阶段进行中（另一个请求正在线程池中执行）也能轮询到已产生的事件。
+
+    参数:
+    - since: 客户端已有的事件数，提供时只返回之后的新事件
+    - If-None-Match 请求头: 上次响应的 ETag；状态未变化时返回 304，不带响应体
+    """
+    session = await run_in_threadpool(ig.get_session, session_id)
+    etag = session.etag
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return FastJSONResponse(session.state_json(since), headers={"ETag": etag})
+
+
+@app.delete("/api/game/{session_id}")
+async def delete_interactive_game(session_id: str):
+    """
+    结束并删除会话，释放其占用的内存与模型客户端（未删除的会话在空闲超时后自动移除）
+    """
+    async with _session_lock(session_id):
+        deleted = await run_in_threadpool(ig.delete_session, session_id)
+    return {"session_id": session_id, "deleted": deleted}
+
+
+@app.get("/api/game/{session_id}/events")
+async def stream_interactive_game_events(session_id: str, request: Request, since: int = 0):
+    """
+    会话推送流（SSE）：AI 的每个决策、劝说与强夺在产生时立即推送
+
+    推进游戏的接口带上 background=true 时立即返回 202，之后的事件与状态都经本推送流送达，
+    客户端不必再轮询 /state。每条消息的 data 为一行 JSON，见 _SessionChannel.stream。
+
+    参数:
+    - since: 客户端已有的事件数，从该下标开始补发
+    """
+    channel = await _session_channel(session_id)
+    return StreamingResponse(channel.stream(since, request), media_type="text/event-stream")
+
+
+
+# ===== 运行指标 =====
+
+@app.middleware("http")
+async def _record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # 按路由模板记录（/api/game/{session_id}/state），未匹配的路径合为一类，避免标签无限增长
+    route = request.scope.get("route")
+    _HTTP_LATENCY.observe(time.perf_counter() - start, method=request.method,
+                          route=route.path if route is not None else "unmatched",
+                          status=str(response.status_code))
+    return response
+
+
+def _session_store_stats() -> dict:
+    return ig.get_session_store().stats()
+
+
+def _stored_sessions() -> int:
+    stats = _session_store_stats()
+    return stats.get("stored", stats["sessions"])
+
+
+_metrics.gauge("amphoreus_active_sessions", "内存中的交互式会话数",
+               fn=lambda: _session_store_stats()["sessions"])
+_metrics.gauge("amphoreus_session_store_chars", "内存中会话的估算大小（记忆字符数与事件编码字节数）",
+               fn=lambda: _session_store_stats()["total_chars"])
+_metrics.gauge("amphoreus_session_store_stored_sessions", "会话存储中的会话数（SQLite 存储为数据库中的会话数）",
+               fn=_stored_sessions)
+_metrics.counter("amphoreus_sessions_removed_total", "因删除、淘汰或超时移除的会话数",
+                 fn=lambda: _session_store_stats()["removed"])
+_metrics.gauge("amphoreus_jobs", "各状态的后台任务数（queued 为模拟排队深度）", labels=("status",),
+               fn=lambda: {(status,): count for status, count in _jobs.counts().items()})
+_metrics.gauge("amphoreus_active_simulations", "正在运行的模拟数（/api/run_game 与未结束的后台任务）",
+               fn=lambda: _admission.active_simulations)
+_metrics.gauge("amphoreus_llm_calls", "模型调用的实时负载（waiting 为排队中，in_flight 为在途）", labels=("state",),
+               fn=lambda: {("waiting",): get_call_load().waiting, ("in_flight",): get_call_load().in_flight})
+_metrics.counter("amphoreus_admission_rejected_total", "准入控制拒绝（429）的请求数", labels=("reason",),
+                 fn=lambda: {(reason,): count for reason, count in _admission.stats()["rejected"].items()})
+
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Prometheus 文本格式的运行指标
+
+    HTTP 请求耗时、模型调用耗时与 token 用量（按提供商与场景）、重试与兜底解析次数、
+    会话数与会话存储大小、推送流订阅数、任务排队深度与模型调用排队深度
     """
-    session = ig.get_session(session_id)
-    return session._state_response()
+    return Response(_metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 if __name__ == "__main__":
@@ -2,16 +2,27 @@
  * gameApi.js - 交互式逐火之旅后端 API 封装
  *
  * 后端提供有状态 REST API，前端通过 session_id 推进游戏流程。
+ *
+ * 推进游戏的接口与状态查询都接受 since（前端已有的事件数），
+ * 此时响应中的 events 只包含新事件，events_since 标明这些事件的起始下标。
+ * 状态查询还支持 ETag：带上次的 ETag 查询且状态未变化时返回 null。
+ *
+ * 推进游戏的接口带上 background 时后端立即返回 202，事件与状态经 subscribe 打开的
+ * 推送流（SSE）逐条送达。
  */
 
 const API_BASE = '/api'
 
-async function request(url, options = {}) {
-  const res = await fetch(`${API_BASE}${url}`, {
-    headers: { 'Content-Type': 'application/json' },
-    ...options,
-  })
+function withQuery(url, params = {}) {
+  const query = new URLSearchParams()
+  for (const [key, value] of Object.entries(params)) {
+    if (value != null && value !== false) query.set(key, value)
+  }
+  const text = query.toString()
+  return text ? `${url}?${text}` : url
+}
 
+async function ensureOk(res) {
   if (!res.ok) {
     let detail = ''
     try {
@@ -21,7 +32,14 @@ async function request(url, options = {}) {
     }
     throw new Error(`[HTTP ${res.status}] ${detail || '请求失败'}`)
   }
+}
 
+async function request(url, options = {}) {
+  const res = await fetch(`${API_BASE}${url}`, {
+    headers: { 'Content-Type': 'application/json' },
+    ...options,
+  })
+  await ensureOk(res)
   return res.json()
 }
 
@@ -35,49 +53,80 @@ export const gameApi = {
   },
 
   /** 开始游戏：返回开场文案、神谕、可选角色 */
-  start(session_id) {
-    return request(`/game/${session_id}/start`, { method: 'POST' })
+  start(session_id, { since = null, background = false } = {}) {
+    return request(withQuery(`/game/${session_id}/start`, { since, background }), { method: 'POST' })
   },
 
-  /** 查询当前状态 */
-  getState(session_id) {
-    return request(`/game/${session_id}/state`)
+  /**
+   * 查询当前状态
+   *
+   * 返回 { state, etag }；传入上次的 etag 且状态未变化时返回 null。
+   */
+  async getState(session_id, { since = null, etag = null } = {}) {
+    const res = await fetch(`${API_BASE}${withQuery(`/game/${session_id}/state`, { since })}`, {
+      headers: etag ? { 'If-None-Match': etag } : {},
+    })
+    if (res.status === 304) return null
+    await ensureOk(res)
+    return { state: await res.json(), etag: res.headers.get('ETag') }
   },
 
   /** 玩家选择扮演角色 */
-  chooseCharacter(session_id, char_id) {
-    return request(`/game/${session_id}/choose`, {
+  chooseCharacter(session_id, char_id, { since = null, background = false } = {}) {
+    return request(withQuery(`/game/${session_id}/choose`, { since, background }), {
       method: 'POST',
       body: JSON.stringify({ char_id }),
     })
   },
 
   /** 提交逐火决策（含劝说后的二次决策） */
-  submitFireDecision(session_id, decision, reason = null) {
-    return request(`/game/${session_id}/fire_decision`, {
+  submitFireDecision(session_id, decision, reason = null, { since = null, background = false } = {}) {
+    return request(withQuery(`/game/${session_id}/fire_decision`, { since, background }), {
       method: 'POST',
       body: JSON.stringify({ decision, reason }),
     })
   },
 
   /** 提交交火种决策 */
-  submitHandoverDecision(session_id, decision, reason = null) {
-    return request(`/game/${session_id}/handover_decision`, {
+  submitHandoverDecision(session_id, decision, reason = null, { since = null, background = false } = {}) {
+    return request(withQuery(`/game/${session_id}/handover_decision`, { since, background }), {
       method: 'POST',
       body: JSON.stringify({ decision, reason }),
     })
   },
 
   /** 盗火行者劝说后，再次提交交火种决策 */
-  submitHandoverRedecision(session_id, decision, reason = null) {
-    return request(`/game/${session_id}/handover_redecision`, {
+  submitHandoverRedecision(session_id, decision, reason = null, { since = null, background = false } = {}) {
+    return request(withQuery(`/game/${session_id}/handover_redecision`, { since, background }), {
       method: 'POST',
       body: JSON.stringify({ decision, reason }),
     })
   },
 
   /** 回合结束继续下一轮 */
-  continueRound(session_id) {
-    return request(`/game/${session_id}/continue`, { method: 'POST' })
+  continueRound(session_id, { since = null, background = false } = {}) {
+    return request(withQuery(`/game/${session_id}/continue`, { since, background }), { method: 'POST' })
+  },
+
+  /** 结束并删除会话，释放后端资源 */
+  deleteSession(session_id) {
+    return request(`/game/${session_id}`, { method: 'DELETE' })
+  },
+
+  /**
+   * 订阅会话推送流，从第 since 个事件开始
+   *
+   * handlers: { onEvent(index, event), onState(state), onError(message) }
+   * 返回 EventSource，调用 close() 取消订阅；断线后浏览器会自动重连。
+   */
+  subscribe(session_id, since, { onEvent, onState, onError } = {}) {
+    const source = new EventSource(`${API_BASE}${withQuery(`/game/${session_id}/events`, { since })}`)
+    source.onmessage = (message) => {
+      const data = JSON.parse(message.data)
+      if (data.type === 'event') onEvent?.(data.index, data.event)
+      else if (data.type === 'state') onState?.(data.state)
+      else if (data.type === 'error') onError?.(data.message)
+    }
+    return source
   },
 }
@@ -3,9 +3,11 @@ import { gameApi } from '../api/gameApi.js'
 
 const STORAGE_KEY = 'amphoreus_session_id'
 const STREAM_INTERVAL = 180 // 每条事件 reveal 间隔（ms）
+const POLL_INTERVAL = 1500 // 请求进行中增量查询状态的间隔（ms）
 
 const defaultState = {
   session_id: null,
+  version: null,
   stage: 'config',
   round: 0,
   max_rounds: 1,
@@ -26,6 +28,9 @@ const reason = ref('')
 
 let streamTimer = null
 let streamedCount = 0
+let pollTimer = null
+let stateEtag = null
+let channel = null // 会话推送流（EventSource），不支持时退回请求 + 轮询
 
 /**
  * 从 JSON 字符串中提取 reason 字段，兼容 markdown 代码块。
@@ -87,31 +92,43 @@ function flushStreamQueue() {
 }
 
 function streamNewEvents() {
-  const pending = state.value.events.slice(streamedCount)
-  if (!pending.length) {
+  // 正在逐条展示时，新到的事件排在队尾继续展示
+  if (streamTimer) return
+  if (streamedCount >= state.value.events.length) {
     isStreaming.value = false
     return
   }
 
   isStreaming.value = true
-  let index = 0
 
   streamTimer = setInterval(() => {
-    if (index >= pending.length) {
+    if (streamedCount >= state.value.events.length) {
       clearInterval(streamTimer)
       streamTimer = null
-      streamedCount = state.value.events.length
       isStreaming.value = false
       return
     }
-    displayedEvents.value.push(pending[index])
-    index++
+    displayedEvents.value.push(state.value.events[streamedCount])
+    streamedCount++
     scrollToBottom()
   }, STREAM_INTERVAL)
 }
 
+/**
+ * 把增量响应拼接到已有事件之后（events_since 为这批事件的起始下标）
+ */
+function mergeEvents(newState) {
+  if (newState.events_since == null) return newState
+  const events = state.value.events.slice(0, newState.events_since).concat(newState.events)
+  return { ...newState, events }
+}
+
 function setState(newState, { immediate = false } = {}) {
-  Object.assign(state.value, newState)
+  // 丢弃比当前更旧的响应（例如在推进请求返回之后才到达的轮询结果）
+  if (newState.version != null && state.value.version != null && newState.version < state.value.version) {
+    return
+  }
+  Object.assign(state.value, mergeEvents(newState))
 
   // 持久化角色名映射（从可选角色列表中提取）
   if (newState.choices?.available_characters) {
@@ -131,14 +148,59 @@ function setState(newState, { immediate = false } = {}) {
   }
 }
 
+/**
+ * 推送流送来的状态快照（不含事件），busy 表示后台是否还有请求在执行
+ */
+function applyPushedState(pushed) {
+  const { busy, ...rest } = pushed
+  Object.assign(state.value, rest)
+  if (rest.choices?.available_characters) {
+    for (const ch of rest.choices.available_characters) {
+      charNames.value[ch.id] = ch.name
+    }
+  }
+  isLoading.value = busy
+  saveSession()
+}
+
+/**
+ * 推送流送来的单条事件；重连补发的重复事件按下标忽略
+ */
+function applyPushedEvent(index, event) {
+  if (index !== state.value.events.length) return
+  state.value.events.push(event)
+  streamNewEvents()
+}
+
+function openChannel() {
+  closeChannel()
+  if (typeof EventSource === 'undefined' || !state.value.session_id) return
+  channel = gameApi.subscribe(state.value.session_id, state.value.events.length, {
+    onEvent: applyPushedEvent,
+    onState: applyPushedState,
+    onError: (message) => {
+      error.value = message
+    },
+  })
+}
+
+function closeChannel() {
+  if (channel) {
+    channel.close()
+    channel = null
+  }
+}
+
 async function tryRestoreSession() {
   const session_id = localStorage.getItem(STORAGE_KEY)
   if (!session_id) return false
 
   isLoading.value = true
   try {
-    const newState = await gameApi.getState(session_id)
-    setState(newState, { immediate: true })
+    const result = await gameApi.getState(session_id)
+    stateEtag = result.etag
+    setState(result.state, { immediate: true })
+    openChannel()
     return true
   } catch (err) {
     clearSavedSession()
@@ -154,98 +216,122 @@ async function startGame(max_rounds) {
   error.value = null
   try {
     const created = await gameApi.createSession(max_rounds)
-    const started = await gameApi.start(created.session_id)
-    setState({ ...started, max_rounds })
+    Object.assign(state.value, { session_id: created.session_id, max_rounds })
+    saveSession()
   } catch (err) {
     error.value = err.message
-  } finally {
     isLoading.value = false
+    return
   }
+  openChannel()
+  await runAction((options) => gameApi.start(state.value.session_id, options))
 }
 
-async function chooseCharacter(char_id) {
-  isLoading.value = true
-  error.value = null
+/**
+ * 增量查询状态：只取新事件，状态未变化时服务端返回 304
+ */
+async function refreshState() {
+  if (!state.value.session_id) return
   try {
-    const newState = await gameApi.chooseCharacter(state.value.session_id, char_id)
-    setState(newState)
-  } catch (err) {
-    error.value = err.message
-  } finally {
-    isLoading.value = false
+    const result = await gameApi.getState(state.value.session_id, {
+      since: state.value.events.length,
+      etag: stateEtag,
+    })
+    if (!result) return
+    stateEtag = result.etag
+    setState(result.state)
+  } catch {
+    // 轮询失败不影响当前请求，等下一次轮询或请求返回
   }
 }
 
-async function submitFireDecision(decision) {
-  isLoading.value = true
-  error.value = null
-  try {
-    const newState = await gameApi.submitFireDecision(
-      state.value.session_id,
-      decision,
-      reason.value.trim() || null
-    )
-    reason.value = ''
-    setState(newState)
-  } catch (err) {
-    error.value = err.message
-  } finally {
-    isLoading.value = false
+function startPolling() {
+  stopPolling()
+  pollTimer = setInterval(refreshState, POLL_INTERVAL)
+}
+
+function stopPolling() {
+  if (pollTimer) {
+    clearInterval(pollTimer)
+    pollTimer = null
   }
 }
 
-async function submitHandoverDecision(decision) {
+/**
+ * 执行一个推进游戏的请求，成功（或已被后台接受）返回 true
+ *
+ * 已打开推送流时以 background 方式提交：后端立即返回 202，AI 的每个决策经推送流逐条到达，
+ * 后台执行结束（推送的 busy 变为 false）时才解除 loading。
+ * 否则等待请求完成，只取回前端尚未拿到的事件；请求进行期间定时增量查询，
+ * 先展示阶段中已经产生的事件。
+ */
+async function runAction(call) {
   isLoading.value = true
   error.value = null
+  if (channel) {
+    try {
+      await call({ background: true })
+      return true
+    } catch (err) {
+      error.value = err.message
+      isLoading.value = false
+      return false
+    }
+  }
+
+  startPolling()
   try {
-    const newState = await gameApi.submitHandoverDecision(
-      state.value.session_id,
-      decision,
-      reason.value.trim() || null
-    )
-    reason.value = ''
+    const newState = await call({ since: state.value.events.length })
     setState(newState)
+    return true
   } catch (err) {
     error.value = err.message
+    return false
   } finally {
+    stopPolling()
     isLoading.value = false
   }
 }
 
+async function chooseCharacter(char_id) {
+  await runAction((options) => gameApi.chooseCharacter(state.value.session_id, char_id, options))
+}
+
+async function submitFireDecision(decision) {
+  const ok = await runAction((options) =>
+    gameApi.submitFireDecision(state.value.session_id, decision, reason.value.trim() || null, options)
+  )
+  if (ok) reason.value = ''
+}
+
+async function submitHandoverDecision(decision) {
+  const ok = await runAction((options) =>
+    gameApi.submitHandoverDecision(state.value.session_id, decision, reason.value.trim() || null, options)
+  )
+  if (ok) reason.value = ''
+}
+
 async function submitHandoverRedecision(decision) {
-  isLoading.value = true
-  error.value = null
-  try {
-    const newState = await gameApi.submitHandoverRedecision(
-      state.value.session_id,
-      decision,
-      reason.value.trim() || null
-    )
-    reason.value = ''
-    setState(newState)
-  } catch (err) {
-    error.value = err.message
-  } finally {
-    isLoading.value = false
-  }
+  const ok = await runAction((options) =>
+    gameApi.submitHandoverRedecision(state.value.session_id, decision, reason.value.trim() || null, options)
+  )
+  if (ok) reason.value = ''
 }
 
 async function continueRound() {
-  isLoading.value = true
-  error.value = null
-  try {
-    const newState = await gameApi.continueRound(state.value.session_id)
-    setState(newState)
-  } catch (err) {
-    error.value = err.message
-  } finally {
-    isLoading.value = false
-  }
+  await runAction((options) => gameApi.continueRound(state.value.session_id, options))
 }
 
 function resetGame() {
+  // 通知后端释放会话；失败也无妨，会话会在空闲超时后自动移除
+  if (state.value.session_id) {
+    gameApi.deleteSession(state.value.session_id).catch(() => {})
+  }
+  closeChannel()
+  stopPolling()
   flushStreamQueue()
   clearSavedSession()
+  stateEtag = null
   state.value = { ...defaultState }
   displayedEvents.value = []
   charNames.value = {}
@@ -283,6 +369,7 @@ export function useGameSession() {
     decisionType,
     extractReason,
     tryRestoreSession,
+    refreshState,
     startGame,
     chooseCharacter,
     submitFireDecision,
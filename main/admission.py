@@ -0,0 +1,176 @@
+"""
+admission.py - 服务端准入控制与过载保护
+
+每次模拟（/api/run_game、后台任务）与交互式会话的每一步都会发出大量模型调用，
+不加限制时少数客户端就能发起成千上万个调用，让所有人都在提供商的限额后面排队。
+本模块在请求进入时按全局预算决定是否接受，超出预算时抛出 Overloaded（服务端返回 429 与 Retry-After）：
+
+    - 并发模型调用数：安装全局请求并发限制器，超出的调用在限制器前排队
+    - 模型调用排队深度：排队中的调用数达到上限时不再接受新的工作（依据 config.api_config.CallLoad 的实时负载）。
+      只有在限制器前等待的调用才计为排队，没有安装任何限制器时排队深度始终为 0，此项预算不起作用；
+      因此并发模型调用数默认有限（16），设为 0 关闭限制器时启动会给出警告
+    - 同时运行的模拟数：/api/run_game 推送流与未结束的后台任务合计
+    - 每个客户端未完成的模型调用数：单个客户端不能占满整个队列
+
+Retry-After 按当前排队深度与调用耗时的滑动平均估算，排队越深建议的等待越长。
+
+配置方式二选一：
+    - 环境变量 AMPHOREUS_MAX_LLM_CALLS（并发模型调用，默认 16）、AMPHOREUS_MAX_QUEUED_CALLS（默认 64）、
+      AMPHOREUS_MAX_SIMULATIONS（默认 8）、AMPHOREUS_MAX_CLIENT_CALLS（默认 16），0 表示不限制
+    - 代码中直接创建 AdmissionController(...)
+
+用法:
+    from admission import AdmissionController, Overloaded
+
+    admission = AdmissionController(max_simulations=4)
+    try:
+        lease = admission.admit_simulation(client)
+    except Overloaded as e:
+        ...  # 429，Retry-After: e.retry_after
+    ...
+    lease.release()
+"""
+
+import math
+import os
+import threading
+
+from config.api_config import get_call_load, get_request_limiter, set_request_limiter
+from run_stats import logger
+
+
+class Overloaded(Exception):
+    """超出准入预算，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class SimulationLease:
+    """一次模拟占用的名额；release 可重复调用，只释放一次"""
+
+    def __init__(self, controller: "AdmissionController", client: str):
+        self.controller = controller
+        self.client = client
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.controller._release_simulation()
+
+
+class AdmissionController:
+    """
+    全局准入预算（线程安全）
+
+    Args:
+        max_llm_calls: 并发模型调用数，None 表示不限制（install_call_limiter 时安装）
+        max_queued_calls: 排队中的模型调用数上限，达到时拒绝新的工作，None 表示不限制；
+                          需要有请求并发限制器（max_llm_calls 或外部安装的）才有调用排队
+        max_simulations: 同时运行的模拟数上限，None 表示不限制
+        max_client_calls: 每个客户端未完成（排队中与在途）的模型调用数上限，None 表示不限制
+        retry_after: 没有调用耗时数据时建议的重试等待秒数
+        max_retry_after: 建议等待的上限（秒）
+    """
+
+    def __init__(self, max_llm_calls: int = 16, max_queued_calls: int = 64, max_simulations: int = 8,
+                 max_client_calls: int = 16, retry_after: int = 5, max_retry_after: int = 120):
+        self.max_llm_calls = max_llm_calls
+        self.max_queued_calls = max_queued_calls
+        self.max_simulations = max_simulations
+        self.max_client_calls = max_client_calls
+        self.default_retry_after = retry_after
+        self.max_retry_after = max_retry_after
+        self.load = get_call_load()
+        self._lock = threading.Lock()
+        self.active_simulations = 0
+        self.rejected: dict = {}
+
+    def install_call_limiter(self):
+        """按 max_llm_calls 安装全局请求并发限制器（已有限制器时保留原有的）"""
+        if self.max_llm_calls and get_request_limiter() is None:
+            set_request_limiter(threading.BoundedSemaphore(self.max_llm_calls))
+        if self.max_queued_calls and get_request_limiter() is None:
+            logger.warning("未安装请求并发限制器，模型调用不会排队，排队深度上限（%d）不起作用；"
+                           "请设置 AMPHOREUS_MAX_LLM_CALLS", self.max_queued_calls)
+
+    def retry_after(self) -> int:
+        """按排队深度估算排到新调用所需的秒数"""
+        load = self.load.snapshot()
+        average = load["avg_seconds"] or self.default_retry_after
+        slots = self.max_llm_calls or max(load["in_flight"], 1)
+        seconds = average * (load["waiting"] / slots + 1)
+        return min(max(math.ceil(seconds), 1), self.max_retry_after)
+
+    def _reject(self, kind: str, reason: str):
+        with self._lock:
+            self.rejected[kind] = self.rejected.get(kind, 0) + 1
+        retry_after = self.retry_after()
+        logger.warning("拒绝请求（%s）: %s，建议 %d 秒后重试", kind, reason, retry_after)
+        raise Overloaded(reason, retry_after)
+
+    def check(self, client: str):
+        """检查模型调用队列与客户端的预算，超出时抛出 Overloaded"""
+        if self.max_queued_calls and self.load.waiting >= self.max_queued_calls:
+            self._reject("queue", f"模型调用排队已满（{self.load.waiting} 个）")
+        if self.max_client_calls and self.load.owner_calls(client) >= self.max_client_calls:
+            self._reject("client", f"客户端 {client} 未完成的模型调用过多")
+
+    def admit_simulation(self, client: str) -> SimulationLease:
+        """占用一个模拟名额；模拟结束时调用返回值的 release()"""
+        self.check(client)
+        with self._lock:
+            admitted = not self.max_simulations or self.active_simulations < self.max_simulations
+            if admitted:
+                self.active_simulations += 1
+        if not admitted:
+            self._reject("simulations", f"同时运行的模拟已达上限（{self.max_simulations} 个）")
+        return SimulationLease(self, client)
+
+    def _release_simulation(self):
+        with self._lock:
+            self.active_simulations -= 1
+
+    def stats(self) -> dict:
+        """当前负载与各类拒绝次数"""
+        with self._lock:
+            stats = {
+                "active_simulations": self.active_simulations,
+                "rejected": dict(self.rejected),
+            }
+        stats.update(self.load.snapshot())
+        return stats
+
+
+def admission_from_env(**kwargs) -> AdmissionController:
+    """按环境变量创建准入控制，其余参数原样传给 AdmissionController"""
+    def limit(name: str, default: int):
+        return int(os.getenv(name, str(default))) or None
+
+    return AdmissionController(
+        max_llm_calls=limit("AMPHOREUS_MAX_LLM_CALLS", 16),
+        max_queued_calls=limit("AMPHOREUS_MAX_QUEUED_CALLS", 64),
+        max_simulations=limit("AMPHOREUS_MAX_SIMULATIONS", 8),
+        max_client_calls=limit("AMPHOREUS_MAX_CLIENT_CALLS", 16),
+        **kwargs,
+    )
+
+
+if __name__ == "__main__":
+    # 最多 2 个模拟：第 3 个被拒绝，释放一个后重新接受
+    admission = AdmissionController(max_simulations=2)
+    leases = [admission.admit_simulation("127.0.0.1") for _ in range(2)]
+    try:
+        admission.admit_simulation("127.0.0.1")
+    except Overloaded as e:
+        print(f">>> 已拒绝: {e.reason}，Retry-After: {e.retry_after}")
+    leases[0].release()
+    leases[0].release()
+    admission.admit_simulation("127.0.0.1")
+    print(f">>> {admission.stats()}")
@@ -1,8 +1,12 @@
 import time
 
+import metrics
+import tracing
+
 # API 设定
 from config.api_config import SimpleAPIClient
 from prompt_manager import get_prompt_manager
+from memory import MemoryList, PersistentMemory
 
 
 '''
@@ -13,7 +17,8 @@ from prompt_manager import get_prompt_manager
 
 
 class Chrysos_Heir:
-    def __init__(self, char_id, client_provider="deepseek", client_model="deepseek-chat"):
+    def __init__(self, char_id, client_provider="deepseek", client_model="deepseek-chat",
+                 temperature=None, seed=None):
         """
         初始化黄金裔 Agent
 
@@ -21,9 +26,12 @@ class Chrysos_Heir:
             char_id: 角色唯一 ID，对应 prompts/characters/*.yaml 的文件名
             client_provider: API 提供商，默认 deepseek
             client_model: 模型名称，默认 deepseek-chat
+            temperature: 采样温度，默认使用客户端默认值
+            seed: 采样种子（提供商支持时生效），用于复现一次运行
         """
         self.char_id = char_id
-        self.client = SimpleAPIClient(provider=client_provider, model=client_model)
+        self.client = SimpleAPIClient(provider=client_provider, model=client_model,
+                                      temperature=temperature, seed=seed)
 
         # 从 PromptManager 加载角色配置
         pm = get_prompt_manager()
@@ -35,20 +43,50 @@ class Chrysos_Heir:
         self.profile = char_config["profile"]
         # 精神状态 0-5，越高越正常
         self.state = 5
-        # 黄金裔的记忆，初始值来自配置文件
-        self.memory = list(char_config.get("memory", []))
+        # 黄金裔的记忆，初始值来自配置文件；MemoryList 会增量统计字符数
+        self.memory = MemoryList(char_config.get("memory", []))
+
+    def _chat(self, method, question, system_prompt, scene=None):
+        """
+        调用模型并在超时时重试，整个过程记录为一个 agent_call span
+
+        Args:
+            method: 调用来源（answer / reflect / make_decision）
+            question: 发送给模型的问题
+            system_prompt: 系统提示词
+            scene: 场景名，默认取 ScenePrompt 携带的 scene
+        """
+        scene = scene or getattr(question, "scene", None)
+        with tracing.span(
+            "agent_call",
+            char_id=self.char_id,
+            method=method,
+            scene=scene,
+            prompt_chars=len(question) + len(system_prompt),
+            memory_entries=len(self.memory),
+        ) as span, metrics.use_scene(scene or method):
+            response = self.client.chat(question, system_prompt)
+
+            # 重试机制
+            retries = 0
+            while response == '请求超时，请稍后重试':
+                time.sleep(5)
+                retries += 1
+                metrics.record_retry()
+                response = self.client.chat(question, system_prompt)
+
+            span.set(retries=retries, response_chars=len(response))
+            return response
+
+    def close(self):
+        """释放模型客户端的连接（运行取消或角色不再使用时调用）"""
+        self.client.close()
 
     def answer(self, question):
         # 与黄金裔对话
         pm = get_prompt_manager()
         system_prompt = pm.get_system_prompt(self.char_id, memory=self.memory)
-        response = self.client.chat(question, system_prompt)
-
-        # 重试机制
-        while response == '请求超时，请稍后重试':
-            time.sleep(5)
-            response = self.client.chat(question, system_prompt)
-
+        response = self._chat("answer", question, system_prompt)
         self.memory.append(response)
         return response
 
@@ -67,13 +105,7 @@ class Chrysos_Heir:
             profile=self.profile,
             memory=self.memory,
         )
-        response = self.client.chat(question, system_prompt)
-
-        # 重试机制
-        while response == '请求超时，请稍后重试':
-            time.sleep(5)
-            response = self.client.chat(question, system_prompt)
-
+        response = self._chat("reflect", question, system_prompt)
         self.memory.append(response)
         return response
 
@@ -87,13 +119,8 @@ class Chrysos_Heir:
         decision_format = pm.get_decision_format()
 
         full_question = f"{question}\n\n{decision_format.format(name=self.name, path=self.path, drive=self.drive)}"
-        response = self.client.chat(full_question, system_prompt)
-
-        # 重试机制
-        while response == '请求超时，请稍后重试':
-            time.sleep(5)
-            response = self.client.chat(full_question, system_prompt)
-
+        response = self._chat("make_decision", full_question, system_prompt,
+                              scene=getattr(question, "scene", None))
         self.memory.append(response)
         return response
 
@@ -119,22 +146,33 @@ CHARACTER_NAMES = _build_character_names()
 '''
 
 
-def init_chrysos_heir():
-    """初始化所有黄金裔（不含盗火行者）"""
+def init_chrysos_heir(temperature=None, seed=None):
+    """初始化所有黄金裔（不含盗火行者），temperature / seed 传给每位角色的客户端"""
     pm = get_prompt_manager()
     heirs = {}
     for char_id in pm.get_all_character_ids():
         if char_id == "Black_NeiKo":
             continue
-        heirs[char_id] = Chrysos_Heir(char_id=char_id)
+        heirs[char_id] = Chrysos_Heir(char_id=char_id, temperature=temperature, seed=seed)
     return heirs
 
 
-def init_black_heir():
-    """初始化盗火行者"""
-    return {
-        "Black_NeiKo": Chrysos_Heir(char_id="Black_NeiKo")
+def init_black_heir(temperature=None, seed=None, memory_snapshots=None):
+    """
+    初始化盗火行者
+
+    盗火行者的记忆跨轮累积，使用可分支的 PersistentMemory；
+    传入 memory_snapshots（{char_id: MemorySnapshot}）时从快照派生记忆，与快照共享已有内容。
+    """
+    black_heirs = {
+        "Black_NeiKo": Chrysos_Heir(char_id="Black_NeiKo", temperature=temperature, seed=seed)
     }
+    for char_id, black_heir in black_heirs.items():
+        if memory_snapshots and char_id in memory_snapshots:
+            black_heir.memory = PersistentMemory(base=memory_snapshots[char_id])
+        else:
+            black_heir.memory = PersistentMemory(black_heir.memory)
+    return black_heirs
 
 
 if __name__ == "__main__":
@@ -0,0 +1,197 @@
+"""
+branching.py - 从某一轮的检查点分叉出多个世界分支
+
+做“如果当时没有人被强夺火种”这类假设分析时，需要让多个分支共享第 k 轮之前的全部历史，
+只重新运行之后的轮次。盗火行者的记忆是 PersistentMemory，检查点只保存记忆快照，
+分支从快照派生记忆时与检查点共享已有内容，不做深拷贝；
+因此探索 B 个分支的代价是 B × 剩余轮数，而不是 B × 全部轮数。
+
+用法:
+    from main import eternal_regression
+    from branching import Branch, no_robbery, run_branches
+
+    checkpoints = {}
+    eternal_regression(rounds=3, seed=1, checkpoints=checkpoints)
+
+    results = run_branches(checkpoints[2], [
+        Branch("原样继续"),
+        Branch("无人被强夺", intervene=no_robbery),
+        Branch("换一个种子", seed=7),
+    ], rounds=6)
+    print(results["无人被强夺"]['第6次永劫回归'])
+"""
+
+import random
+from functools import partial
+
+import agent
+import tracing
+from parallel import run_tasks
+from run_stats import logger
+
+
+class WorldCheckpoint:
+    """
+    一个世界在某轮结束时的状态
+
+    Attributes:
+        round_num: 已完成的轮数
+        memories: {盗火行者 ID: MemorySnapshot}
+        heir_states: {盗火行者 ID: 精神状态}
+        rng_state: 劝说目标选择所用随机数生成器的状态
+        logs: 截至本轮的日志字典（与 eternal_regression 的返回值格式相同）
+        seed / temperature: 该世界的采样参数，分支默认沿用
+    """
+
+    def __init__(self, round_num: int, memories: dict, heir_states: dict, rng_state, logs: dict,
+                 seed: int = None, temperature: float = None):
+        self.round_num = round_num
+        self.memories = memories
+        self.heir_states = heir_states
+        self.rng_state = rng_state
+        self.logs = logs
+        self.seed = seed
+        self.temperature = temperature
+
+    @classmethod
+    def capture(cls, round_num: int, black_heirs: dict, rng: random.Random, logs: dict,
+                seed: int = None, temperature: float = None) -> "WorldCheckpoint":
+        """在一轮结束时记录检查点（记忆只冻结本轮新增的部分）"""
+        return cls(
+            round_num=round_num,
+            memories={char_id: heir.memory.snapshot() for char_id, heir in black_heirs.items()},
+            heir_states={char_id: heir.state for char_id, heir in black_heirs.items()},
+            rng_state=rng.getstate(),
+            logs=dict(logs),
+            seed=seed,
+            temperature=temperature,
+        )
+
+    def restore_black_heirs(self, temperature: float = None, seed: int = None) -> dict:
+        """新建盗火行者，记忆从检查点的快照派生"""
+        black_heirs = agent.init_black_heir(temperature=temperature, seed=seed, memory_snapshots=self.memories)
+        for char_id, state in self.heir_states.items():
+            if char_id in black_heirs:
+                black_heirs[char_id].state = state
+        return black_heirs
+
+    def restore_rng(self) -> random.Random:
+        rng = random.Random()
+        rng.setstate(self.rng_state)
+        return rng
+
+    def fork(self, intervene=None) -> "WorldCheckpoint":
+        """
+        派生一个新检查点，可选地在派生前施加干预
+
+        Args:
+            intervene: 可选的 intervene(black_heirs, logs)，可以改写盗火行者的记忆与日志；
+                       改写已有记忆只复制受影响的片段
+        """
+        if intervene is None:
+            return self
+        black_heirs = self.restore_black_heirs(temperature=self.temperature, seed=self.seed)
+        logs = dict(self.logs)
+        intervene(black_heirs, logs)
+        return WorldCheckpoint.capture(self.round_num, black_heirs, self.restore_rng(), logs,
+                                       seed=self.seed, temperature=self.temperature)
+
+
+def no_robbery(black_heirs: dict, logs: dict):
+    """
+    干预：假设检查点所在的那一轮无人被强夺火种
+
+    被强夺者改记为“逐火_不交出火种”，盗火行者关于强夺的最后一条记忆改写为无人被强夺。
+    被强夺者在该轮已并入盗火行者的记忆不做回退。
+    """
+    last_key = list(logs)[-1]
+    final_result, _ = logs[last_key]
+    logs[last_key] = (
+        {char_id: '逐火_不交出火种' if status == '逐火_火种被强夺' else status
+         for char_id, status in final_result.items()},
+        [],
+    )
+    for black_heir in black_heirs.values():
+        black_heir.memory[-1] = "被强夺火种的角色：[]，这些角色因被强夺火种受伤甚至死亡"
+
+
+class Branch:
+    """
+    一个分支的设定
+
+    Args:
+        name: 分支名，作为结果字典的键
+        intervene: 分叉时施加的干预 intervene(black_heirs, logs)
+        seed / temperature: 覆盖检查点的采样参数；seed 改变时劝说目标的随机序列也随之重置
+        max_persuasion_attempts: 覆盖每轮最大劝说次数
+    """
+
+    def __init__(self, name: str, intervene=None, seed: int = None, temperature: float = None,
+                 max_persuasion_attempts: int = None):
+        self.name = name
+        self.intervene = intervene
+        self.seed = seed
+        self.temperature = temperature
+        self.max_persuasion_attempts = max_persuasion_attempts
+
+
+def run_branches(checkpoint: WorldCheckpoint, branches: list, rounds: int, max_persuasion_attempts: int = 3,
+                 max_workers: int = None, headless: bool = True, **kwargs) -> dict:
+    """
+    从检查点并发运行多个分支，每个分支继续运行到第 rounds 轮
+
+    Args:
+        checkpoint: 分叉点
+        branches: Branch 列表
+        rounds: 分支运行到的总轮数（含检查点之前的轮次）
+        max_persuasion_attempts: 默认的每轮最大劝说次数
+        max_workers: 同时运行的分支数，默认全部同时运行
+        headless: 分支默认以无界面模式运行，避免多个分支的输出交错
+        **kwargs: 其余参数原样传给 eternal_regression（如 scheduler、max_workers）
+
+    Returns:
+        dict: {分支名: 日志字典}，日志包含检查点之前的轮次
+    """
+    from main import eternal_regression
+
+    names = [branch.name for branch in branches]
+    if len(set(names)) != len(names):
+        raise ValueError(f"分支名不能重复: {names}")
+
+    run_span = tracing.start_span("branches", round_num=checkpoint.round_num, branches=len(branches),
+                                  rounds=rounds)
+
+    def _run(branch):
+        logger.info("分支 %s 从第 %d 轮开始运行", branch.name, checkpoint.round_num + 1)
+        with tracing.use_span(run_span):
+            return eternal_regression(
+                rounds=rounds,
+                max_persuasion_attempts=branch.max_persuasion_attempts or max_persuasion_attempts,
+                headless=headless,
+                seed=branch.seed,
+                temperature=branch.temperature,
+                start=checkpoint.fork(branch.intervene),
+                **kwargs,
+            )
+
+    try:
+        results = run_tasks([partial(_run, branch) for branch in branches],
+                            max_workers=max_workers or len(branches))
+    finally:
+        run_span.end()
+    return dict(zip(names, results))
+
+
+if __name__ == "__main__":
+    from main import eternal_regression
+
+    checkpoints = {}
+    eternal_regression(rounds=2, seed=1, headless=True, checkpoints=checkpoints)
+    results = run_branches(checkpoints[2], [
+        Branch("原样继续"),
+        Branch("无人被强夺", intervene=no_robbery),
+    ], rounds=4)
+    for name, logs in results.items():
+        print(f">>> 分支 {name}:")
+        for round_key, (final_result, robbed_list) in logs.items():
+            print(f"   {round_key}: 被强夺 {robbed_list if robbed_list else '无'}")
@@ -0,0 +1,67 @@
+"""
+cancellation.py - 运行的取消令牌
+
+服务端推送流的客户端断开后，模拟不应该继续花钱调用模型。CancelToken 由发起方创建，
+通过 contextvars 放入当前上下文；上下文会随 asyncio.to_thread、tracing.wrap_context
+传入工作线程，因此 SimpleAPIClient 在每次发请求前后都能检查到令牌，
+令牌取消后尚未开始的调用立即抛出 Cancelled，已在途的调用结果被丢弃。
+
+用法:
+    from cancellation import CancelToken, use_token, Cancelled
+
+    token = CancelToken()
+    with use_token(token):
+        ...                      # 其中（及其派生线程中）的模型调用都受 token 控制
+    token.cancel()               # 在任意线程中取消
+"""
+
+import contextvars
+import threading
+from contextlib import contextmanager
+
+
+class Cancelled(Exception):
+    """运行已被取消"""
+
+
+class CancelToken:
+    """线程安全的取消标记"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled("运行已被取消")
+
+
+_current_token = contextvars.ContextVar("amphoreus_cancel_token", default=None)
+
+
+def current_token():
+    """当前上下文中的取消令牌（可能为 None）"""
+    return _current_token.get()
+
+
+@contextmanager
+def use_token(token: CancelToken):
+    """在 with 块内把 token 设为当前取消令牌"""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def check_cancelled():
+    """当前上下文的令牌已取消时抛出 Cancelled"""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
@@ -0,0 +1,110 @@
+"""
+completion_cache.py - 模型回复的录制与回放
+
+同一个随机种子只能固定劝说目标等本地随机性，模型回复本身仍然不可复现。
+本模块把每次请求的回复按 (提供商, 模型, 采样参数, 系统提示词, 问题) 记录到
+JSON Lines 文件，之后以回放模式运行即可逐字复现整局，用于对比性能改动前后的耗时。
+
+同一请求在一次运行中可能出现多次（例如相同的兜底解析文本），
+因此键中还包含该请求的出现序号，回放时按出现顺序取回对应的回复。
+
+模式：
+    - off：不使用缓存（默认）
+    - record：每次都请求模型，并把回复追加写入缓存文件
+    - replay：命中缓存直接返回，未命中时请求模型并写入缓存
+
+开启方式二选一：
+    - 环境变量 AMPHOREUS_COMPLETION_CACHE=completions.jsonl
+      以及 AMPHOREUS_COMPLETION_CACHE_MODE=record / replay（默认 replay）
+    - 代码中调用 completion_cache.configure("completions.jsonl", mode="record")
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+
+MODES = ("off", "record", "replay")
+
+
+def make_key(provider: str, model: str, temperature, seed, system_prompt, content) -> str:
+    """请求内容的摘要（不含出现序号）"""
+    raw = json.dumps([provider, model, temperature, seed, system_prompt or "", content],
+                     ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """按请求摘要与出现序号保存模型回复"""
+
+    def __init__(self, path=None, mode: str = "replay"):
+        if mode not in MODES:
+            raise ValueError(f"mode 必须是 {MODES} 之一，当前为: {mode}")
+        self.path = path
+        self.mode = mode if path else "off"
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._seen = {}
+        if self.mode == "replay" and os.path.exists(path):
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self._entries[(record["key"], record["n"])] = record["response"]
+
+    def next_slot(self, key: str) -> tuple:
+        """为本次请求分配 (摘要, 出现序号)"""
+        with self._lock:
+            n = self._seen.get(key, 0)
+            self._seen[key] = n + 1
+            return key, n
+
+    def get(self, slot: tuple):
+        """回放模式下取回已录制的回复，未命中返回 None"""
+        if self.mode != "replay":
+            return None
+        with self._lock:
+            return self._entries.get(slot)
+
+    def put(self, slot: tuple, response: str):
+        """写入一次成功请求的回复"""
+        if not self.enabled:
+            return
+        key, n = slot
+        line = json.dumps({"key": key, "n": n, "response": response}, ensure_ascii=False)
+        with self._lock:
+            self._entries[slot] = response
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+_cache = CompletionCache(
+    os.getenv("AMPHOREUS_COMPLETION_CACHE") or None,
+    mode=os.getenv("AMPHOREUS_COMPLETION_CACHE_MODE", "replay"),
+)
+
+
+def get_completion_cache() -> CompletionCache:
+    """获取全局缓存"""
+    return _cache
+
+
+def configure(path=None, mode: str = "replay") -> CompletionCache:
+    """
+    重新配置全局缓存（同时清空出现序号，相当于开始新的一次运行）
+
+    Args:
+        path: 缓存文件路径，None 表示关闭
+        mode: "record" 或 "replay"
+    """
+    global _cache
+    _cache = CompletionCache(path, mode=mode)
+    return _cache
@@ -1,31 +1,187 @@
+import contextvars
 import requests
 import json
 import os
+import threading
 from typing import List, Dict, Union, Optional
+from contextlib import contextmanager, nullcontext
 from dotenv import load_dotenv
 import time
 
+try:
+    from tracing import span as trace_span
+    from run_stats import record_llm_usage
+    from completion_cache import get_completion_cache, make_key
+    from cancellation import check_cancelled
+    from metrics import record_llm_call
+except ImportError:
+    # 直接运行本文件时 main/ 不在模块搜索路径中，此时不做追踪、计数、指标、缓存与取消检查
+    def record_llm_usage(usage):
+        pass
+
+    def record_llm_call(provider, seconds, usage, ok):
+        pass
+
+    def check_cancelled():
+        pass
+
+    def get_completion_cache():
+        return None
+
+    class _NullSpan:
+        def set(self, **attrs):
+            return self
+
+    @contextmanager
+    def trace_span(name, parent=None, **attrs):
+        yield _NullSpan()
+
 # 加载项目根目录下的.env文件
 load_dotenv(override=True)
 
+# 请求并发限制器：任何支持 with 语句的锁或信号量，None 表示不限制。
+# 多进程运行（monte_carlo）时由父进程创建一个跨进程共享的信号量，
+# 各子进程通过 set_request_limiter 安装，使所有进程合计的在途请求数不超过提供商的限额。
+_request_limiter = None
+
+
+def set_request_limiter(limiter):
+    """安装全局请求并发限制器（传入 None 取消限制）"""
+    global _request_limiter
+    _request_limiter = limiter
+
+
+def get_request_limiter():
+    """当前的请求并发限制器"""
+    return _request_limiter
+
+
+# 只作用于当前上下文的附加限制器，与全局限制器同时生效。
+# 例如后台任务队列让批量运行最多占用提供商并发的一部分，为交互式玩家留出余量；
+# 上下文随 tracing.wrap_context / asyncio.to_thread 传入工作线程。
+_scoped_limiter = contextvars.ContextVar("amphoreus_request_limiter", default=None)
+
+
+@contextmanager
+def use_request_limiter(limiter):
+    """在 with 块内为模型调用附加一个并发限制器（None 表示不附加）"""
+    reset = _scoped_limiter.set(limiter)
+    try:
+        yield limiter
+    finally:
+        _scoped_limiter.reset(reset)
+
+
+class CallLoad:
+    """
+    模型调用的实时负载（线程安全）
+
+    每次调用在等待并发限额期间计为 waiting（排队），拿到限额后计为 in_flight（在途）；
+    按调用方（use_call_owner 设置的标签，例如客户端地址）统计未完成的调用数，
+    并记录调用耗时的滑动平均。服务端的准入控制据此决定是否接受新的模拟。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.avg_seconds = None
+        self._by_owner: Dict[str, int] = {}
+
+    @contextmanager
+    def track(self, owner: Optional[str] = None):
+        """统计 with 块内的一次调用；拿到并发限额时调用 yield 出的 started()"""
+        state = {"start": None}
+
+        def started():
+            with self._lock:
+                self.waiting -= 1
+                self.in_flight += 1
+            state["start"] = time.time()
+
+        with self._lock:
+            self.waiting += 1
+            if owner is not None:
+                self._by_owner[owner] = self._by_owner.get(owner, 0) + 1
+        try:
+            yield started
+        finally:
+            with self._lock:
+                if state["start"] is None:
+                    self.waiting -= 1
+                else:
+                    self.in_flight -= 1
+                    elapsed = time.time() - state["start"]
+                    self.avg_seconds = elapsed if self.avg_seconds is None else 0.9 * self.avg_seconds + 0.1 * elapsed
+                if owner is not None:
+                    self._by_owner[owner] -= 1
+                    if not self._by_owner[owner]:
+                        del self._by_owner[owner]
+
+    def owner_calls(self, owner: str) -> int:
+        """调用方未完成（排队中与在途）的调用数"""
+        with self._lock:
+            return self._by_owner.get(owner, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "waiting": self.waiting,
+                "in_flight": self.in_flight,
+                "avg_seconds": self.avg_seconds,
+                "owners": len(self._by_owner),
+            }
+
+
+_call_load = CallLoad()
+_call_owner = contextvars.ContextVar("amphoreus_call_owner", default=None)
+
+
+def get_call_load() -> CallLoad:
+    """本进程模型调用的实时负载"""
+    return _call_load
+
+
+@contextmanager
+def use_call_owner(owner: Optional[str]):
+    """在 with 块内把模型调用计入调用方 owner（随上下文传入工作线程）"""
+    reset = _call_owner.set(owner)
+    try:
+        yield owner
+    finally:
+        _call_owner.reset(reset)
+
+
 class SimpleAPIClient:
     """
     简化的API客户端，支持intern、deepseek、minimax
     支持模型名称和API key作为参数传入
     """
+
+    # 接受 OpenAI 兼容 seed 参数的提供商（服务端尽力保证同一 seed 的输出一致）
+    SEED_PROVIDERS = ("deepseek", "intern")
     
-    def __init__(self, provider: str, api_key: str = None, model: str = None):
+    def __init__(self, provider: str, api_key: str = None, model: str = None,
+                 temperature: float = None, seed: int = None):
         """
         初始化API客户端
         Args:
             provider: API提供商 ("intern", "deepseek", "minimax")
             api_key: API密钥，如果不提供则从环境变量获取
             model: 模型名称，如果不提供则使用默认模型
+            temperature: 默认温度，不提供时为 0.7
+            seed: 采样种子，仅对 SEED_PROVIDERS 中的提供商生效
         """
         self.provider = provider.lower()
         self.api_key = api_key or self._get_api_key_from_env()
         self.model = model
-        self.response_time = 0  # 记录响应时间
+        # 最近一次请求的结果按线程保存：同一个客户端会被多个线程共用（如引擎的兜底解析客户端），
+        # 每个线程只读到自己发出的那次请求的响应时间、token 用量与是否成功
+        self._last = threading.local()
+        self.temperature = 0.7 if temperature is None else temperature
+        self.seed = seed
+        # 复用连接；运行被取消或角色被释放时通过 close() 关闭
+        self.session = requests.Session()
         
         # 验证提供商
         if self.provider not in ["intern", "deepseek", "minimax"]:
@@ -73,7 +229,7 @@ class SimpleAPIClient:
     def chat(self, 
              content: str, 
              system_prompt: str = None,
-             temperature: float = 0.7,
+             temperature: float = None,
              max_tokens: int = 1000,
              stream: bool = False) -> str:
         """
@@ -81,12 +237,54 @@ class SimpleAPIClient:
         Args:
             content: 用户消息内容
             system_prompt: 系统提示词
-            temperature: 温度参数
+            temperature: 温度参数，默认使用客户端的 temperature
             max_tokens: 最大token数
             stream: 是否流式响应
         Returns:
             str: 模型回复
         """
+        # 所在的运行已被取消时不再发出请求
+        check_cancelled()
+
+        if temperature is None:
+            temperature = self.temperature
+        body = self._chat_body(content, system_prompt, temperature, max_tokens, stream)
+
+        prompt_chars = len(content) + len(system_prompt or "")
+        with trace_span("http_request", provider=self.provider, model=self.model,
+                        prompt_chars=prompt_chars) as span:
+            # 录制/回放：命中时不发请求，直接返回录制的回复
+            cache = get_completion_cache()
+            slot = None
+            if cache is not None and cache.enabled:
+                slot = cache.next_slot(make_key(self.provider, self.model, temperature, self.seed,
+                                                system_prompt, content))
+                cached = cache.get(slot)
+                if cached is not None:
+                    self.response_time = 0
+                    self.last_usage = {}
+                    self.last_ok = True
+                    span.set(cache_hit=True, response_chars=len(cached))
+                    return cached
+
+            # 等待并发限额（未安装限制器时不等待），等待与请求期间计入实时负载
+            wait_start = time.time()
+            with _call_load.track(_call_owner.get()) as started, \
+                    _scoped_limiter.get() or nullcontext(), _request_limiter or nullcontext():
+                started()
+                span.set(limiter_wait=time.time() - wait_start)
+                response = self._post_chat(body, span)
+            record_llm_call(self.provider, self.response_time, self.last_usage, self.last_ok)
+            # 请求期间运行被取消：丢弃结果，不写入缓存
+            check_cancelled()
+            if slot is not None and self.last_ok:
+                cache.put(slot, response)
+            span.set(cache_hit=False, response_chars=len(response), response_time=self.response_time)
+            return response
+
+    def _chat_body(self, content: str, system_prompt: Optional[str], temperature: float, max_tokens: int,
+                   stream: bool) -> dict:
+        """构建聊天请求体（chat 与 chat_stream 共用）"""
         # 构建消息列表
         messages = []
         
@@ -105,6 +303,8 @@ class SimpleAPIClient:
             "max_tokens": max_tokens,
             "stream": stream
         }
+        if self.seed is not None and self.provider in self.SEED_PROVIDERS:
+            body["seed"] = self.seed
         
         # 提供商特定的参数调整
         if self.provider == "minimax":
@@ -114,13 +314,18 @@ class SimpleAPIClient:
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": content}
                 ]
-        
+        return body
+
+    def _post_chat(self, body: dict, span) -> str:
+        """发送非流式聊天请求，把状态码与 token 用量记录到 span"""
         # 开始计时
         start_time = time.time()
+        self.last_usage = {}
+        self.last_ok = False
         
         try:
             # 发送请求
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/chat/completions",
                 headers=self.get_headers(),
                 json=body,
@@ -129,9 +334,18 @@ class SimpleAPIClient:
             
             # 计算响应时间
             self.response_time = time.time() - start_time
+            span.set(status=response.status_code)
             
             if response.status_code == 200:
                 result = response.json()
+                self.last_usage = result.get('usage') or {}
+                span.set(
+                    prompt_tokens=self.last_usage.get('prompt_tokens'),
+                    completion_tokens=self.last_usage.get('completion_tokens'),
+                    total_tokens=self.last_usage.get('total_tokens'),
+                )
+                record_llm_usage(self.last_usage)
+                self.last_ok = True
                 return result['choices'][0]['message']['content']
             else:
                 error_msg = f"API调用失败 (HTTP {response.status_code})"
@@ -145,87 +359,155 @@ class SimpleAPIClient:
                 
         except requests.exceptions.Timeout:
             self.response_time = time.time() - start_time
+            span.set(error="timeout")
             return "请求超时，请稍后重试"
         except requests.exceptions.RequestException as e:
             self.response_time = time.time() - start_time
+            span.set(error=str(e))
             return f"网络请求错误: {str(e)}"
         except Exception as e:
             self.response_time = time.time() - start_time
+            span.set(error=str(e))
             return f"发生未知错误: {str(e)}"
     
+    @property
+    def response_time(self) -> float:
+        """当前线程最近一次请求的响应时间（秒）"""
+        return getattr(self._last, "response_time", 0)
+
+    @response_time.setter
+    def response_time(self, value: float):
+        self._last.response_time = value
+
+    @property
+    def last_usage(self) -> dict:
+        """当前线程最近一次请求的 token 用量"""
+        return getattr(self._last, "usage", {})
+
+    @last_usage.setter
+    def last_usage(self, value: dict):
+        self._last.usage = value
+
+    @property
+    def last_ok(self) -> bool:
+        """当前线程最近一次请求是否成功拿到回复"""
+        return getattr(self._last, "ok", False)
+
+    @last_ok.setter
+    def last_ok(self, value: bool):
+        self._last.ok = value
+
     def get_response_time(self) -> float:
-        """获取最后一次请求的响应时间（秒）"""
+        """获取当前线程最后一次请求的响应时间（秒）"""
         return self.response_time
+
+    def close(self):
+        """关闭 HTTP 会话，释放连接池中的连接"""
+        self.session.close()
     
     def chat_stream(self, 
                    content: str, 
                    system_prompt: str = None,
-                   temperature: float = 0.7,
+                   temperature: float = None,
                    max_tokens: int = 1000):
         """
         流式聊天请求
+
+        与 chat 走同一条路径：复用 HTTP 会话、带 seed、计入并发限制器与实时负载、
+        记录追踪 span 与模型调用指标，运行被取消时不再发出请求或继续读取。
+        流式回复不经过录制/回放缓存。限额在整个流期间占用，消费方提前关闭生成器时释放。
+
         Args:
             content: 用户消息内容
             system_prompt: 系统提示词
-            temperature: 温度参数
+            temperature: 温度参数，默认使用客户端的 temperature
             max_tokens: 最大token数
         Yields:
             str: 流式响应片段
         """
-        # 构建消息列表
-        messages = []
-        
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        
-        messages.append({"role": "user", "content": content})
-        
-        # 准备请求体
-        body = {
-            "model": self.model,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-            "stream": True
-        }
-        
+        check_cancelled()
+
+        if temperature is None:
+            temperature = self.temperature
+        body = self._chat_body(content, system_prompt, temperature, max_tokens, stream=True)
+
+        prompt_chars = len(content) + len(system_prompt or "")
+        with trace_span("http_request", provider=self.provider, model=self.model,
+                        prompt_chars=prompt_chars, stream=True) as span:
+            wait_start = time.time()
+            with _call_load.track(_call_owner.get()) as started, \
+                    _scoped_limiter.get() or nullcontext(), _request_limiter or nullcontext():
+                started()
+                span.set(limiter_wait=time.time() - wait_start)
+                response_chars = 0
+                chunks = self._post_chat_stream(body, span)
+                try:
+                    for chunk in chunks:
+                        response_chars += len(chunk)
+                        yield chunk
+                        check_cancelled()
+                finally:
+                    # 先关闭响应（取消或提前关闭时）并得到总耗时，再记录指标
+                    chunks.close()
+                    record_llm_call(self.provider, self.response_time, self.last_usage, self.last_ok)
+                    span.set(response_chars=response_chars, response_time=self.response_time)
+
+    def _post_chat_stream(self, body: dict, span):
+        """发送流式聊天请求，逐个产出内容片段；状态码与 token 用量（提供商在流中返回时）记录到 span"""
         # 开始计时
         start_time = time.time()
-        
+        self.response_time = 0
+        self.last_usage = {}
+        self.last_ok = False
+
         try:
-            response = requests.post(
+            with self.session.post(
                 f"{self.base_url}/chat/completions",
                 headers=self.get_headers(),
                 json=body,
                 stream=True,
                 timeout=60
-            )
-            
-            if response.status_code == 200:
+            ) as response:
+                span.set(status=response.status_code)
+                if response.status_code != 200:
+                    yield f"API调用失败 (HTTP {response.status_code}): {response.text}"
+                    return
+
                 for line in response.iter_lines():
-                    if line:
-                        line = line.decode('utf-8')
-                        if line.startswith('data: '):
-                            data = line[6:]  # 移除 'data: ' 前缀
-                            if data == '[DONE]':
-                                # 计算总响应时间
-                                self.response_time = time.time() - start_time
-                                break
-                            try:
-                                json_data = json.loads(data)
-                                if 'choices' in json_data and len(json_data['choices']) > 0:
-                                    delta = json_data['choices'][0].get('delta', {})
-                                    if 'content' in delta:
-                                        yield delta['content']
-                            except json.JSONDecodeError:
-                                continue
-            else:
-                self.response_time = time.time() - start_time
-                yield f"API调用失败 (HTTP {response.status_code}): {response.text}"
-                
+                    if not line:
+                        continue
+                    line = line.decode('utf-8')
+                    if not line.startswith('data: '):
+                        continue
+                    data = line[6:]  # 移除 'data: ' 前缀
+                    if data == '[DONE]':
+                        break
+                    try:
+                        json_data = json.loads(data)
+                    except json.JSONDecodeError:
+                        continue
+                    if json_data.get('usage'):
+                        self.last_usage = json_data['usage']
+                    if 'choices' in json_data and len(json_data['choices']) > 0:
+                        delta = json_data['choices'][0].get('delta', {})
+                        if delta.get('content'):
+                            yield delta['content']
+
+                self.last_ok = True
+                if self.last_usage:
+                    span.set(
+                        prompt_tokens=self.last_usage.get('prompt_tokens'),
+                        completion_tokens=self.last_usage.get('completion_tokens'),
+                        total_tokens=self.last_usage.get('total_tokens'),
+                    )
+                    record_llm_usage(self.last_usage)
+
         except Exception as e:
-            self.response_time = time.time() - start_time
+            span.set(error=str(e))
             yield f"流式请求错误: {str(e)}"
+        finally:
+            # 计算总响应时间
+            self.response_time = time.time() - start_time
 
 
 class APIManager:
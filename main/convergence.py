@@ -0,0 +1,121 @@
+"""
+convergence.py - 永劫回归的收敛判定
+
+长时间的探索性运行中，各角色的结局分布往往在若干轮后就不再变化，
+继续运行只会消耗调用次数。ConvergenceMonitor 在每轮结束时记录各角色的最终状态，
+比较“最近 window 轮”与“之前 window 轮”的结局分布，用 Jensen-Shannon 散度
+（以 2 为底，取值 0~1，对所有角色取平均）衡量变化；散度连续 patience 轮低于阈值即判定收敛。
+
+用法:
+    from convergence import ConvergenceMonitor
+
+    monitor = ConvergenceMonitor(window=3, threshold=0.05, patience=2)
+    logs = eternal_regression(rounds=50, stop_rule=monitor)
+    print(monitor.report())
+"""
+
+import math
+from collections import Counter, deque
+
+
+def js_divergence(p: Counter, q: Counter) -> float:
+    """两个计数分布之间的 Jensen-Shannon 散度（以 2 为底，0 表示完全相同）"""
+    p_total = sum(p.values())
+    q_total = sum(q.values())
+    if not p_total or not q_total:
+        return 0.0
+
+    divergence = 0.0
+    for key in set(p) | set(q):
+        pi = p[key] / p_total
+        qi = q[key] / q_total
+        mi = (pi + qi) / 2
+        if pi:
+            divergence += 0.5 * pi * math.log2(pi / mi)
+        if qi:
+            divergence += 0.5 * qi * math.log2(qi / mi)
+    return divergence
+
+
+class ConvergenceMonitor:
+    """
+    基于结局分布散度的提前停止规则
+
+    Args:
+        window: 比较窗口的轮数，至少需要 2 * window 轮才开始判定
+        threshold: 散度阈值，低于该值视为本轮无明显变化
+        patience: 连续多少轮低于阈值才停止
+    """
+
+    def __init__(self, window: int = 3, threshold: float = 0.05, patience: int = 2):
+        if window < 1 or patience < 1:
+            raise ValueError("window 与 patience 必须大于等于 1")
+        self.window = window
+        self.threshold = threshold
+        self.patience = patience
+
+        # 最近 2 * window 轮的结果
+        self._history = deque(maxlen=2 * window)
+        self.rounds = 0
+        self.divergences = []
+        self._calm_rounds = 0
+        self.converged = False
+        self.stopped_round = None
+        self.reason = ""
+
+    def _window_counts(self, results) -> dict:
+        counts = {}
+        for final_result in results:
+            for char_id, status in final_result.items():
+                counts.setdefault(char_id, Counter())[status] += 1
+        return counts
+
+    def divergence(self) -> float:
+        """最近 window 轮与之前 window 轮的平均 JS 散度；轮数不足时返回 None"""
+        if len(self._history) < 2 * self.window:
+            return None
+        history = list(self._history)
+        previous = self._window_counts(history[:self.window])
+        recent = self._window_counts(history[self.window:])
+        chars = set(previous) | set(recent)
+        if not chars:
+            return 0.0
+        return sum(js_divergence(previous.get(c, Counter()), recent.get(c, Counter())) for c in chars) / len(chars)
+
+    def update(self, final_result: dict) -> bool:
+        """
+        记录一轮的最终结果
+
+        Returns:
+            bool: 是否已收敛、应当停止
+        """
+        self.rounds += 1
+        self._history.append(dict(final_result))
+
+        value = self.divergence()
+        self.divergences.append(value)
+        if value is None:
+            return False
+
+        self._calm_rounds = self._calm_rounds + 1 if value < self.threshold else 0
+        if self._calm_rounds >= self.patience:
+            self.converged = True
+            self.stopped_round = self.rounds
+            self.reason = (f"连续 {self.patience} 轮结局分布的 JS 散度低于 {self.threshold}"
+                           f"（窗口 {self.window} 轮，最后一次 {value:.4f}）")
+        return self.converged
+
+    def finish(self, rounds_run: int):
+        """运行结束时调用：未收敛则记录为达到最大轮数"""
+        if not self.converged:
+            self.stopped_round = rounds_run
+            self.reason = f"达到最大轮数 {rounds_run}，未满足收敛条件"
+
+    def report(self) -> dict:
+        """停止原因与散度轨迹"""
+        return {
+            '是否收敛': self.converged,
+            '停止轮次': self.stopped_round,
+            '停止原因': self.reason,
+            '散度': self.divergences,
+        }
@@ -0,0 +1,188 @@
+"""
+decision_parser.py - 决策回复解析器
+
+黄金裔的决策回复要求是 {"decision": "0/1", "reason": "..."} 形式的 JSON，
+但模型实际输出常见以下变体：
+    - 包在 ```json ... ``` 代码块中，前后可能带有说明文字
+    - 使用单引号或 Python 字面量（True/False、单引号字符串）
+    - decision 写成整数、布尔值，或 JSON 被截断只剩一半
+
+本模块用预编译的正则一次扫描同时取出 decision 与 reason，只有在正则
+取不全时才回退到 json.loads / ast.literal_eval，供 stage、main、
+interactive_game 与 app/server 共用。
+
+用法:
+    from decision_parser import parse_decision, extract_reason
+
+    decision, reason = parse_decision('```json\\n{"decision": "1", "reason": "..."}\\n```')
+    reason = extract_reason(message, default=message)
+    decisions = parse_decision_map('{"ApoRia432": "1", "EleOs252": "0"}')
+
+正确性校验见 tests/test_decision_parser.py；直接运行本文件输出解析耗时：
+    python main/decision_parser.py
+"""
+
+import ast
+import json
+import re
+from typing import NamedTuple
+
+
+# 代码块标记：```json / ```python / ```，连同语言名一起去掉，前后文字保留
+_FENCE_RE = re.compile(r"```[A-Za-z]*")
+# decision 键：兼容单/双/全角引号、无引号键名、全角冒号，值可为 0/1 或 true/false；
+# 键名前不能紧跟英文字母、数字或下划线（indecision、my_decision 等不算）
+_DECISION_RE = re.compile(
+    r"""(?<![A-Za-z0-9_])['"]?decision['"]?\s*[:：]\s*['"“”]?([01]|true|false)(?![\w.])""",
+    re.IGNORECASE,
+)
+_DECISION_WORDS = {'1': '1', '0': '0', 'true': '1', 'false': '0'}
+# reason 键：值的引号必须首尾一致，允许值内出现另一种引号和转义引号
+_REASON_RE = re.compile(
+    r"""['"]reason['"]\s*[:：]\s*(?P<q>['"])(?P<val>(?:\\.|(?!(?P=q)).)*)(?P=q)""",
+    re.DOTALL | re.IGNORECASE,
+)
+
+
+class ParsedDecision(NamedTuple):
+    """解析结果：decision 为 '1'、'0' 或 ''（解析失败），reason 可能为空串"""
+    decision: str
+    reason: str
+
+
+def normalize_decision(val) -> str:
+    """把各种形式的决策值归一化为 '1'、'0' 或 ''"""
+    if isinstance(val, bool):
+        return '1' if val else '0'
+    if isinstance(val, int):
+        return '1' if val == 1 else '0' if val == 0 else ''
+    if isinstance(val, str):
+        s = val.strip().strip("`'\" ")
+        return '1' if s == '1' else '0' if s == '0' else ''
+    return ''
+
+
+def _from_dict(d) -> ParsedDecision:
+    if not isinstance(d, dict):
+        return ParsedDecision('', '')
+    decision = ''
+    for key in ('decision', 'Decision'):
+        if key in d:
+            decision = normalize_decision(d[key])
+            break
+    reason = d.get('reason', d.get('Reason', ''))
+    return ParsedDecision(decision, str(reason).strip() if reason is not None else '')
+
+
+def _unescape(raw: str, quote: str) -> str:
+    """正则取出的 reason 仍带有 JSON/Python 转义，按原引号类型还原"""
+    if '\\' not in raw:
+        return raw
+    try:
+        if quote == '"':
+            return json.loads(f'"{raw}"')
+        return ast.literal_eval(f"'{raw}'")
+    except (ValueError, SyntaxError):
+        return raw
+
+
+def _literal_dict(text: str):
+    """截取第一个 '{' 到最后一个 '}'，依次尝试 JSON 与 Python 字面量"""
+    start = text.find('{')
+    end = text.rfind('}')
+    if start < 0 or end <= start:
+        return None
+    body = text[start:end + 1]
+    try:
+        return json.loads(body)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(body)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def parse_decision(message) -> ParsedDecision:
+    """
+    从一条决策回复中同时解析 decision 与 reason
+
+    Args:
+        message: 模型回复字符串，或已经是 dict 的决策
+
+    Returns:
+        ParsedDecision: (decision, reason)，decision 为 '1'/'0'/''
+    """
+    if not isinstance(message, str):
+        return _from_dict(message)
+
+    text = message.strip()
+    if '```' in text:
+        text = _FENCE_RE.sub('', text).strip()
+
+    match = _DECISION_RE.search(text)
+    decision = _DECISION_WORDS[match.group(1).lower()] if match else ''
+
+    match = _REASON_RE.search(text)
+    reason = _unescape(match.group('val'), match.group('q')).strip() if match else ''
+
+    if (not decision or not reason) and '{' in text:
+        parsed = _from_dict(_literal_dict(text))
+        decision = decision or parsed.decision
+        reason = reason or parsed.reason
+
+    return ParsedDecision(decision, reason)
+
+
+def parse_decision_map(message) -> dict:
+    """
+    解析批量兜底请求的回复：{角色 ID: 决策}
+
+    Returns:
+        dict: {char_id: '1'/'0'/''}，无法解析时返回空 dict
+    """
+    if isinstance(message, dict):
+        data = message
+    elif isinstance(message, str):
+        data = _literal_dict(_FENCE_RE.sub('', message))
+    else:
+        data = None
+    if not isinstance(data, dict):
+        return {}
+    return {str(key): normalize_decision(value) for key, value in data.items()}
+
+
+def extract_reason(message, default: str = '') -> str:
+    """
+    从决策回复中提取 reason 字段
+
+    Args:
+        message: 模型回复
+        default: 无法提取时的返回值（例如传入原消息，以便直接展示）
+    """
+    if not message:
+        return default
+    reason = parse_decision(message).reason
+    return reason if reason else default
+
+
+# ===================================================================
+# 微基准（正确性校验与随机变形语料见 tests/test_decision_parser.py）
+# ===================================================================
+
+if __name__ == "__main__":
+    import timeit
+
+    samples = [
+        '{"decision": "1", "reason": "我愿为翁法罗斯而战。"}',
+        '```json\n{"decision": "0", "reason": "花海尽头，我只愿守护安宁。"}\n```',
+        "{'decision': '1', 'reason': '若这是命运，我便接受它。'}",
+        '经过深思熟虑，我的回答是：\n```json\n{"decision": "0", "reason": "火种是我存在的意义，我不会交出。"}\n```\n以上。',
+        '{"reason": "先写理由，再写决定。", "decision": "0"}',
+        '我想我会同意吧',
+    ]
+    for sample in samples:
+        print(f">>> {parse_decision(sample)}")
+    number = 2000
+    elapsed = timeit.timeit(lambda: [parse_decision(s) for s in samples], number=number)
+    print(f"parse_decision 平均耗时：{elapsed / (number * len(samples)) * 1e6:.2f} 微秒/条")
@@ -0,0 +1,588 @@
+"""
+engine.py - 统一的回合模拟引擎
+
+批量（stage.run_one_iteration）、流式（main.eternal_regression_realtime_streaming）
+与交互（interactive_game.GameSession）三种模式共用同一套回合逻辑：
+
+    神谕 → 逐火决策 → 盗火行者劝诫 → 交火种决策 → 劝说顽固者 → 强夺 → 承载记忆
+
+引擎把每个阶段实现为产生 Event 的生成器，阶段之间通过 RoundState 共享状态：
+    - 决策策略可按角色替换：AIPolicy 由模型决策，PlayerPolicy 由玩家在前端决策，
+      引擎不会替玩家调用模型，只读取玩家已提交的决策
+    - 调度方式可选 "sync"（逐个调用，解析成功的决策立即产生事件）、
+      "thread" 或 "asyncio"（同一阶段内的决策并发执行，每个调用完成即产生事件；
+      劝说阶段每名顽固者是一条独立流水线，先完成的先产生事件）
+
+各前端只负责消费事件：批量模式打印，流式模式转成 SSE，交互模式写入会话事件流。
+
+用法:
+    from engine import SimulationEngine
+
+    engine = SimulationEngine(scheduler="thread", max_workers=4, seed=42)
+    for event in engine.run(rounds=3, max_persuasion_attempts=3):
+        print(event.to_dict())
+"""
+
+import json
+import random
+import threading
+import time
+from functools import partial
+
+import agent
+import metrics
+from config.api_config import SimpleAPIClient
+from decision_parser import parse_decision, parse_decision_map, normalize_decision
+from parallel import iter_completed, iter_merged
+from prompt_manager import get_prompt_manager
+from run_stats import logger
+
+
+# 缇宝是神谕发布者，天然逐火，不参与逐火决策
+ORACLE_BEARER = "HapLotes405"
+
+SCHEDULERS = ("sync", "thread", "asyncio")
+
+EVENT_TYPES = (
+    "start", "round_start", "oracle",
+    "fire_decision", "fire_result",
+    "persuasion", "handover_decision", "handover_result",
+    "persuasion_attempt", "persuasion_detail", "handover_redecision",
+    "robbery", "round_end", "complete",
+)
+
+# 最终会被盗火行者收集全部记忆的状态
+HANDED_OVER = ('逐火_交出火种', '逐火_火种被强夺')
+
+
+# ===================================================================
+# 决策解析（本地解析 + 批量 AI 兜底）
+# ===================================================================
+
+_decode_client = None
+_decode_client_lock = threading.Lock()
+
+
+def _get_decode_client():
+    """兜底解析共用的 API 客户端，首次使用时创建"""
+    global _decode_client
+    with _decode_client_lock:
+        if _decode_client is None:
+            _decode_client = SimpleAPIClient(provider="deepseek", model="deepseek-chat")
+        return _decode_client
+
+
+def _fallback_decode(text: str) -> str:
+    """单条文本的 AI 兜底解析"""
+    pm = get_prompt_manager()
+    prompt = pm.get_decode_fallback_prompt(text=text)
+    with metrics.use_scene("decode_fallback"):
+        response = _get_decode_client().chat(content=prompt, system_prompt="你是一个专业的文本解析助手。")
+    return normalize_decision(response)
+
+
+def _fallback_decode_batch(texts: dict) -> dict:
+    """多条文本合并为一次 AI 兜底解析，返回 {name: 决策}"""
+    pm = get_prompt_manager()
+    prompt = pm.get_decode_fallback_batch_prompt(texts)
+    with metrics.use_scene("decode_fallback_batch"):
+        response = _get_decode_client().chat(content=prompt, system_prompt="你是一个专业的文本解析助手。")
+    decisions = parse_decision_map(response)
+    return {name: decisions.get(name, '') for name in texts}
+
+
+def decode_decisions(last_memories: dict) -> dict:
+    """
+    批量解析一个阶段内多位角色的决策
+
+    先逐条用 decision_parser 本地解析；本地解析失败的角色汇总后只发起一次
+    AI 兜底请求（仅一条失败时使用单条提示词），再把结果分发回各角色。
+
+    Args:
+        last_memories: {name: 该角色的最后一条记忆}
+
+    Returns:
+        dict: {name: '1'/'0'/''}，顺序与输入一致，'' 表示解析失败
+    """
+    decisions = {}
+    pending = {}
+    for name, last_memory in last_memories.items():
+        decisions[name] = parse_decision(last_memory).decision
+        # 非字符串（如 dict）本地解析失败时没有可交给模型的文本
+        if not decisions[name] and isinstance(last_memory, str):
+            pending[name] = last_memory
+
+    if len(pending) == 1:
+        name, text = next(iter(pending.items()))
+        decisions[name] = _fallback_decode(text)
+    elif pending:
+        decisions.update(_fallback_decode_batch(pending))
+
+    failed = 0
+    for name, decision in decisions.items():
+        if not decision:
+            failed += 1
+            logger.warning("%s的最后一条记忆解析失败", name or '未知角色')
+    metrics.record_parse_fallback(len(pending), failed)
+    return decisions
+
+
+def decode_decision_from_memory(name: str, last_memory):
+    """
+    从记忆中解析决策结果：先用 decision_parser 本地解析，失败时调用 AI 模型兜底解析。
+
+    返回:
+        '1' 表示同意，'0' 表示拒绝，'' 表示解析失败
+    """
+    return decode_decisions({name: last_memory})[name]
+
+
+# ===================================================================
+# 事件、状态与策略
+# ===================================================================
+
+class Event:
+    """引擎产生的事件：type 为 EVENT_TYPES 之一，其余字段保存在 data 中"""
+
+    __slots__ = ("type", "data")
+
+    def __init__(self, type: str, **data):
+        if type not in EVENT_TYPES:
+            raise ValueError(f"未知的事件类型: {type}")
+        self.type = type
+        # 对 list/dict 做快照，避免后续阶段修改状态影响已产生的事件
+        self.data = {key: value.copy() if isinstance(value, (list, dict)) else value
+                     for key, value in data.items()}
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def to_dict(self) -> dict:
+        """转换为 {'type': ..., 字段...} 形式的字典"""
+        event = {'type': self.type}
+        event.update(self.data)
+        return event
+
+    def __repr__(self):
+        return f"Event({self.type!r}, {self.data!r})"
+
+
+class RoundState:
+    """一轮迭代中各阶段共享的状态"""
+
+    def __init__(self, round_num: int, heirs: dict):
+        self.round_num = round_num
+        self.heirs = heirs
+        self.oracle = ""
+        self.black_heir_word = ""
+        # 各角色当前状态：逐火 / 不逐火 / 逐火_交出火种 / 逐火_不交出火种 / 逐火_火种被强夺
+        self.statuses = {}
+        self.robbed = []
+        # 本轮被盗火行者劝说过的角色
+        self.targeted = set()
+        # 劝说后改变主意的角色 -> 在第几次劝说后交出火种
+        self.persuaded_at = {}
+
+
+class AIPolicy:
+    """由模型做决策"""
+
+    is_player = False
+
+    def decide(self, heir, question):
+        return heir.make_decision(question=question)
+
+
+class PlayerPolicy:
+    """
+    由玩家做决策
+
+    引擎不会为玩家角色调用模型；前端在进入对应阶段前把玩家的选择写入 decision（'1'/'0'），
+    玩家的记忆与事件由前端自行记录。
+    """
+
+    is_player = True
+
+    def __init__(self):
+        self.decision = ''
+
+
+AI_POLICY = AIPolicy()
+
+
+def character_name(char_id: str) -> str:
+    """角色显示名"""
+    return agent.CHARACTER_NAMES.get(char_id, char_id)
+
+
+def _timed(fn, *args, **kwargs):
+    """执行 fn，返回 (结果, 耗时秒数)"""
+    start_time = time.time()
+    result = fn(*args, **kwargs)
+    return result, time.time() - start_time
+
+
+# ===================================================================
+# 引擎
+# ===================================================================
+
+class SimulationEngine:
+    """
+    回合模拟引擎
+
+    Args:
+        black_heirs: 跨轮保留的盗火行者，不提供时新建
+        policies: {char_id: 决策策略}，未列出的角色使用 AIPolicy
+        scheduler: "sync"、"thread" 或 "asyncio"
+        max_workers: 并发调度时同一阶段的最大并发数
+        rng: 随机数生成器（劝说目标选择），不提供时用 seed 新建
+        seed / temperature: 传给新建角色的模型客户端
+    """
+
+    def __init__(self, black_heirs: dict = None, policies: dict = None, scheduler: str = "sync",
+                 max_workers: int = 4, rng=None, seed: int = None, temperature: float = None):
+        if scheduler not in SCHEDULERS:
+            raise ValueError(f"scheduler 必须是 {SCHEDULERS} 之一，当前为: {scheduler}")
+        self.client_options = {"temperature": temperature, "seed": seed}
+        self.black_heirs = black_heirs if black_heirs is not None else agent.init_black_heir(**self.client_options)
+        self.policies = dict(policies or {})
+        self.scheduler = scheduler
+        self.max_workers = max_workers
+        self.rng = rng if rng is not None else random.Random(seed)
+
+    # ------------------------------------------------------------------
+    # 工具方法
+    # ------------------------------------------------------------------
+
+    def policy(self, char_id: str):
+        return self.policies.get(char_id, AI_POLICY)
+
+    def is_player(self, char_id: str) -> bool:
+        return self.policy(char_id).is_player
+
+    def display_name(self, char_id: str) -> str:
+        name = character_name(char_id)
+        return f"盗火行者·{name}" if char_id in self.black_heirs else name
+
+    def new_round(self, round_num: int = 1) -> RoundState:
+        """开始新一轮：黄金裔每轮重新初始化，盗火行者保留记忆"""
+        return RoundState(round_num, agent.init_chrysos_heir(**self.client_options))
+
+    def _decision_event(self, event_type: str, char_id: str, decision: str, reply, elapsed: float, **extra):
+        return Event(event_type, char_id=char_id, char_name=self.display_name(char_id),
+                     decision=decision, message=reply, elapsed=elapsed, **extra)
+
+    def _decide(self, state: RoundState, event_type: str, questions: dict, **extra):
+        """
+        让 AI 角色回答各自的决策问题，逐个产生决策事件
+
+        并发调度时按调用完成的顺序处理：本地解析成功的决策在该调用完成时即产生事件；
+        解析失败的留到所有调用完成后合并为一次兜底解析。
+
+        Returns:
+            dict: {char_id: '1'/'0'/''}，按 questions 的顺序（生成器返回值，用 yield from 取得）
+        """
+        heirs = state.heirs
+        names = list(questions)
+        tasks = [partial(_timed, self.policy(name).decide, heirs[name], questions[name]) for name in names]
+
+        decisions, unparsed = {}, {}
+        for index, (reply, elapsed) in self._iter_completed(tasks):
+            name = names[index]
+            decision = parse_decision(heirs[name].memory[-1]).decision
+            if not decision:
+                unparsed[name] = (reply, elapsed)
+                continue
+            decisions[name] = decision
+            yield self._decision_event(event_type, name, decision, reply, elapsed, **extra)
+
+        if unparsed:
+            resolved = decode_decisions({name: heirs[name].memory[-1] for name in unparsed})
+            for name, (reply, elapsed) in unparsed.items():
+                decisions[name] = resolved[name]
+                yield self._decision_event(event_type, name, resolved[name], reply, elapsed, **extra)
+        return {name: decisions[name] for name in names}
+
+    def ensure_oracle_bearer_memory(self, state: RoundState):
+        """缇宝作为神谕发布者，确保她的最后一条记忆是逐火决策，以便参与交火种决策"""
+        tribbie = state.heirs.get(ORACLE_BEARER)
+        if tribbie is None:
+            return
+        if tribbie.memory and parse_decision(tribbie.memory[-1]).decision:
+            return
+        tribbie.memory.append(json.dumps({
+            'decision': '1',
+            'reason': '我是神谕的传递者，自然响应逐火之路。'
+        }, ensure_ascii=False))
+
+    # ------------------------------------------------------------------
+    # 各阶段
+    # ------------------------------------------------------------------
+
+    def oracle(self, state: RoundState):
+        """缇宝：传播神谕"""
+        pm = get_prompt_manager()
+        oracle, elapsed = _timed(state.heirs[ORACLE_BEARER].answer, pm.get_scene_prompt("oracle"))
+        state.oracle = oracle
+        yield Event("oracle", char_id=ORACLE_BEARER, char_name=self.display_name(ORACLE_BEARER),
+                    message=oracle, elapsed=elapsed)
+
+    def fire_decisions(self, state: RoundState):
+        """众人：选择是否逐火（玩家的决策取自 PlayerPolicy）"""
+        pm = get_prompt_manager()
+        questions = {}
+        for char_id, heir in state.heirs.items():
+            if char_id == ORACLE_BEARER or self.is_player(char_id):
+                continue
+            questions[char_id] = pm.get_scene_prompt(
+                "fire_decision",
+                name=heir.name,
+                path=heir.path,
+                drive=heir.drive,
+                profile=heir.profile,
+                memory=heir.memory,
+                oracle=state.oracle,
+            )
+        decisions = yield from self._decide(state, "fire_decision", questions)
+
+        for char_id in state.heirs:
+            if char_id == ORACLE_BEARER:
+                state.statuses[char_id] = '逐火'
+                continue
+            decision = self.policy(char_id).decision if self.is_player(char_id) else decisions[char_id]
+            # 解析失败默认不逐火
+            state.statuses[char_id] = '逐火' if decision == '1' else '不逐火'
+
+        yield Event("fire_result", result=state.statuses,
+                    fire_chasers=[cid for cid, status in state.statuses.items() if status == '逐火'])
+
+    def black_heir_persuade(self, state: RoundState):
+        """盗火行者：劝诫黄金裔交出火种（静态场景，不依赖逐火结果）"""
+        pm = get_prompt_manager()
+        for char_id, heir in self.black_heirs.items():
+            word, elapsed = _timed(heir.answer, pm.get_scene_prompt("black_heir_persuade"))
+            state.black_heir_word = word
+            yield Event("persuasion", char_id=char_id, char_name=self.display_name(char_id),
+                        message=word, elapsed=elapsed)
+
+    def handover_decisions(self, state: RoundState):
+        """逐火者：是否交出火种"""
+        pm = get_prompt_manager()
+        self.ensure_oracle_bearer_memory(state)
+
+        questions = {}
+        for char_id, heir in state.heirs.items():
+            if state.statuses.get(char_id) != '逐火' or self.is_player(char_id):
+                continue
+            questions[char_id] = pm.get_scene_prompt(
+                "handover_decision",
+                name=heir.name,
+                path=heir.path,
+                drive=heir.drive,
+                profile=heir.profile,
+                memory=heir.memory,
+                black_heir_word=state.black_heir_word,
+            )
+        decisions = yield from self._decide(state, "handover_decision", questions)
+
+        for char_id, status in state.statuses.items():
+            if status != '逐火':
+                continue
+            decision = self.policy(char_id).decision if self.is_player(char_id) else decisions[char_id]
+            # 解析失败默认不交出火种
+            state.statuses[char_id] += '_交出火种' if decision == '1' else '_不交出火种'
+
+        yield Event("handover_result", result=state.statuses)
+
+    def _assign_persuaders(self, state: RoundState, stubborn: list) -> dict:
+        """每位盗火行者劝说一名顽固者：玩家优先，其余随机。返回 {目标: 盗火行者 ID}"""
+        assignments = {}
+        remaining = list(stubborn)
+        for char_id in self.black_heirs:
+            if not remaining:
+                break
+            players = [cid for cid in remaining if self.is_player(cid)]
+            target = players[0] if players else self.rng.choice(remaining)
+            remaining.remove(target)
+            assignments[target] = char_id
+            state.targeted.add(target)
+        return assignments
+
+    def _persuasion_pipeline(self, state: RoundState, target: str, persuader_id, attempt: int):
+        """
+        一名顽固者的劝说流水线：被指派的盗火行者劝说（如有）→ 该角色重新决策（玩家除外）
+
+        Returns:
+            tuple: (persuasion_detail 事件或 None, 重新决策的回复或 None, 决策耗时)
+        """
+        pm = get_prompt_manager()
+        detail = None
+        if persuader_id is not None:
+            question = pm.get_scene_prompt("persuade_target", target_name=target, attempt=attempt + 1)
+            res, elapsed = _timed(self.black_heirs[persuader_id].answer, question)
+            detail = Event("persuasion_detail", persuader_id=persuader_id,
+                           persuader_name=self.display_name(persuader_id),
+                           target_id=target, target_name=self.display_name(target),
+                           message=res, elapsed=elapsed)
+
+        if self.is_player(target):
+            return detail, None, 0.0
+
+        heir = state.heirs[target]
+        question = pm.get_scene_prompt(
+            "reconsider",
+            name=heir.name,
+            path=heir.path,
+            drive=heir.drive,
+            profile=heir.profile,
+            memory=heir.memory,
+            attempt=attempt + 1,
+        )
+        reply, elapsed = _timed(self.policy(target).decide, heir, question)
+        return detail, reply, elapsed
+
+    def _iter_completed(self, tasks: list):
+        """按调度方式执行任务，按完成顺序产出 (序号, 结果)"""
+        if self.scheduler == "sync":
+            return ((index, task()) for index, task in enumerate(tasks))
+        return iter_completed(tasks, max_workers=self.max_workers, backend=self.scheduler)
+
+    def persuasion(self, state: RoundState, max_attempts: int = 3):
+        """
+        盗火行者：多次劝说顽固者
+
+        每次劝说中，每名顽固者是一条独立的流水线（被劝说 → 重新决策），各流水线并发执行，
+        先完成的先产生事件并更新状态，阶段耗时取决于最慢的一条流水线而不是所有调用之和。
+        盗火行者每次只劝说一名目标，因此同一盗火行者的记忆不会被并发写入。
+        """
+        for attempt in range(max_attempts):
+            stubborn = [cid for cid, status in state.statuses.items() if status == '逐火_不交出火种']
+            if not stubborn:
+                break
+
+            yield Event("persuasion_attempt", attempt=attempt + 1, targets=stubborn)
+
+            assignments = self._assign_persuaders(state, stubborn)
+            targets = [cid for cid in stubborn if cid in assignments or not self.is_player(cid)]
+            tasks = [partial(self._persuasion_pipeline, state, cid, assignments.get(cid), attempt)
+                     for cid in targets]
+
+            unparsed = {}
+            for index, (detail, reply, elapsed) in self._iter_completed(tasks):
+                char_id = targets[index]
+                if detail is not None:
+                    yield detail
+                if reply is None:
+                    continue
+                decision = parse_decision(state.heirs[char_id].memory[-1]).decision
+                if not decision:
+                    unparsed[char_id] = (reply, elapsed)
+                    continue
+                # 改变主意的角色立即退出，不再参与后续劝说
+                if decision == '1':
+                    state.statuses[char_id] = '逐火_交出火种'
+                    state.persuaded_at[char_id] = attempt + 1
+                yield self._decision_event("handover_redecision", char_id, decision, reply, elapsed,
+                                           attempt=attempt + 1)
+
+            if unparsed:
+                resolved = decode_decisions({cid: state.heirs[cid].memory[-1] for cid in unparsed})
+                for char_id, (reply, elapsed) in unparsed.items():
+                    if resolved[char_id] == '1':
+                        state.statuses[char_id] = '逐火_交出火种'
+                        state.persuaded_at[char_id] = attempt + 1
+                    yield self._decision_event("handover_redecision", char_id, resolved[char_id], reply, elapsed,
+                                               attempt=attempt + 1)
+
+    def robbery(self, state: RoundState):
+        """强夺仍不交出火种者的火种"""
+        state.robbed = []
+        for char_id, status in state.statuses.items():
+            if status == '逐火_不交出火种':
+                state.statuses[char_id] = '逐火_火种被强夺'
+                state.robbed.append(char_id)
+                yield Event("robbery", char_id=char_id, char_name=self.display_name(char_id))
+
+    def collect(self, state: RoundState):
+        """盗火行者承载火种：交出或被夺者的全部记忆，不逐火者的第一条记忆"""
+        for black_heir in self.black_heirs.values():
+            for char_id, status in state.statuses.items():
+                memory = state.heirs[char_id].memory
+                if status in HANDED_OVER:
+                    black_heir.memory.extend(memory)
+                elif status == '不逐火' and memory:
+                    black_heir.memory.append(memory[0])
+            black_heir.memory.append(f"被强夺火种的角色：{state.robbed}，这些角色因被强夺火种受伤甚至死亡")
+
+        yield Event(
+            "round_end",
+            round_num=state.round_num,
+            final_result=state.statuses,
+            robbed_characters=state.robbed,
+            memory_count={cid: len(heir.memory) for cid, heir in self.black_heirs.items()},
+            memory_chars={cid: heir.memory.total_chars for cid, heir in self.black_heirs.items()},
+        )
+
+    # ------------------------------------------------------------------
+    # 整轮 / 多轮
+    # ------------------------------------------------------------------
+
+    def close(self, state: RoundState = None):
+        """
+        释放盗火行者与本轮黄金裔的模型客户端（流被取消或结束时调用）
+
+        之后引擎与 state 不应再使用。
+        """
+        heirs = list(self.black_heirs.values())
+        if state is not None:
+            heirs.extend(state.heirs.values())
+            state.heirs = {}
+        for heir in heirs:
+            heir.close()
+
+    def round_phases(self, state: RoundState, max_persuasion_attempts: int = 3) -> list:
+        """
+        一轮中的全部阶段，按执行顺序排列
+
+        盗火行者劝诫不依赖逐火结果（依赖图同 stage.ROUND_STEPS）：并发调度时与逐火决策
+        合为一个阶段同时执行，事件按产生顺序交错；sync 调度时依次执行。
+
+        Returns:
+            list: [(阶段名, 产生事件的生成器工厂)]，前端可以在阶段之间插入追踪等逻辑
+        """
+        fire_decisions = partial(self.fire_decisions, state)
+        black_heir_persuade = partial(self.black_heir_persuade, state)
+        if self.scheduler == "sync":
+            independent = [
+                ("fire_decisions", fire_decisions),
+                ("black_heir_persuade", black_heir_persuade),
+            ]
+        else:
+            independent = [
+                ("fire_decisions+black_heir_persuade",
+                 partial(iter_merged, [fire_decisions, black_heir_persuade])),
+            ]
+        return [
+            ("oracle", partial(self.oracle, state)),
+            *independent,
+            ("handover", partial(self.handover_decisions, state)),
+            ("persuasion", partial(self.persuasion, state, max_persuasion_attempts)),
+            ("robbery", partial(self.robbery, state)),
+            ("collect", partial(self.collect, state)),
+        ]
+
+    def run_round(self, state: RoundState, max_persuasion_attempts: int = 3):
+        """依次执行一轮的全部阶段"""
+        for _, phase in self.round_phases(state, max_persuasion_attempts):
+            yield from phase()
+
+    def run(self, rounds: int, max_persuasion_attempts: int = 3):
+        """执行多轮永劫回归，产生全部事件"""
+        yield Event("start", rounds=rounds)
+        for round_num in range(1, rounds + 1):
+            yield Event("round_start", round_num=round_num)
+            yield from self.run_round(self.new_round(round_num), max_persuasion_attempts)
+        yield Event("complete", total_rounds=rounds)
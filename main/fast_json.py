@@ -0,0 +1,62 @@
+"""
+fast_json.py - 接口与推送流使用的 JSON 编码
+
+安装了 orjson 时使用 orjson（比标准库快数倍，直接输出 UTF-8 字节），否则退回标准库 json。
+两者输出等价：紧凑格式、非 ASCII 字符不转义；numpy 数组与标量也能直接编码。
+
+游戏事件在产生时只编码一次（见 GameSession._add_event、Job._add_event），
+之后的状态响应与推送消息直接拼接已编码的字节，事件越多节省越明显：
+
+    encoded = [dumps(event) for event in events]
+    body = join_array(encoded)            # b'[{...},{...}]'
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(obj) -> bytes:
+        """编码为 UTF-8 JSON 字节"""
+        return orjson.dumps(obj, option=_OPTIONS)
+
+else:
+    def _default(obj):
+        # numpy 数组与标量（标准库不支持）
+        if hasattr(obj, "tolist"):
+            return obj.tolist()
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def dumps(obj) -> bytes:
+        """编码为 UTF-8 JSON 字节"""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def join_array(encoded: list) -> bytes:
+    """把已编码的元素拼接为 JSON 数组"""
+    return b"[" + b",".join(encoded) + b"]"
+
+
+def with_field(encoded_object: bytes, key: str, encoded_value: bytes) -> bytes:
+    """在已编码的 JSON 对象末尾追加一个已编码的字段"""
+    if encoded_object == b"{}":
+        return b"{" + dumps(key) + b":" + encoded_value + b"}"
+    return encoded_object[:-1] + b"," + dumps(key) + b":" + encoded_value + b"}"
+
+
+if __name__ == "__main__":
+    import time
+
+    events = [{"type": "fire_decision", "char_id": f"char{i}", "message": "理由" * 200} for i in range(2000)]
+    start = time.time()
+    encoded = [dumps(event) for event in events]
+    body = with_field(dumps({"stage": "round_end"}), "events", join_array(encoded))
+    print(f">>> {'orjson' if orjson else 'json'}: 编码 {len(events)} 个事件 {(time.time() - start) * 1000:.1f} ms，"
+          f"{len(body) / 1024:.0f} KB")
+    assert json.loads(body)["events"] == events
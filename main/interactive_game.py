@@ -3,8 +3,12 @@ interactive_game.py - 玩家扮演交互模式状态机
 
 提供有状态的游戏会话，让玩家可以扮演一位黄金裔，
 在关键决策点（逐火、交火种等）介入，其余角色由 AI 控制。
+
+回合逻辑由 engine.SimulationEngine 执行：玩家角色使用 PlayerPolicy，
+会话只负责在阶段之间等待玩家输入，并把引擎事件转换为前端使用的事件格式。
 """
 
+import functools
 import json
 import uuid
 import random
@@ -12,62 +16,178 @@ import time
 from typing import Optional
 
 import agent
-import stage
+import fast_json
+import tracing
+from decision_parser import extract_reason
+from engine import SimulationEngine, PlayerPolicy, RoundState
+from memory import MemoryList, PersistentMemory
 from prompt_manager import get_prompt_manager
+from session_store import SessionStore, store_from_env
+
+
+# 会话存储（空闲超时 + LRU 上限，见 session_store.py）
+_store: SessionStore = store_from_env()
+
 
+def get_session_store() -> SessionStore:
+    return _store
 
-# 内存中的会话存储
-_sessions: dict[str, "GameSession"] = {}
+
+def set_session_store(store: SessionStore) -> SessionStore:
+    """替换全局会话存储（原存储中的会话不迁移）"""
+    global _store
+    _store = store
+    return _store
 
 
 def get_session(session_id: str) -> "GameSession":
-    if session_id not in _sessions:
-        raise ValueError(f"未找到游戏会话: {session_id}")
-    return _sessions[session_id]
+    return _store.get(session_id)
 
 
-def create_session(max_rounds: int = 1) -> str:
+def create_session(max_rounds: int = 1, seed: int = None, temperature: float = None) -> str:
     """创建新游戏会话"""
-    session = GameSession(max_rounds=max_rounds)
-    _sessions[session.session_id] = session
+    session = GameSession(max_rounds=max_rounds, seed=seed, temperature=temperature)
+    _store.add(session)
     return session.session_id
 
 
-def delete_session(session_id: str):
-    """删除游戏会话"""
-    if session_id in _sessions:
-        del _sessions[session.session_id]
+def delete_session(session_id: str) -> bool:
+    """删除游戏会话，返回会话是否存在"""
+    return _store.delete(session_id)
+
+
+def save_session(session: "GameSession"):
+    """一次请求结束后保存会话（持久化存储写入新状态与新事件，内存存储无需保存）"""
+    _store.save(session)
+
+
+def _heir_record(heir) -> dict:
+    return {"memory": list(heir.memory), "state": heir.state}
+
+
+def _traced(span_name: str, label: str):
+    """
+    把 GameSession 方法记录为追踪 span
+
+    会话跨越多个 HTTP 请求，run / round span 由会话自行持有；
+    被装饰的方法以当前回合（尚未开始回合时为整局）的 span 为父节点。
+    """
+    key = "action" if span_name == "request" else "phase"
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            parent = tracing.current_span() if span_name == "phase" else None
+            with tracing.span(
+                span_name,
+                parent=parent or self._round_span or self._run_span,
+                session_id=self.session_id,
+                round_num=self.round,
+                **{key: label},
+            ):
+                result = method(self, *args, **kwargs)
+            if span_name == "request":
+                self._touch()
+            return result
+        return wrapper
+    return decorator
 
 
 class GameSession:
     """一局交互式游戏的状态"""
 
-    def __init__(self, max_rounds: int = 1):
-        self.session_id = str(uuid.uuid4())
+    def __init__(self, max_rounds: int = 1, seed: Optional[int] = None, temperature: Optional[float] = None,
+                 session_id: Optional[str] = None):
+        self.session_id = session_id or str(uuid.uuid4())
         self.max_rounds = max(1, max_rounds)
+
+        # 可复现：劝说目标的随机选择使用本局自己的生成器，seed / temperature 传给模型客户端
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.client_options = {"temperature": temperature, "seed": seed}
+        # 状态版本：事件或阶段变化时递增，用于 ETag 与增量查询
+        self.version = 0
+        # 持久化存储中该会话的版本（由存储维护，用于检测其他进程的并发修改）
+        self.stored_version: Optional[int] = None
+        # 状态变化监听器（服务端推送通道），在修改状态的线程中调用
+        self._listeners: list = []
         self.round = 0
         self.stage = "created"
         self.player_char_id: Optional[str] = None
 
-        # 跨回合保留的盗火行者
-        self.black_heirs = agent.init_black_heir()
-
-        # 每回合重新初始化的黄金裔
-        self.heirs: dict = {}
-
-        self.oracle: str = ""
-        self.fire_chasers_dict: dict = {}
-        self.robbed_characters: list = []
-        self.black_heir_word: str = ""
+        # 回合引擎：跨回合保留盗火行者；每回合的黄金裔与状态保存在 self.state 中
+        self.engine = SimulationEngine(rng=self.rng, **self.client_options)
+        self.black_heirs = self.engine.black_heirs
+        self.state = RoundState(0, {})
 
-        # 事件流与日志
+        # 事件流与日志：每个事件添加时编码一次，状态响应与推送直接拼接编码结果；
+        # event_chars 为事件编码后的字节数合计，用于内存估算
         self.events: list = []
+        self._encoded_events: list = []
+        self.event_chars = 0
+
+        # 追踪：整局一个 run span，每回合一个 round span
+        self._run_span = tracing.start_span("run", engine="interactive", session_id=self.session_id,
+                                            max_rounds=self.max_rounds)
+        self._round_span = None
 
         # 可用角色（排除缇宝）
         pm = get_prompt_manager()
         all_ids = pm.get_all_character_ids()
         self.available_characters = [cid for cid in all_ids if cid != "HapLotes405" and cid != "Black_NeiKo"]
 
+    # ------------------------------------------------------------------
+    # 本回合状态（由引擎维护）
+    # ------------------------------------------------------------------
+
+    @property
+    def stage(self) -> str:
+        return self._stage
+
+    @stage.setter
+    def stage(self, value: str):
+        self._stage = value
+        self._touch()
+
+    def _touch(self):
+        """状态发生变化，递增版本并通知监听器"""
+        self.version += 1
+        for callback in list(self._listeners):
+            callback()
+
+    def add_listener(self, callback):
+        """注册状态变化回调 callback()；回调在修改状态的线程中执行，应尽快返回"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    @property
+    def etag(self) -> str:
+        """当前状态的 ETag"""
+        return f'"{self.session_id}-{self.version}"'
+
+    @property
+    def heirs(self) -> dict:
+        return self.state.heirs
+
+    @property
+    def oracle(self) -> str:
+        return self.state.oracle
+
+    @property
+    def black_heir_word(self) -> str:
+        return self.state.black_heir_word
+
+    @property
+    def fire_chasers_dict(self) -> dict:
+        return self.state.statuses
+
+    @property
+    def robbed_characters(self) -> list:
+        return self.state.robbed
+
     # ------------------------------------------------------------------
     # 工具方法
     # ------------------------------------------------------------------
@@ -82,9 +202,35 @@ class GameSession:
                 event[key] = value.copy()
             else:
                 event[key] = value
+        # 先写入编码结果：并发读取时编码列表总不短于事件列表
+        encoded = fast_json.dumps(event)
+        self._encoded_events.append(encoded)
         self.events.append(event)
+        self.event_chars += len(encoded)
+        self._touch()
         return event
 
+    def _record_engine_events(self, events):
+        """把引擎事件转换为交互模式的事件格式并写入事件流"""
+        for event in events:
+            fields = dict(event.data)
+            fields.pop("elapsed", None)
+            if event.type == "handover_result":
+                # 交互模式不单独展示交火种汇总，最终结果见 round_end
+                continue
+            if event.type in ("fire_decision", "handover_decision"):
+                decision = fields["decision"]
+                if event.type == "fire_decision":
+                    fields["decision_text"] = "逐火" if decision == "1" else "不逐火"
+                else:
+                    fields["decision_text"] = "交出火种" if decision == "1" else "拒绝交出"
+                fields["reason"] = extract_reason(fields.pop("message"))
+                fields["is_player"] = False
+            elif event.type == "handover_redecision":
+                fields.pop("attempt", None)
+                fields["decision_text"] = "改变主意，交出火种" if fields["decision"] == "1" else "仍然拒绝"
+            self._add_event(event.type, **fields)
+
     def _get_player_heir(self):
         """获取玩家扮演的角色 Agent"""
         if not self.player_char_id or self.player_char_id not in self.heirs:
@@ -124,7 +270,7 @@ class GameSession:
                 oracle=self.oracle,
             )
             player_heir.make_decision(question=question)
-            ai_reason = extract_reason_from_message(player_heir.memory[-1])
+            ai_reason = extract_reason(player_heir.memory[-1])
             reason = ai_reason if ai_reason else "我做出了自己的选择。"
             # 覆盖决策为玩家选择
             memory_entry = self._format_decision_memory(player_decision, reason)
@@ -133,6 +279,8 @@ class GameSession:
             memory_entry = self._format_decision_memory(player_decision, reason)
             player_heir.memory.append(memory_entry)
 
+        self.engine.policy(self.player_char_id).decision = player_decision
+
         event_type = "fire_redecision" if is_re_decision else "fire_decision"
         self._add_event(
             event_type,
@@ -185,49 +333,15 @@ class GameSession:
 
         return self._get_tribbie_nickname(target_char_id)
 
-    def _ensure_tribbie_fire_memory(self):
-        """缇宝作为神谕发布者，确保她的记忆中存在逐火决策，以便参与后续交火种决策"""
-        if "HapLotes405" not in self.heirs:
-            return
-        tribbie = self.heirs["HapLotes405"]
-        if tribbie.memory:
-            last = tribbie.memory[-1]
-            if isinstance(last, str) and last.strip().startswith("{"):
-                try:
-                    data = json.loads(last)
-                    if "decision" in data:
-                        return
-                except Exception:
-                    pass
-        memory_entry = self._format_decision_memory(
-            "1", "我是神谕的传递者，自然响应逐火之路。"
-        )
-        tribbie.memory.append(memory_entry)
-
-    def _summarize_fire_result(self):
-        """汇总所有角色的逐火结果"""
-        self.fire_chasers_dict = {}
-        for char_id, heir in self.heirs.items():
-            if char_id == "HapLotes405":
-                # 缇宝是神谕发布者，天然逐火
-                self.fire_chasers_dict[char_id] = "逐火"
-                continue
-            if char_id == self.player_char_id:
-                # 玩家决策已记录在最后一条记忆中
-                decision = stage.decode_decision_from_memory(char_id, heir.memory[-1])
-                self.fire_chasers_dict[char_id] = "逐火" if decision == "1" else "不逐火"
-                continue
-            decision = stage.decode_decision_from_memory(char_id, heir.memory[-1])
-            self.fire_chasers_dict[char_id] = "逐火" if decision == "1" else "不逐火"
-
-        self._add_event(
-            "fire_result",
-            result=self.fire_chasers_dict,
-            fire_chasers=[cid for cid, status in self.fire_chasers_dict.items() if status == "逐火"],
-        )
+    def _state_response(self, since: Optional[int] = None, include_events: bool = True) -> dict:
+        """
+        生成统一的状态响应
 
-    def _state_response(self) -> dict:
-        """生成统一的状态响应"""
+        Args:
+            since: 客户端已有的事件数；提供时 events 只包含此后的新事件（events_since 标明起点），
+                   否则返回全部事件
+            include_events: 为 False 时不含 events 字段（由调用方拼接预先编码的事件）
+        """
         pm = get_prompt_manager()
         choices = None
 
@@ -276,29 +390,160 @@ class GameSession:
                 "decision_type": "continue",
             }
 
-        return {
+        total = len(self.events)
+        since = min(max(since or 0, 0), total)
+
+        # 状态查询可能与另一个线程中正在进行的阶段并发，返回列表与字典的副本
+        response = {
             "session_id": self.session_id,
+            "version": self.version,
             "stage": self.stage,
             "round": self.round,
             "max_rounds": self.max_rounds,
             "player_char_id": self.player_char_id,
-            "events": self.events,
+            "events_since": since,
+            "events_total": total,
             "choices": choices,
-            "fire_chasers_dict": self.fire_chasers_dict,
-            "robbed_characters": self.robbed_characters,
+            "fire_chasers_dict": dict(self.fire_chasers_dict),
+            "robbed_characters": list(self.robbed_characters),
         }
+        if include_events:
+            response["events"] = self.events[since:total]
+        return response
+
+    def encoded_events(self, start: int, stop: int) -> list:
+        """第 start 到 stop 个事件的 JSON 编码（bytes 列表）"""
+        return self._encoded_events[start:stop]
+
+    def state_json(self, since: Optional[int] = None) -> bytes:
+        """_state_response 的 JSON 编码，事件直接拼接添加时的编码结果，不再重复编码"""
+        response = self._state_response(since, include_events=False)
+        events = self.encoded_events(response["events_since"], response["events_total"])
+        return fast_json.with_field(fast_json.dumps(response), "events", fast_json.join_array(events))
+
+    def footprint(self) -> int:
+        """会话占用内存的估算：盗火行者与本回合黄金裔的记忆字符数加上事件编码字节数"""
+        heirs = list(self.black_heirs.values()) + list(self.heirs.values())
+        return self.event_chars + sum(heir.memory.total_chars for heir in heirs)
+
+    def close(self):
+        """释放会话：结束追踪 span，关闭模型客户端（会话被移除时调用，之后不应再使用）"""
+        self._end_round_span()
+        self._run_span.end()
+        self.engine.close(self.state)
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+
+    def to_record(self) -> dict:
+        """
+        会话状态（不含事件）的 JSON 友好快照，供持久化存储使用
+
+        事件流由存储单独以追加方式保存；模型客户端、追踪 span 与监听器不保存，恢复时重建。
+        """
+        state = self.state
+        policy = self.engine.policy(self.player_char_id) if self.player_char_id else None
+        version, internal, gauss = self.rng.getstate()
+        return {
+            "session_id": self.session_id,
+            "max_rounds": self.max_rounds,
+            "seed": self.seed,
+            "temperature": self.client_options["temperature"],
+            "version": self.version,
+            "round": self.round,
+            "stage": self.stage,
+            "player_char_id": self.player_char_id,
+            "player_decision": policy.decision if policy is not None and policy.is_player else None,
+            "rng_state": [version, list(internal), gauss],
+            "event_chars": self.event_chars,
+            "black_heirs": {char_id: _heir_record(heir) for char_id, heir in self.black_heirs.items()},
+            "round_state": {
+                "round_num": state.round_num,
+                "heirs": {char_id: _heir_record(heir) for char_id, heir in state.heirs.items()},
+                "oracle": state.oracle,
+                "black_heir_word": state.black_heir_word,
+                "statuses": state.statuses,
+                "robbed": state.robbed,
+                "targeted": sorted(state.targeted),
+                "persuaded_at": state.persuaded_at,
+            },
+        }
+
+    @classmethod
+    def from_record(cls, record: dict, events: list) -> "GameSession":
+        """由 to_record 的快照与完整事件流恢复会话"""
+        temperature = record["temperature"]
+        seed = record["seed"]
+        session = cls(max_rounds=record["max_rounds"], seed=seed, temperature=temperature,
+                      session_id=record["session_id"])
+        session._run_span.set(restored=True)
+
+        version, internal, gauss = record["rng_state"]
+        session.rng.setstate((version, tuple(internal), gauss))
+        session.round = record["round"]
+        session.stage = record["stage"]
+
+        for char_id, saved in record["black_heirs"].items():
+            heir = session.black_heirs[char_id]
+            heir.memory = PersistentMemory(saved["memory"])
+            heir.state = saved["state"]
+
+        saved_state = record["round_state"]
+        heirs = {}
+        for char_id, saved in saved_state["heirs"].items():
+            heir = agent.Chrysos_Heir(char_id=char_id, temperature=temperature, seed=seed)
+            heir.memory = MemoryList(saved["memory"])
+            heir.state = saved["state"]
+            heirs[char_id] = heir
+        state = RoundState(saved_state["round_num"], heirs)
+        state.oracle = saved_state["oracle"]
+        state.black_heir_word = saved_state["black_heir_word"]
+        state.statuses = saved_state["statuses"]
+        state.robbed = saved_state["robbed"]
+        state.targeted = set(saved_state["targeted"])
+        state.persuaded_at = saved_state["persuaded_at"]
+        session.state = state
+
+        player_char_id = record["player_char_id"]
+        if player_char_id:
+            session.player_char_id = player_char_id
+            session.engine.policies[player_char_id] = PlayerPolicy()
+            session.engine.policies[player_char_id].decision = record["player_decision"] or ''
+
+        session.events = events
+        session._encoded_events = [fast_json.dumps(event) for event in events]
+        session.event_chars = record["event_chars"]
+        # 最后恢复版本：上面设置阶段时版本会递增
+        session.version = record["version"]
+        return session
+
+    def _begin_round_span(self):
+        """开始本回合的 round span"""
+        self._round_span = tracing.start_span(
+            "round", parent=self._run_span, engine="interactive",
+            session_id=self.session_id, round_num=self.round,
+        )
+
+    def _end_round_span(self):
+        if self._round_span is not None:
+            self._round_span.set(robbed=len(self.robbed_characters))
+            self._round_span.end()
+            self._round_span = None
 
     # ------------------------------------------------------------------
     # 主要流程方法
     # ------------------------------------------------------------------
 
+    @_traced("request", "start")
     def start(self) -> dict:
         """开始游戏：返回开场文案、神谕和可选角色"""
         if self.stage != "created":
             raise ValueError(f"游戏已经启动，当前阶段: {self.stage}")
 
         self.round = 1
-        self.heirs = agent.init_chrysos_heir()
+        self._begin_round_span()
+        self.state = self.engine.new_round(self.round)
 
         pm = get_prompt_manager()
 
@@ -307,18 +552,12 @@ class GameSession:
         self._add_event("intro", message=intro)
 
         # 缇宝发布神谕
-        oracle_question = pm.get_scene_prompt("oracle")
-        self.oracle = self.heirs["HapLotes405"].answer(oracle_question)
-        self._add_event(
-            "oracle",
-            char_id="HapLotes405",
-            char_name=pm.get_character_names().get("HapLotes405", "缇宝"),
-            message=self.oracle,
-        )
+        self._record_engine_events(self.engine.oracle(self.state))
 
         self.stage = "choose_character"
         return self._state_response()
 
+    @_traced("request", "choose_character")
     def choose_character(self, char_id: str) -> dict:
         """玩家选择扮演的角色"""
         if self.stage != "choose_character":
@@ -327,6 +566,7 @@ class GameSession:
             raise ValueError(f"不能选择该角色: {char_id}")
 
         self.player_char_id = char_id
+        self.engine.policies[char_id] = PlayerPolicy()
         pm = get_prompt_manager()
         char_names = pm.get_character_names()
 
@@ -358,6 +598,7 @@ class GameSession:
         self.stage = "fire_decision"
         return self._state_response()
 
+    @_traced("request", "submit_fire_decision")
     def submit_fire_decision(self, decision, reason: Optional[str] = None) -> dict:
         """玩家提交逐火决策（支持初次决策与劝说后的二次决策）"""
         if self.stage == "fire_decision":
@@ -372,12 +613,9 @@ class GameSession:
         player_decision = self._decode_player_decision(decision)
         self._record_player_fire_decision(player_decision, reason)
 
-        # AI 控制其他角色做逐火决策
+        # AI 控制其他角色做逐火决策并汇总逐火结果，再确保缇宝记忆中有逐火决策
         self._run_ai_fire_decisions()
-
-        # 汇总逐火结果，并确保缇宝记忆中有逐火决策
-        self._summarize_fire_result()
-        self._ensure_tribbie_fire_memory()
+        self.engine.ensure_oracle_bearer_memory(self.state)
 
         # 玩家逐火则进入交火种决策；否则缇宝和阿格莱雅各劝一轮
         if self.fire_chasers_dict.get(self.player_char_id) == "逐火":
@@ -454,6 +692,7 @@ class GameSession:
         self._run_handover_persuasion_round()
         self.stage = "round_end"
 
+    @_traced("request", "submit_handover_decision")
     def submit_handover_decision(self, decision, reason: Optional[str] = None, max_persuasion_attempts: int = 3) -> dict:
         """玩家提交交火种决策
 
@@ -480,7 +719,7 @@ class GameSession:
                 black_heir_word=self.black_heir_word,
             )
             player_heir.make_decision(question=question)
-            ai_reason = extract_reason_from_message(player_heir.memory[-1])
+            ai_reason = extract_reason(player_heir.memory[-1])
             reason = ai_reason if ai_reason else "我做出了自己的选择。"
             memory_entry = self._format_decision_memory(player_decision, reason)
             player_heir.memory[-1] = memory_entry
@@ -498,11 +737,8 @@ class GameSession:
             is_player=True,
         )
 
-        self.fire_chasers_dict[self.player_char_id] += (
-            "_交出火种" if player_decision == "1" else "_不交出火种"
-        )
-
-        # AI 控制其他逐火者做交火种决策
+        # 玩家的交火种决策与 AI 逐火者的决策一起由引擎结算
+        self.engine.policy(self.player_char_id).decision = player_decision
         self._run_ai_handover_decisions()
 
         # 盗火行者劝说，AI 重新决策；若玩家被劝说则进入 handover_persuasion
@@ -510,6 +746,7 @@ class GameSession:
 
         return self._state_response()
 
+    @_traced("request", "submit_handover_redecision")
     def submit_handover_redecision(self, decision, reason: Optional[str] = None) -> dict:
         """盗火行者劝说后，玩家再次提交交火种决策"""
         if self.stage != "handover_persuasion":
@@ -532,7 +769,7 @@ class GameSession:
                 black_heir_word=self.black_heir_word,
             )
             player_heir.make_decision(question=question)
-            ai_reason = extract_reason_from_message(player_heir.memory[-1])
+            ai_reason = extract_reason(player_heir.memory[-1])
             reason = ai_reason if ai_reason else "我做出了自己的选择。"
             memory_entry = self._format_decision_memory(player_decision, reason)
             player_heir.memory[-1] = memory_entry
@@ -558,6 +795,7 @@ class GameSession:
         self.stage = "round_end"
         return self._state_response()
 
+    @_traced("request", "continue_game")
     def continue_game(self) -> dict:
         """继续下一回合或结束游戏"""
         if self.stage != "round_end":
@@ -569,32 +807,24 @@ class GameSession:
                 "complete",
                 message=f"永劫回归测试完成！共执行 {self.max_rounds} 轮迭代",
             )
+            self._run_span.end()
             return self._state_response()
 
         # 进入下一轮
         self.round += 1
-        self.heirs = agent.init_chrysos_heir()
-        self.fire_chasers_dict = {}
-        self.robbed_characters = []
-        self.black_heir_word = ""
+        self._begin_round_span()
+        self.state = self.engine.new_round(self.round)
 
         pm = get_prompt_manager()
         char_names = pm.get_character_names()
 
         # 新神谕
-        oracle_question = pm.get_scene_prompt("oracle")
-        self.oracle = self.heirs["HapLotes405"].answer(oracle_question)
         self._add_event(
             "round_start",
             round_num=self.round,
             message=f">>> [第 {self.round} 轮永劫回归开始]",
         )
-        self._add_event(
-            "oracle",
-            char_id="HapLotes405",
-            char_name=char_names.get("HapLotes405", "缇宝"),
-            message=self.oracle,
-        )
+        self._record_engine_events(self.engine.oracle(self.state))
 
         # 生成给玩家的逐火决策问题
         player_heir = self.heirs[self.player_char_id]
@@ -621,57 +851,23 @@ class GameSession:
     # AI 控制逻辑
     # ------------------------------------------------------------------
 
+    @_traced("phase", "ai_fire_decisions")
     def _run_ai_fire_decisions(self):
-        """AI 控制非玩家角色做逐火决策"""
-        pm = get_prompt_manager()
-        char_names = pm.get_character_names()
-
-        for char_id, heir in self.heirs.items():
-            if char_id == self.player_char_id or char_id == "HapLotes405":
-                continue
-
-            question = pm.get_scene_prompt(
-                "fire_decision",
-                name=heir.name,
-                path=heir.path,
-                drive=heir.drive,
-                profile=heir.profile,
-                memory=heir.memory,
-                oracle=self.oracle,
-            )
-            res = heir.make_decision(question=question)
-            decision = stage.decode_decision_from_memory(char_id, heir.memory[-1])
-            self._add_event(
-                "fire_decision",
-                char_id=char_id,
-                char_name=char_names.get(char_id, char_id),
-                decision=decision,
-                decision_text="逐火" if decision == "1" else "不逐火",
-                reason=extract_reason_from_message(res),
-                is_player=False,
-            )
+        """AI 控制非玩家角色做逐火决策，并汇总所有角色（含玩家）的逐火结果"""
+        self._record_engine_events(self.engine.fire_decisions(self.state))
 
+    @_traced("phase", "black_heir_persuade")
     def _run_black_heir_persuade(self):
         """盗火行者劝诫"""
-        pm = get_prompt_manager()
-        char_names = pm.get_character_names()
-
-        for char_id, heir in self.black_heirs.items():
-            question = pm.get_scene_prompt("black_heir_persuade")
-            self.black_heir_word = heir.answer(question=question)
-            self._add_event(
-                "persuasion",
-                char_id=char_id,
-                char_name=char_names.get(char_id, char_id),
-                message=self.black_heir_word,
-            )
+        self._record_engine_events(self.engine.black_heir_persuade(self.state))
 
+    @_traced("phase", "player_fire_persuasion")
     def _run_player_fire_persuasion(self):
         """玩家不逐火时，缇宝和阿格莱雅各劝一轮"""
         pm = get_prompt_manager()
         char_names = pm.get_character_names()
         player_heir = self._get_player_heir()
-        player_reason = extract_reason_from_message(player_heir.memory[-1])
+        player_reason = extract_reason(player_heir.memory[-1])
         if not player_reason:
             player_reason = "我还没有准备好。"
 
@@ -722,149 +918,31 @@ class GameSession:
             is_re_decision=True,
         )
 
+    @_traced("phase", "ai_handover_decisions")
     def _run_ai_handover_decisions(self):
-        """AI 控制非玩家逐火者做交火种决策"""
-        # 缇宝若因劝说环节产生了新的记忆，需确保最后一条是逐火决策，才能正确解析交火种决策
-        self._ensure_tribbie_fire_memory()
-
-        pm = get_prompt_manager()
-        char_names = pm.get_character_names()
-
-        for char_id, heir in self.heirs.items():
-            if char_id == self.player_char_id:
-                continue
-            if self.fire_chasers_dict.get(char_id) != "逐火":
-                continue
-
-            question = pm.get_scene_prompt(
-                "handover_decision",
-                name=heir.name,
-                path=heir.path,
-                drive=heir.drive,
-                profile=heir.profile,
-                memory=heir.memory,
-                black_heir_word=self.black_heir_word,
-            )
-            res = heir.make_decision(question=question)
-            decision = stage.decode_decision_from_memory(char_id, heir.memory[-1])
-            self.fire_chasers_dict[char_id] += (
-                "_交出火种" if decision == "1" else "_不交出火种"
-            )
-            self._add_event(
-                "handover_decision",
-                char_id=char_id,
-                char_name=char_names.get(char_id, char_id),
-                decision=decision,
-                decision_text="交出火种" if decision == "1" else "拒绝交出",
-                reason=extract_reason_from_message(res),
-                is_player=False,
-            )
+        """AI 控制非玩家逐火者做交火种决策；玩家若逐火，其决策取自 PlayerPolicy"""
+        self._record_engine_events(self.engine.handover_decisions(self.state))
 
     def _run_robbery_and_collect(self):
         """强夺剩余顽固者的火种并收集记忆"""
-        pm = get_prompt_manager()
-        char_names = pm.get_character_names()
-
-        self.robbed_characters = []
-        for char_id, status in self.fire_chasers_dict.items():
-            if status == "逐火_不交出火种":
-                self.fire_chasers_dict[char_id] = "逐火_火种被强夺"
-                self.robbed_characters.append(char_id)
-                self._add_event(
-                    "robbery",
-                    char_id=char_id,
-                    char_name=char_names.get(char_id, char_id),
-                )
-
-        self._add_event(
-            "round_end",
-            round_num=self.round,
-            final_result=self.fire_chasers_dict,
-            robbed_characters=self.robbed_characters,
-        )
-        self._collect_memories()
+        self._record_engine_events(self.engine.robbery(self.state))
+        self._record_engine_events(self.engine.collect(self.state))
+        self._end_round_span()
 
+    @_traced("phase", "handover_persuasion")
     def _run_handover_persuasion_round(self, max_attempts: int = 1):
         """盗火行者劝说顽固者，并让 AI 顽固者重新决策。
 
         若玩家在被劝说的目标中，则进入 handover_persuasion 阶段等待玩家二次决策；
         否则直接强夺并结束回合。
         """
-        pm = get_prompt_manager()
-        char_names = pm.get_character_names()
-
-        player_targeted = False
-
-        for attempt in range(max_attempts):
-            stubborn = [
-                cid for cid, status in self.fire_chasers_dict.items()
-                if status == "逐火_不交出火种"
-            ]
-            if not stubborn:
-                break
+        self._record_engine_events(self.engine.persuasion(self.state, max_attempts))
 
-            self._add_event(
-                "persuasion_attempt",
-                attempt=attempt + 1,
-                targets=stubborn,
-            )
-
-            # 盗火行者劝说顽固者；玩家优先
-            for black_heir_id, black_heir in self.black_heirs.items():
-                if not stubborn:
-                    break
-
-                if self.player_char_id in stubborn:
-                    target = self.player_char_id
-                    player_targeted = True
-                else:
-                    target = random.choice(stubborn)
-
-                stubborn.remove(target)
-                question = pm.get_scene_prompt(
-                    "persuade_target",
-                    target_name=target,
-                    attempt=attempt + 1,
-                )
-                res = black_heir.answer(question=question)
-                self._add_event(
-                    "persuasion_detail",
-                    persuader_id=black_heir_id,
-                    persuader_name=char_names.get(black_heir_id, black_heir_id),
-                    target_id=target,
-                    target_name=char_names.get(target, target),
-                    message=res,
-                )
-
-            # AI 顽固者重新决策并记录回复
-            for char_id in list(stubborn):
-                if char_id == self.player_char_id:
-                    continue
-                heir = self.heirs[char_id]
-                question = pm.get_scene_prompt(
-                    "reconsider",
-                    name=heir.name,
-                    path=heir.path,
-                    drive=heir.drive,
-                    profile=heir.profile,
-                    memory=heir.memory,
-                    attempt=attempt + 1,
-                )
-                res = heir.make_decision(question=question)
-                decision = stage.decode_decision_from_memory(char_id, heir.memory[-1])
-                self._add_event(
-                    "handover_redecision",
-                    char_id=char_id,
-                    char_name=char_names.get(char_id, char_id),
-                    decision=decision,
-                    decision_text="改变主意，交出火种" if decision == "1" else "仍然拒绝",
-                    message=res,
-                )
-                if decision == "1":
-                    self.fire_chasers_dict[char_id] = "逐火_交出火种"
-
-        if player_targeted and self.fire_chasers_dict.get(self.player_char_id) == "逐火_不交出火种":
+        if (self.player_char_id in self.state.targeted
+                and self.fire_chasers_dict.get(self.player_char_id) == "逐火_不交出火种"):
             # 玩家需要二次决策
+            pm = get_prompt_manager()
+            char_names = pm.get_character_names()
             player_heir = self._get_player_heir()
             question = pm.get_scene_prompt(
                 "player_handover_decision",
@@ -888,51 +966,6 @@ class GameSession:
             self._run_robbery_and_collect()
             self.stage = "round_end"
 
-    def _collect_memories(self):
-        """盗火行者收集火种记忆"""
-        for black_heir in self.black_heirs.values():
-            for char_id, status in self.fire_chasers_dict.items():
-                if status in ["逐火_交出火种", "逐火_火种被强夺"]:
-                    for memory in self.heirs[char_id].memory:
-                        black_heir.memory.append(memory)
-                elif status == "不逐火":
-                    if self.heirs[char_id].memory:
-                        black_heir.memory.append(self.heirs[char_id].memory[0])
-
-            if self.robbed_characters:
-                black_heir.memory.append(
-                    f"被强夺火种的角色：{self.robbed_characters}，这些角色因被强夺火种受伤甚至死亡"
-                )
-
-
-def extract_reason_from_message(message: str) -> str:
-    """从消息中提取 reason 字段，兼容 JSON 和 markdown code block"""
-    if not message or not isinstance(message, str):
-        return ""
-    message = message.strip()
-
-    # 去除 markdown 代码块标记
-    if message.startswith("```"):
-        lines = message.splitlines()
-        if len(lines) > 2:
-            message = "\n".join(lines[1:-1]).strip()
-        else:
-            message = message.replace("```", "").strip()
-
-    if 'reason' in message:
-        try:
-            import re
-            pattern = r"['\"]reason['\"]\s*:\s*['\"](.+?)['\"](?:,|\})"
-            match = re.search(pattern, message, re.DOTALL)
-            if match:
-                return match.group(1).strip()
-            data = json.loads(message)
-            if isinstance(data, dict) and 'reason' in data:
-                return str(data['reason']).strip()
-        except Exception:
-            pass
-    return ""
-
 
 # ===================================================================
 # 命令行演示：直接运行 python main/interactive_game.py 即可体验
@@ -1048,7 +1081,7 @@ if __name__ == "__main__":
                 print(event["message"])
             elif event["type"] == "handover_redecision" and not event.get("is_player"):
                 print(f"\n[{event['char_name']}] 回应: {event['decision_text']}")
-                print(f"  理由: {extract_reason_from_message(event['message'])}")
+                print(f"  理由: {extract_reason(event['message'])}")
 
         re_handover_questions = [e for e in state["events"] if e["type"] == "handover_question" and e.get("is_re_decision")]
         if re_handover_questions:
@@ -0,0 +1,255 @@
+"""
+jobs.py - 后台模拟任务队列
+
+/api/run_game 在 HTTP 请求内运行模拟：无法排队、无法限制同时运行的数量，
+客户端断开后结果也随之丢失。本模块把一次模拟作为一个任务在后台运行：
+
+    - 提交运行参数得到 job_id，任务进入队列，由固定数量的工作线程依次执行
+    - 任务产生的全部事件保存在内存中，客户端可以随时增量拉取或订阅，断开后也能取回
+    - 排队中的任务取消后不再运行；运行中的任务通过 CancelToken 取消，尚未发出的模型调用不再进行
+    - 可选的 max_concurrent_calls 限制全部任务合计的在途模型请求数，
+      批量运行只占用提供商并发的一部分，不会挤占交互式玩家
+
+配置方式二选一：
+    - 环境变量 AMPHOREUS_JOB_WORKERS（同时运行的任务数，默认 2）、
+      AMPHOREUS_JOB_MAX_CALLS（任务合计的在途请求上限，默认不限制）
+    - 代码中直接创建 JobQueue(...)
+
+用法:
+    from jobs import JobQueue
+
+    queue = JobQueue(max_concurrent_jobs=2, max_concurrent_calls=4)
+    job = queue.submit(rounds=6, seed=1)
+    ...
+    print(job.status, len(job.events))
+    queue.cancel(job.job_id)
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import fast_json
+from cancellation import CancelToken, Cancelled, use_token
+from config.api_config import use_call_owner, use_request_limiter
+from run_stats import logger
+
+
+JOB_STATUSES = ("queued", "running", "completed", "failed", "cancelled")
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+
+class JobNotFound(ValueError):
+    """任务不存在，或已结束并被丢弃（见 JobQueue 的 max_finished_jobs）"""
+
+
+class Job:
+    """
+    一个后台模拟任务
+
+    Attributes:
+        job_id: 任务 ID
+        options: 传给 eternal_regression_realtime_streaming 的参数
+        status: queued / running / completed / failed / cancelled
+        events: 已产生的事件（只追加）
+        error: 失败时的错误信息
+        owner: 提交任务的调用方（例如客户端地址），任务的模型调用计入其负载
+    """
+
+    def __init__(self, options: dict, owner: str = None):
+        self.job_id = str(uuid.uuid4())
+        self.options = options
+        self.owner = owner
+        self.status = "queued"
+        self.events: list = []
+        # 事件添加时编码一次，推送与查询直接拼接编码结果
+        self._encoded_events: list = []
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.token = CancelToken()
+        self.future = None
+        # 状态变化监听器（推送流），在任务线程中调用
+        self._listeners: list = []
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def add_listener(self, callback):
+        """注册变化回调 callback()；回调在任务线程中执行，应尽快返回"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self):
+        for callback in list(self._listeners):
+            callback()
+
+    def _add_event(self, event: dict):
+        self._encoded_events.append(fast_json.dumps(event))
+        self.events.append(event)
+        self._notify()
+
+    def encoded_events(self, start: int, stop: int = None) -> list:
+        """第 start 到 stop 个事件的 JSON 编码（bytes 列表）"""
+        return self._encoded_events[start:stop]
+
+    def _set_status(self, status: str, error: str = None):
+        if status == "running":
+            self.started_at = time.time()
+        elif status in FINISHED_STATUSES:
+            self.finished_at = time.time()
+        self.error = error
+        self.status = status
+        self._notify()
+
+    def summary(self) -> dict:
+        """任务状态摘要（不含事件）"""
+        rounds_completed = sum(1 for event in self.events if event.get("type") == "round_end")
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "options": self.options,
+            "rounds_completed": rounds_completed,
+            "events_total": len(self.events),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    有界工作线程池上的任务队列（线程安全）
+
+    Args:
+        max_concurrent_jobs: 同时运行的任务数，其余任务排队
+        max_concurrent_calls: 全部任务合计的在途模型请求上限，None 表示不限制
+        max_finished_jobs: 保留的已结束任务数，超出时丢弃最早结束的任务
+        on_event: 可选的 on_event(job, event)，每产生一个事件时在任务线程中调用
+    """
+
+    def __init__(self, max_concurrent_jobs: int = 2, max_concurrent_calls: int = None,
+                 max_finished_jobs: int = 100, on_event=None):
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_finished_jobs = max_finished_jobs
+        self.on_event = on_event
+        self._limiter = threading.BoundedSemaphore(max_concurrent_calls) if max_concurrent_calls else None
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+    def submit(self, rounds: int, max_persuasion_attempts: int = 3, seed: int = None,
+               temperature: float = None, scheduler: str = "thread", max_workers: int = 4,
+               owner: str = None) -> Job:
+        """提交一次模拟，立即返回排队中的任务；owner 为提交任务的调用方"""
+        job = Job({
+            "rounds": rounds,
+            "max_persuasion_attempts": max_persuasion_attempts,
+            "seed": seed,
+            "temperature": temperature,
+            "scheduler": scheduler,
+            "max_workers": max_workers,
+        }, owner=owner)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._discard_finished()
+        job.future = self._executor.submit(self._run, job)
+        logger.info("任务 %s 已提交：%d 轮", job.job_id, rounds)
+        return job
+
+    def get(self, job_id: str) -> Job:
+        """取出任务；不存在时抛出 JobNotFound"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise JobNotFound(f"未找到任务: {job_id}")
+        return job
+
+    def jobs(self) -> list:
+        """全部任务，按提交先后排列"""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def counts(self) -> dict:
+        """各状态的任务数"""
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        for job in self.jobs():
+            counts[job.status] += 1
+        return counts
+
+    def cancel(self, job_id: str) -> Job:
+        """取消任务：排队中的不再运行，运行中的在下一次模型调用前后停止"""
+        job = self.get(job_id)
+        if job.done:
+            return job
+        job.token.cancel()
+        if job.future is not None and job.future.cancel():
+            job._set_status("cancelled")
+        logger.info("任务 %s 已取消", job_id)
+        return job
+
+    def _discard_finished(self):
+        """丢弃最早结束的任务，使已结束任务数不超过上限（调用方持有锁）"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: Job):
+        """在工作线程中运行任务"""
+        from main import eternal_regression_realtime_streaming
+
+        if job.token.cancelled:
+            job._set_status("cancelled")
+            return
+        job._set_status("running")
+        try:
+            with use_token(job.token), use_request_limiter(self._limiter), use_call_owner(job.owner):
+                for event in eternal_regression_realtime_streaming(**job.options):
+                    job._add_event(event)
+                    if self.on_event is not None:
+                        self.on_event(job, event)
+        except Cancelled:
+            job._set_status("cancelled")
+        except Exception as e:
+            logger.warning("任务 %s 失败: %s", job.job_id, e)
+            job._set_status("failed", error=str(e))
+        else:
+            job._set_status("completed")
+
+    def shutdown(self, cancel: bool = True):
+        """停止队列：默认取消全部未结束的任务，并等待工作线程退出"""
+        if cancel:
+            for job in self.jobs():
+                if not job.done:
+                    self.cancel(job.job_id)
+        self._executor.shutdown(wait=True)
+
+
+def queue_from_env(**kwargs) -> JobQueue:
+    """按环境变量创建任务队列，其余参数原样传给 JobQueue"""
+    max_calls = int(os.getenv("AMPHOREUS_JOB_MAX_CALLS", "0"))
+    return JobQueue(
+        max_concurrent_jobs=int(os.getenv("AMPHOREUS_JOB_WORKERS", "2")),
+        max_concurrent_calls=max_calls or None,
+        **kwargs,
+    )
+
+
+if __name__ == "__main__":
+    # 提交 3 个任务，最多 2 个同时运行，取消最后一个
+    queue = JobQueue(max_concurrent_jobs=2, max_concurrent_calls=4)
+    jobs = [queue.submit(rounds=1, seed=seed) for seed in range(3)]
+    queue.cancel(jobs[-1].job_id)
+    queue.shutdown(cancel=False)
+    for job in jobs:
+        summary = job.summary()
+        print(f">>> 任务 {job.job_id[:8]}: {summary['status']}，{summary['events_total']} 个事件")
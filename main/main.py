@@ -2,11 +2,19 @@
 # import agent
 
 import json
+import random
 
 from prompt_manager import get_prompt_manager
+from run_stats import get_reporter, get_run_stats, logger
+from outcome_store import OutcomeStore
+from trend_analysis import analyze_trends
+import tracing
 
 
-def eternal_regression(rounds: int, max_persuasion_attempts: int = 3):
+def eternal_regression(rounds: int, max_persuasion_attempts: int = 3, max_workers: int = 1, backend: str = "thread",
+                       scheduler: str = "sequential", headless: bool = False, seed: int = None,
+                       temperature: float = None, stop_rule=None, on_round=None, checkpoints: dict = None,
+                       start=None, store: OutcomeStore = None):
     import stage
     import agent
     """
@@ -22,6 +30,22 @@ def eternal_regression(rounds: int, max_persuasion_attempts: int = 3):
     Args:
         rounds (int): 迭代次数，决定永劫回归的轮数
         max_persuasion_attempts (int): 每轮中盗火行者劝说顽固者的最大尝试次数，默认为3次
+        max_workers (int): 同一阶段内并发决策的最大数量，默认为1（顺序执行）
+        backend (str): 并发后端，"thread" 或 "asyncio"
+        scheduler (str): 回合调度方式，"sequential" 顺序执行，"graph" 按依赖图并行执行互不依赖的步骤
+        headless (bool): 无界面模式，过程输出走 logging（DEBUG），每轮只以 INFO 记录一行累计计数
+        seed (int): 随机种子，固定劝说目标的选择并作为采样种子传给模型；
+                    配合 completion_cache 的回放模式可逐字复现一次运行
+        temperature (float): 覆盖模型采样温度
+        stop_rule (ConvergenceMonitor): 可选的提前停止规则；每轮结束时调用 update(final_result)，
+                    返回 True 即停止。停止原因与轮次见 stop_rule.report()
+        on_round (callable): 可选的每轮回调 on_round(round_num, final_result, robbed_list)，
+                    在本轮结果写入日志后立即调用（多进程运行时用于把结果实时传回父进程）
+        checkpoints (dict): 提供时每轮结束后写入 {轮次: WorldCheckpoint}，用于之后从该轮分叉（见 branching.py）；
+                    检查点只冻结本轮新增的记忆，不复制已有记忆
+        start (WorldCheckpoint): 从检查点继续运行，rounds 仍表示总轮数；未指定 seed / temperature 时沿用检查点的设置
+        store (OutcomeStore): 可选的列式结局存储，提供时每轮结果同时追加到其中（检查点之前的轮次不重复写入）；
+                    不提供时内部新建一个，只用于统计
 
     Returns:
         dict: 记录每轮迭代结果的日志字典
@@ -34,86 +58,131 @@ def eternal_regression(rounds: int, max_persuasion_attempts: int = 3):
         >>> print(logs['第1次永劫回归'][0])  # 查看第1轮的火种收集结果
         >>> print(logs['第1次永劫回归'][1])  # 查看第1轮被强夺的角色
     """
-    round_num = 0
-
-    # 盗火行者可以跨迭代，记忆不断累积
-    # 每轮迭代后，他们的记忆会包含之前所有轮次的信息
-    black_heirs = agent.init_black_heir()
-
-    # 总记录字典，用于追踪每轮迭代的完整结果
-    logs_dict = {}
-
-    print(f"=== 开始永劫回归测试，共 {rounds} 轮迭代 ===")
-    print("=" * 60)
+    from branching import WorldCheckpoint
+
+    if start is None:
+        round_num = 0
+
+        # 盗火行者可以跨迭代，记忆不断累积
+        # 每轮迭代后，他们的记忆会包含之前所有轮次的信息
+        black_heirs = agent.init_black_heir(temperature=temperature, seed=seed)
+        # 整次运行共用一个随机数生成器，保证同一 seed 下每轮的随机选择一致
+        rng = random.Random(seed)
+
+        # 总记录字典，用于追踪每轮迭代的完整结果
+        logs_dict = {}
+    else:
+        # 从检查点继续：记忆与检查点共享，随机数生成器恢复到检查点时的状态
+        round_num = start.round_num
+        rng = start.restore_rng() if seed is None or seed == start.seed else random.Random(seed)
+        seed = start.seed if seed is None else seed
+        temperature = start.temperature if temperature is None else temperature
+        black_heirs = start.restore_black_heirs(temperature=temperature, seed=seed)
+        logs_dict = dict(start.logs)
+
+    if store is None:
+        store = OutcomeStore()
+
+    out = get_reporter(headless)
+    stats = get_run_stats()
+    # 从检查点继续时（例如多个分支同时运行）不清零，计数累加到同一次运行中
+    if start is None:
+        stats.reset()
+
+    out("=== 开始永劫回归测试，共 %d 轮迭代 ===", rounds)
+    out("=" * 60)
+
+    # 整次运行记录为一个 run span，每轮的 round span 挂在其下
+    run_span = tracing.start_span("run", engine="batch", rounds=rounds, start_round=round_num + 1)
 
     # 主循环：执行指定轮数的永劫回归
     while round_num < rounds:
         round_num += 1
-        print(f"\n>>> [第 {round_num} 轮永劫回归开始]")
-        print("-" * 40)
+        out("\n>>> [第 %d 轮永劫回归开始]", round_num)
+        out("-" * 40)
 
         # 执行一轮完整的迭代
         # 每轮迭代都会更新盗火行者的记忆
-        final_result, robbed_list = stage.run_one_iteration(
-            black_heirs=black_heirs,
-            max_persuasion_attempts=max_persuasion_attempts
-        )
+        persuaded_at = {}
+        with tracing.use_span(run_span):
+            final_result, robbed_list = stage.run_one_iteration(
+                black_heirs=black_heirs,
+                max_persuasion_attempts=max_persuasion_attempts,
+                max_workers=max_workers,
+                backend=backend,
+                scheduler=scheduler,
+                headless=headless,
+                rng=rng,
+                seed=seed,
+                temperature=temperature,
+                persuaded_at=persuaded_at,
+            )
 
         # 记录本轮迭代的结果
         logs_dict[f'第{round_num}次永劫回归'] = (final_result, robbed_list)
-
-        # 显示本轮迭代的统计信息
-        total_fire_chasers = len([s for s in final_result.values() if '逐火' in s])
-        willing_handovers = len([s for s in final_result.values() if '交出火种' in s])
-        forced_robberies = len([s for s in final_result.values() if '火种被强夺' in s])
-
-        print(f"\n>>> [第 {round_num} 轮统计]")
-        print(f"   逐火者总数: {total_fire_chasers}")
-        print(f"   主动交出火种: {willing_handovers}")
-        print(f"   被强夺火种: {forced_robberies}")
-        print(f"   不逐火者: {total_fire_chasers-willing_handovers-forced_robberies}")
+        store.append(final_result, robbed_list, round_num=round_num, persuaded_at=persuaded_at,
+                     memory_chars=sum(black_heir.memory.total_chars for black_heir in black_heirs.values()))
+        if on_round is not None:
+            on_round(round_num, final_result, robbed_list)
+        if checkpoints is not None:
+            checkpoints[round_num] = WorldCheckpoint.capture(round_num, black_heirs, rng, logs_dict,
+                                                             seed=seed, temperature=temperature)
+
+        # 显示本轮迭代的统计信息（对结局矩阵的最后一行计数）
+        counts = store.round_summary(-1)
+        out("\n>>> [第 %d 轮统计]", round_num)
+        for label, value in counts.items():
+            out("   %s: %d", label, value)
 
         # 显示盗火行者的记忆累积情况
         for black_heir_name, black_heir in black_heirs.items():
-            print(f"   {black_heir_name} 记忆条数: {len(black_heir.memory)}")
+            out("   %s 记忆条数: %d，字符数: %d", black_heir_name, len(black_heir.memory),
+                black_heir.memory.total_chars)
+
+        if headless:
+            logger.info("第 %d 轮完成: %s", round_num, stats.snapshot())
+
+        # 结局分布已收敛则提前结束
+        if stop_rule is not None and stop_rule.update(final_result):
+            break
+
+    if stop_rule is not None:
+        stop_rule.finish(round_num)
+        run_span.set(stopped_round=stop_rule.stopped_round, converged=stop_rule.converged)
+        out("\n>>> 停止于第 %d 轮：%s", stop_rule.stopped_round, stop_rule.reason)
+        logger.info("eternal_regression 停止于第 %d 轮：%s", stop_rule.stopped_round, stop_rule.reason)
 
-    print(f"\n>>> 永劫回归测试完成！共执行 {rounds} 轮迭代")
-    print("=" * 60)
+    run_span.end()
+    out("\n>>> 永劫回归测试完成！共执行 %d 轮迭代", round_num)
+    out("=" * 60)
 
     return logs_dict
 
 
-def analyze_regression_logs(logs_dict: dict):
+def analyze_regression_logs(logs_dict):
     """
     分析永劫回归日志，提供统计洞察
 
     Args:
-        logs_dict (dict): 永劫回归函数返回的日志字典
+        logs_dict (dict | OutcomeStore): 永劫回归函数返回的日志字典，或一次运行的 OutcomeStore
 
     Returns:
         dict: 分析结果
     """
+    store = logs_dict if isinstance(logs_dict, OutcomeStore) else OutcomeStore.from_logs_dict(logs_dict)
+
     analysis = {
-        '总轮数': len(logs_dict),
+        '总轮数': len(store),
         '每轮统计': {},
-        '趋势分析': {}
+        '趋势分析': analyze_trends(store)
     }
 
-    for round_key, (final_result, robbed_list) in logs_dict.items():
-        round_num = round_key.replace('第', '').replace('次永劫回归', '')
-
-        # 统计每轮的关键指标
-        total_fire_chasers = len([s for s in final_result.values() if '逐火' in s])
-        willing_handovers = len([s for s in final_result.values() if '交出火种' in s])
-        forced_robberies = len([s for s in final_result.values() if '火种被强夺' in s])
-
-        analysis['每轮统计'][round_num] = {
-            '逐火者总数': total_fire_chasers,
-            '主动交出火种': willing_handovers,
-            '被强夺火种': forced_robberies,
-            '不逐火者': total_fire_chasers-willing_handovers-forced_robberies,
-            '被强夺角色': robbed_list
-        }
+    # 所有轮的关键指标一次算出，再按轮拆分
+    summary = store.summary()
+    for row, round_num in enumerate(store.round_nums):
+        round_stats = {label: int(values[row]) for label, values in summary.items()}
+        round_stats['被强夺角色'] = store.robbed_list(row)
+        analysis['每轮统计'][str(round_num)] = round_stats
 
     return analysis
 
@@ -131,7 +200,25 @@ def get_visualization_data(logs_dict):
     return visualization_data
 
 
-def eternal_regression_realtime_streaming(rounds: int, max_persuasion_attempts: int = 3):
+def _iter_in_span(events, span):
+    """
+    逐个取出生成器的事件，取值期间把 span 设为当前 span
+
+    生成器在 yield 处挂起时上下文不能停留在 span 中，因此只在 next() 期间
+    （即阶段内的阻塞调用期间）激活 span。
+    """
+    while True:
+        with tracing.use_span(span):
+            try:
+                event = next(events)
+            except StopIteration:
+                return
+        yield event
+
+
+def eternal_regression_realtime_streaming(rounds: int, max_persuasion_attempts: int = 3, seed: int = None,
+                                          temperature: float = None, scheduler: str = "sync",
+                                          max_workers: int = 4):
     """
     永劫回归测试函数 - 实时流式版本（细粒度事件）
 
@@ -140,268 +227,86 @@ def eternal_regression_realtime_streaming(rounds: int, max_persuasion_attempts:
     Args:
         rounds (int): 迭代次数
         max_persuasion_attempts (int): 每轮中盗火行者劝说顽固者的最大尝试次数，默认为3次
+        seed (int): 随机种子，用法同 eternal_regression
+        temperature (float): 覆盖模型采样温度
+        scheduler (str): 阶段内决策的调度方式，"sync" 逐个调用并立即产生事件，
+                         "thread" / "asyncio" 并发调用
+        max_workers (int): 并发调度时的最大并发数
 
     Yields:
         dict: 事件字典，格式为 {'type': 'oracle'|'decision'|'persuasion'|'result', ...}
     """
-    import stage
-    import agent
+    from engine import SimulationEngine, Event
     import logging
-    import random
 
-    pm = get_prompt_manager()
     logger = logging.getLogger(__name__)
-    logger.info("=" * 60)
     logger.info("Starting eternal_regression_realtime_streaming with %s rounds", rounds)
 
-    round_num = 0
-    logger.info("Initializing black_heirs")
-    black_heirs = agent.init_black_heir()
-    logger.info("Initializing heirs")
+    engine = SimulationEngine(scheduler=scheduler, max_workers=max_workers, seed=seed, temperature=temperature)
 
-    # 初始化黄金裔
-    heirs = agent.init_chrysos_heir()
-    logger.info("Heirs initialized, count = %s", len(heirs))
+    yield Event("start", rounds=rounds).to_dict()
 
-    logger.info("Yielding start event")
-    yield {
-        'type': 'start',
-        'rounds': rounds
-    }
+    # 整次运行一个 run span，每轮一个 round span，每个阶段一个 phase span
+    run_span = tracing.start_span("run", engine="streaming", rounds=rounds, scheduler=scheduler)
+    open_spans = [run_span]
+    state = None
 
-    # 主循环
-    while round_num < rounds:
-        round_num += 1
-        logger.info("Starting round %s", round_num)
+    try:
+        for round_num in range(1, rounds + 1):
+            logger.info("Starting round %s", round_num)
+            round_span = tracing.start_span("round", parent=run_span, engine="streaming", round_num=round_num)
+            open_spans.append(round_span)
 
-        logger.info("Yielding round_start event")
-        yield {
-            'type': 'round_start',
-            'round_num': round_num
-        }
+            yield Event("round_start", round_num=round_num).to_dict()
 
-        # === 阶段1：神谕 ===
-        logger.info("Getting oracle from HapLotes405")
-        oracle_question = pm.get_scene_prompt("oracle")
-        oracle = heirs['HapLotes405'].answer(oracle_question)
-        logger.info("Got oracle, length = %s", len(oracle))
-
-        logger.info("Yielding oracle event")
-        yield {
-            'type': 'oracle',
-            'char_id': 'HapLotes405',
-            'char_name': '缇宝',
-            'message': oracle
-        }
+            with tracing.use_span(round_span):
+                state = engine.new_round(round_num)
+            for phase_name, phase in engine.round_phases(state, max_persuasion_attempts):
+                phase_span = tracing.start_span("phase", parent=round_span, phase=phase_name)
+                open_spans.append(phase_span)
+                for event in _iter_in_span(phase(), phase_span):
+                    yield event.to_dict()
+                phase_span.end()
 
-        # === 阶段2：众人逐火决策 ===
-        logger.info("Starting fire decisions")
-        for char_id, heir in heirs.items():
-            # 缇宝是神谕发布者，天然逐火，不参与决策
-            if char_id == 'HapLotes405':
-                logger.info("Skipping fire decision for oracle bearer %s", char_id)
-                continue
-
-            logger.info("Getting decision from %s", char_id)
-            question = pm.get_scene_prompt(
-                "fire_decision",
-                name=heir.name,
-                path=heir.path,
-                drive=heir.drive,
-                profile=heir.profile,
-                memory=heir.memory,
-                oracle=oracle,
-            )
-            res = heir.make_decision(question=question)
-
-            # 解析决策
-            logger.info("Decoding decision for %s", char_id)
-            decision = stage.decode_decision_from_memory(char_id, heir.memory[-1])
-            logger.info("Decision for %s: %s", char_id, decision)
-
-            logger.info("Yielding fire_decision event for %s", char_id)
-            yield {
-                'type': 'fire_decision',
-                'char_id': char_id,
-                'char_name': agent.CHARACTER_NAMES.get(char_id, char_id) if hasattr(agent, 'CHARACTER_NAMES') else char_id,
-                'decision': decision,
-                'message': res
-            }
-
-        # 记录逐火结果
-        fire_chasers_dict = {}
-        for char_id, heir in heirs.items():
-            if char_id == 'HapLotes405':
-                fire_chasers_dict[char_id] = '逐火'
-                continue
-            decision = stage.decode_decision_from_memory(char_id, heir.memory[-1])
-            if decision == '1':
-                fire_chasers_dict[char_id] = '逐火'
-            else:
-                fire_chasers_dict[char_id] = '不逐火'
+            round_span.set(robbed=len(state.robbed))
+            round_span.end()
 
-        yield {
-            'type': 'fire_result',
-            'result': fire_chasers_dict
-        }
+        yield Event("complete", total_rounds=rounds).to_dict()
+    finally:
+        # 正常结束、被取消或消费方提前关闭生成器时，结束所有仍未结束的 span 并释放角色的连接
+        for span in reversed(open_spans):
+            span.end()
+        engine.close(state)
 
-        # 缇宝作为神谕发布者，确保记忆中有逐火决策，以便参与交火种决策
-        tribbie_fire_memory = json.dumps({
-            'decision': '1',
-            'reason': '我是神谕的传递者，自然响应逐火之路。'
-        }, ensure_ascii=False)
-        heirs['HapLotes405'].memory.append(tribbie_fire_memory)
-
-        # === 阶段3：盗火行者劝说 ===
-        black_heir_word = ""
-        for char_id, heir in black_heirs.items():
-            question = pm.get_scene_prompt("black_heir_persuade")
-            black_heir_word = heir.answer(question=question)
-            yield {
-                'type': 'persuasion',
-                'char_id': char_id,
-                'char_name': '盗火行者·白厄',
-                'message': black_heir_word
-            }
-
-        # === 阶段4：是否交出火种 ===
-        for char_id, heir in heirs.items():
-            if fire_chasers_dict[char_id] == '逐火':
-                question = pm.get_scene_prompt(
-                    "handover_decision",
-                    name=heir.name,
-                    path=heir.path,
-                    drive=heir.drive,
-                    profile=heir.profile,
-                    memory=heir.memory,
-                    black_heir_word=black_heir_word,
-                )
-                res = heir.make_decision(question=question)
-                decision = stage.decode_decision_from_memory(char_id, heir.memory[-1])
-
-                yield {
-                    'type': 'handover_decision',
-                    'char_id': char_id,
-                    'char_name': agent.CHARACTER_NAMES.get(char_id, char_id) if hasattr(agent, 'CHARACTER_NAMES') else char_id,
-                    'decision': decision,
-                    'message': res
-                }
-
-        # 更新结果
-        for char_id, heir in heirs.items():
-            if fire_chasers_dict[char_id] == '逐火':
-                decision = stage.decode_decision_from_memory(char_id, heir.memory[-1])
-                if decision == '1':
-                    fire_chasers_dict[char_id] += '_交出火种'
-                else:
-                    fire_chasers_dict[char_id] += '_不交出火种'
-
-        yield {
-            'type': 'handover_result',
-            'result': fire_chasers_dict
-        }
 
-        # === 阶段5：劝说顽固者 ===
-        robbed_characters = []
-        for attempt in range(max_persuasion_attempts):
-            stubborn_fire_chasers = [name for name, status in fire_chasers_dict.items()
-                                    if status == '逐火_不交出火种']
-
-            if not stubborn_fire_chasers:
-                break
-
-            yield {
-                'type': 'persuasion_attempt',
-                'attempt': attempt + 1,
-                'targets': stubborn_fire_chasers
-            }
-
-            # 盗火行者劝说
-            for char_id, heir in black_heirs.items():
-                if stubborn_fire_chasers:
-                    target_name = random.choice(stubborn_fire_chasers)
-                    stubborn_fire_chasers.remove(target_name)
-
-                    question = pm.get_scene_prompt(
-                        "persuade_target",
-                        target_name=target_name,
-                        attempt=attempt + 1,
-                    )
-                    res = heir.answer(question=question)
-                    yield {
-                        'type': 'persuasion_detail',
-                        'persuader_id': char_id,
-                        'persuader_name': '盗火行者·白厄',
-                        'target_id': target_name,
-                        'target_name': agent.CHARACTER_NAMES.get(target_name, target_name) if hasattr(agent, 'CHARACTER_NAMES') else target_name,
-                        'message': res
-                    }
-
-            # 重新决策
-            for char_id in [n for n, status in fire_chasers_dict.items() if status == '逐火_不交出火种']:
-                heir = heirs[char_id]
-                question = pm.get_scene_prompt(
-                    "reconsider",
-                    name=heir.name,
-                    path=heir.path,
-                    drive=heir.drive,
-                    profile=heir.profile,
-                    memory=heir.memory,
-                    attempt=attempt + 1,
-                )
-                res = heir.make_decision(question=question)
-                decision = stage.decode_decision_from_memory(char_id, heir.memory[-1])
-
-                yield {
-                    'type': 'handover_redecision',
-                    'char_id': char_id,
-                    'char_name': agent.CHARACTER_NAMES.get(char_id, char_id) if hasattr(agent, 'CHARACTER_NAMES') else char_id,
-                    'decision': decision,
-                    'message': res
-                }
-
-            # 更新状态
-            for char_id, heir in heirs.items():
-                if fire_chasers_dict[char_id] == '逐火_不交出火种':
-                    decision = stage.decode_decision_from_memory(char_id, heir.memory[-1])
-                    if decision == '1':
-                        fire_chasers_dict[char_id] = '逐火_交出火种'
-
-        # === 阶段6：强夺火种 ===
-        for char_id, status in fire_chasers_dict.items():
-            if status == '逐火_不交出火种':
-                fire_chasers_dict[char_id] = '逐火_火种被强夺'
-                robbed_characters.append(char_id)
-                yield {
-                    'type': 'robbery',
-                    'char_id': char_id,
-                    'char_name': agent.CHARACTER_NAMES.get(char_id, char_id) if hasattr(agent, 'CHARACTER_NAMES') else char_id
-                }
-
-        # === 阶段7：承载记忆 ===
-        for black_heir_id, black_heir in black_heirs.items():
-            for char_id, status in fire_chasers_dict.items():
-                if status in ['逐火_交出火种', '逐火_火种被强夺']:
-                    for memory in heirs[char_id].memory:
-                        black_heir.memory.append(memory)
-                elif status == '不逐火':
-                    if heirs[char_id].memory:
-                        black_heir.memory.append(heirs[char_id].memory[0])
-
-            black_heir.memory.append(f"被强夺火种的角色：{robbed_characters}，这些角色因被强夺火种受伤甚至死亡")
-
-        yield {
-            'type': 'round_end',
-            'round_num': round_num,
-            'final_result': fire_chasers_dict,
-            'robbed_characters': robbed_characters,
-            'memory_count': {bid: len(heir.memory) for bid, heir in black_heirs.items()}
-        }
+async def eternal_regression_realtime_streaming_async(rounds: int, max_persuasion_attempts: int = 3,
+                                                seed: int = None, temperature: float = None,
+                                                scheduler: str = "thread", max_workers: int = 4):
+    """
+    永劫回归测试函数 - 实时流式版本的异步生成器
 
-    yield {
-        'type': 'complete',
-        'total_rounds': rounds
-    }
+    事件与 eternal_regression_realtime_streaming 完全相同，但每一步都在线程中推进，
+    LLM 请求期间事件循环可以继续服务其他请求，一个服务进程即可同时推送多路流。
+    默认 scheduler 为 "thread"：同一阶段的调用并发进行，每个调用完成即产生事件
+    （本地无法解析、需要模型兜底解析的决策在该阶段所有调用完成后产生）。
+
+    参数同 eternal_regression_realtime_streaming。
+
+    Yields:
+        dict: 事件字典
+    """
+    from parallel import iterate_in_thread
+
+    events = eternal_regression_realtime_streaming(
+        rounds=rounds,
+        max_persuasion_attempts=max_persuasion_attempts,
+        seed=seed,
+        temperature=temperature,
+        scheduler=scheduler,
+        max_workers=max_workers,
+    )
+    async for event in iterate_in_thread(events):
+        yield event
 
 
 if __name__ == "__main__":
@@ -0,0 +1,243 @@
+"""
+memory.py - 角色记忆容器
+
+MemoryList 是 list 的子类，行为与普通列表一致（repr、JSON 序列化、下标访问都不变，
+因此提示词中的 {memory} 渲染结果不受影响），额外在写入时增量维护 total_chars，
+并把新增条数与字符数计入 run_stats，避免每轮重新遍历全部记忆统计大小。
+
+PersistentMemory 用于跨轮累积的盗火行者记忆：内容相同，但可以在任意轮次打快照，
+并从快照派生共享前缀的分支（见 branching.py），无需深拷贝整条记忆。
+"""
+
+from run_stats import get_run_stats
+
+
+def _chars(item) -> int:
+    return len(str(item))
+
+
+class MemoryList(list):
+    """带字符数统计的记忆列表"""
+
+    def __init__(self, iterable=()):
+        super().__init__(iterable)
+        self.total_chars = sum(_chars(item) for item in self)
+
+    def append(self, item):
+        super().append(item)
+        n = _chars(item)
+        self.total_chars += n
+        get_run_stats().record_memory(1, n)
+
+    def extend(self, items):
+        items = list(items)
+        super().extend(items)
+        n = sum(_chars(item) for item in items)
+        self.total_chars += n
+        get_run_stats().record_memory(len(items), n)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def insert(self, index, item):
+        super().insert(index, item)
+        n = _chars(item)
+        self.total_chars += n
+        get_run_stats().record_memory(1, n)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            removed = sum(_chars(item) for item in self[index])
+            added = sum(_chars(item) for item in value)
+        else:
+            removed = _chars(self[index])
+            added = _chars(value)
+        super().__setitem__(index, value)
+        self.total_chars += added - removed
+
+    def __delitem__(self, index):
+        items = self[index] if isinstance(index, slice) else [self[index]]
+        super().__delitem__(index)
+        self.total_chars -= sum(_chars(item) for item in items)
+
+    def pop(self, index=-1):
+        item = super().pop(index)
+        self.total_chars -= _chars(item)
+        return item
+
+    def remove(self, value):
+        super().remove(value)
+        self.total_chars -= _chars(value)
+
+    def clear(self):
+        super().clear()
+        self.total_chars = 0
+
+
+class _Segment:
+    """冻结的记忆片段：不可变，可以被多个分支同时引用"""
+
+    __slots__ = ("parent", "items", "chars", "length", "total_chars")
+
+    def __init__(self, parent, items: tuple, chars: int):
+        self.parent = parent
+        self.items = items
+        self.chars = chars
+        self.length = (parent.length if parent else 0) + len(items)
+        self.total_chars = (parent.total_chars if parent else 0) + chars
+
+    @property
+    def start(self) -> int:
+        """本片段第一条记忆在整条记忆中的下标"""
+        return self.length - len(self.items)
+
+
+def _chain(segment) -> list:
+    """从最早到最新排列的片段链"""
+    chain = []
+    while segment is not None:
+        chain.append(segment)
+        segment = segment.parent
+    chain.reverse()
+    return chain
+
+
+class MemorySnapshot:
+    """PersistentMemory 在某一时刻的不可变快照，可以从它派生任意多个分支"""
+
+    __slots__ = ("segment",)
+
+    def __init__(self, segment=None):
+        self.segment = segment
+
+    def __len__(self):
+        return self.segment.length if self.segment else 0
+
+    @property
+    def total_chars(self) -> int:
+        return self.segment.total_chars if self.segment else 0
+
+    def __iter__(self):
+        for segment in _chain(self.segment):
+            yield from segment.items
+
+
+class PersistentMemory:
+    """
+    可分支的记忆（写时复制）
+
+    记忆由一串冻结片段加上一个可写的尾部组成。snapshot() 把尾部冻结为新片段并返回快照，
+    开销只与上次快照后新增的条数有关；PersistentMemory(base=snapshot) 从快照派生分支是 O(1)，
+    各分支共享快照之前的全部片段，只各自保存之后新增的记忆。
+    改写已冻结的条目时只复制它所在的片段及其后的片段（路径复制），不影响其他分支。
+
+    对外表现与 MemoryList 一致：渲染到提示词中的文本与普通列表相同，
+    支持 len、下标读写、迭代、append / extend 与 total_chars。
+    """
+
+    def __init__(self, iterable=(), base: MemorySnapshot = None):
+        self._base = base.segment if base is not None else None
+        self._tail = list(iterable)
+        self._tail_chars = sum(_chars(item) for item in self._tail)
+
+    def snapshot(self) -> MemorySnapshot:
+        """冻结当前内容并返回快照"""
+        if self._tail:
+            self._base = _Segment(self._base, tuple(self._tail), self._tail_chars)
+            self._tail = []
+            self._tail_chars = 0
+        return MemorySnapshot(self._base)
+
+    @property
+    def _base_length(self) -> int:
+        return self._base.length if self._base else 0
+
+    @property
+    def total_chars(self) -> int:
+        return (self._base.total_chars if self._base else 0) + self._tail_chars
+
+    def __len__(self):
+        return self._base_length + len(self._tail)
+
+    def __iter__(self):
+        for segment in _chain(self._base):
+            yield from segment.items
+        yield from self._tail
+
+    def _normalize(self, index: int) -> int:
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("memory index out of range")
+        return index
+
+    def _find_segment(self, index: int) -> list:
+        """返回从最新片段到包含 index 的片段的路径"""
+        path = []
+        segment = self._base
+        while segment.start > index:
+            path.append(segment)
+            segment = segment.parent
+        path.append(segment)
+        return path
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        index = self._normalize(index)
+        if index >= self._base_length:
+            return self._tail[index - self._base_length]
+        segment = self._find_segment(index)[-1]
+        return segment.items[index - segment.start]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            raise TypeError("PersistentMemory 不支持切片赋值")
+        index = self._normalize(index)
+        if index >= self._base_length:
+            offset = index - self._base_length
+            self._tail_chars += _chars(value) - _chars(self._tail[offset])
+            self._tail[offset] = value
+            return
+
+        # 路径复制：重建包含该条目的片段及其后的片段，更早的片段继续共享
+        path = self._find_segment(index)
+        target = path.pop()
+        items = list(target.items)
+        offset = index - target.start
+        chars = target.chars + _chars(value) - _chars(items[offset])
+        items[offset] = value
+        segment = _Segment(target.parent, tuple(items), chars)
+        for newer in reversed(path):
+            segment = _Segment(segment, newer.items, newer.chars)
+        self._base = segment
+
+    def append(self, item):
+        self._tail.append(item)
+        n = _chars(item)
+        self._tail_chars += n
+        get_run_stats().record_memory(1, n)
+
+    def extend(self, items):
+        items = list(items)
+        self._tail.extend(items)
+        n = sum(_chars(item) for item in items)
+        self._tail_chars += n
+        get_run_stats().record_memory(len(items), n)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def __eq__(self, other):
+        if isinstance(other, (list, PersistentMemory)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    __str__ = __repr__
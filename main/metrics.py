@@ -0,0 +1,276 @@
+"""
+metrics.py - Prometheus 文本格式的运行指标
+
+服务端此前只有 print 与 logger.info 输出，无法据此告警或做容量规划。本模块提供一个
+不依赖第三方库的指标注册表，输出 Prometheus 文本格式（0.0.4），由 /metrics 接口暴露：
+
+    - Counter：只增的计数（模型调用 token 数、重试次数、兜底解析次数……）
+    - Gauge：可增可减的当前值（推送流订阅数……）
+    - Histogram：按桶统计的耗时分布（HTTP 请求耗时、模型调用耗时）
+
+Counter 与 Gauge 也可以传入 fn，在抓取时调用 fn() 读取当前值（会话数、排队深度等
+已由其他模块维护的数值），不必在每处变化时同步更新。fn 返回一个数，或
+{标签值元组: 数值} 形式的字典。
+
+模型调用的指标在 config.api_config 中记录（按提供商与场景），场景由 use_scene 放入当前上下文，
+上下文随 tracing.wrap_context / asyncio.to_thread 传入工作线程。
+
+用法:
+    from metrics import get_registry
+
+    registry = get_registry()
+    requests = registry.counter("app_requests_total", "请求数", labels=("route",))
+    requests.inc(route="/api/run_game")
+    print(registry.render())
+"""
+
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+# 默认的耗时分桶（秒），覆盖毫秒级的接口到分钟级的模型调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    """指标基类：按标签值元组保存数值（线程安全）"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), fn=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.fn = fn
+        self._lock = threading.Lock()
+        self._values: dict = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"指标 {self.name} 的标签应为 {self.labels}，实际为 {tuple(labels)}")
+        return tuple(labels[name] for name in self.labels)
+
+    def values(self) -> dict:
+        """{标签值元组: 数值} 的副本；设置了 fn 时读取 fn 的返回值"""
+        if self.fn is not None:
+            value = self.fn()
+            return dict(value) if isinstance(value, dict) else {(): value}
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self):
+        """逐个产生 (样本名, 标签字符串, 数值)"""
+        for key, value in sorted(self.values().items()):
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Counter(_Metric):
+    """只增的计数"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Counter 只能增加")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """可增可减的当前值"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """按桶统计的分布：每组标签保存各桶计数、总和与样本数"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """记录 with 块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        for key, (counts, total, count) in sorted(self.values().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield (f"{self.name}_bucket", _format_labels(self.labels + ("le",), key + (_format_value(bound),)),
+                       cumulative)
+            yield f"{self.name}_bucket", _format_labels(self.labels + ("le",), key + ("+Inf",)), count
+            yield f"{self.name}_sum", _format_labels(self.labels, key), total
+            yield f"{self.name}_count", _format_labels(self.labels, key), count
+
+    def values(self) -> dict:
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+
+
+class Registry:
+    """指标注册表，render() 输出全部指标的 Prometheus 文本格式"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: dict = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        """注册指标；同名指标已存在时返回已有的（模块重复导入时不重复注册）"""
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"指标 {metric.name} 已注册为 {existing.kind}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labels: tuple = (), fn=None) -> Counter:
+        return self.register(Counter(name, help, labels, fn=fn))
+
+    def gauge(self, name: str, help: str, labels: tuple = (), fn=None) -> Gauge:
+        return self.register(Gauge(name, help, labels, fn=fn))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets=buckets))
+
+    def render(self) -> str:
+        """全部指标的 Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+_registry = Registry()
+
+
+def get_registry() -> Registry:
+    """全局指标注册表"""
+    return _registry
+
+
+# ===== 模型调用与解析指标 =====
+
+_scene = contextvars.ContextVar("amphoreus_metrics_scene", default=None)
+
+LLM_LATENCY = _registry.histogram(
+    "amphoreus_llm_request_duration_seconds", "模型调用耗时（不含排队等待）",
+    labels=("provider", "scene", "outcome"),
+)
+LLM_TOKENS = _registry.counter(
+    "amphoreus_llm_tokens_total", "模型调用的 token 用量", labels=("provider", "scene", "kind"),
+)
+LLM_RETRIES = _registry.counter(
+    "amphoreus_llm_retries_total", "超时后的重试次数", labels=("scene",),
+)
+PARSE_FALLBACKS = _registry.counter(
+    "amphoreus_parse_fallbacks_total", "本地解析失败、交给模型兜底解析的决策数",
+)
+PARSE_FAILURES = _registry.counter(
+    "amphoreus_parse_failures_total", "兜底解析后仍无法解析的决策数",
+)
+
+
+@contextmanager
+def use_scene(scene):
+    """在 with 块内把模型调用记在场景 scene 下"""
+    reset = _scene.set(scene)
+    try:
+        yield scene
+    finally:
+        _scene.reset(reset)
+
+
+def record_llm_call(provider: str, seconds: float, usage: dict, ok: bool):
+    """一次模型调用完成（API 客户端调用），按提供商与当前场景记录耗时与 token 用量"""
+    scene = _scene.get() or "unknown"
+    LLM_LATENCY.observe(seconds, provider=provider, scene=scene, outcome="ok" if ok else "error")
+    for kind in ("prompt", "completion"):
+        tokens = (usage or {}).get(f"{kind}_tokens")
+        if tokens:
+            LLM_TOKENS.inc(tokens, provider=provider, scene=scene, kind=kind)
+
+
+def record_retry(scene=None):
+    LLM_RETRIES.inc(scene=scene or _scene.get() or "unknown")
+
+
+def record_parse_fallback(pending: int, failed: int):
+    """一次批量解析：pending 条交给模型兜底，兜底后仍有 failed 条失败"""
+    if pending:
+        PARSE_FALLBACKS.inc(pending)
+    if failed:
+        PARSE_FAILURES.inc(failed)
+
+
+if __name__ == "__main__":
+    with use_scene("fire_decision"):
+        record_llm_call("deepseek", 1.2, {"prompt_tokens": 800, "completion_tokens": 120}, ok=True)
+        record_llm_call("deepseek", 61.0, {}, ok=False)
+        record_retry()
+    record_parse_fallback(2, 1)
+    _registry.gauge("amphoreus_demo_sessions", "演示：抓取时读取的当前值", fn=lambda: 3)
+    print(_registry.render())
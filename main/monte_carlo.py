@@ -0,0 +1,198 @@
+"""
+monte_carlo.py - 多世界并行的永劫回归
+
+一次 eternal_regression 就是一个“世界”：一组盗火行者在多轮中累积记忆。
+统计结局分布需要许多互不相关的世界，而单个进程一次只能推进一个世界。
+本模块用进程池同时运行 M 个世界：
+
+    - 每个世界在独立的子进程中运行，拥有自己的随机种子与盗火行者（记忆互不共享）
+    - 所有子进程共用一个由父进程创建的跨进程信号量，限制合计的在途 LLM 请求数，
+      避免进程数变多后超出提供商的并发限额
+    - 子进程每完成一轮就把结果放入 Manager 队列，父进程按到达顺序逐条产出，
+      不必等待整个世界结束
+
+注意：录制模式的 completion_cache 不应让多个进程写同一个文件；
+需要录制时请为每个世界单独运行，或只在回放模式下共享缓存文件。
+
+用法:
+    from monte_carlo import iter_worlds, run_worlds
+
+    for event in iter_worlds(worlds=8, rounds=20, processes=4, max_concurrent_calls=6):
+        if event['type'] == 'round':
+            print(event['world'], event['round_num'], event['final_result'])
+
+    results = run_worlds(worlds=8, rounds=20, base_seed=42)
+    print(results[0]['logs'])
+"""
+
+import os
+import queue
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
+
+from run_stats import get_run_stats, logger
+
+
+# 产出事件类型
+WORLD_EVENT_TYPES = ("world_start", "round", "world_end", "world_error")
+
+
+def world_seeds(worlds: int, base_seed: int = None) -> list:
+    """
+    为每个世界生成随机种子
+
+    给定 base_seed 时结果可复现；否则每次运行都不同。
+    """
+    rng = random.Random(base_seed)
+    return [rng.randrange(2 ** 31) for _ in range(worlds)]
+
+
+def _init_worker(limiter):
+    """子进程初始化：安装跨进程共享的请求并发限制器"""
+    from config.api_config import set_request_limiter
+    set_request_limiter(limiter)
+
+
+def _run_world(world_id: int, seed: int, events, rounds: int, max_persuasion_attempts: int,
+               temperature, stop_rule_options):
+    """在子进程中运行一个世界，把每轮结果与最终统计放入队列"""
+    from main import eternal_regression
+
+    events.put({'type': 'world_start', 'world': world_id, 'seed': seed, 'pid': os.getpid()})
+    start = time.time()
+
+    def on_round(round_num, final_result, robbed_list):
+        events.put({
+            'type': 'round',
+            'world': world_id,
+            'seed': seed,
+            'round_num': round_num,
+            'final_result': final_result,
+            'robbed': robbed_list,
+        })
+
+    stop_rule = None
+    if stop_rule_options is not None:
+        from convergence import ConvergenceMonitor
+        stop_rule = ConvergenceMonitor(**stop_rule_options)
+
+    try:
+        logs = eternal_regression(
+            rounds=rounds,
+            max_persuasion_attempts=max_persuasion_attempts,
+            headless=True,
+            seed=seed,
+            temperature=temperature,
+            stop_rule=stop_rule,
+            on_round=on_round,
+        )
+    except Exception as e:
+        events.put({'type': 'world_error', 'world': world_id, 'seed': seed, 'error': repr(e)})
+        return
+
+    events.put({
+        'type': 'world_end',
+        'world': world_id,
+        'seed': seed,
+        'logs': logs,
+        'stats': get_run_stats().snapshot(),
+        'convergence': stop_rule.report() if stop_rule is not None else None,
+        'elapsed': time.time() - start,
+    })
+
+
+def iter_worlds(worlds: int, rounds: int, max_persuasion_attempts: int = 3, processes: int = None,
+                max_concurrent_calls: int = None, base_seed: int = None, seeds: list = None,
+                temperature: float = None, stop_rule_options: dict = None, poll_interval: float = 0.5):
+    """
+    并行运行多个世界，按到达顺序逐条产出事件
+
+    Args:
+        worlds (int): 世界数量
+        rounds (int): 每个世界的最大轮数
+        max_persuasion_attempts (int): 每轮最大劝说次数
+        processes (int): 进程数，默认为 min(worlds, CPU 核数)
+        max_concurrent_calls (int): 所有进程合计的最大在途 LLM 请求数，None 表示不限制
+        base_seed (int): 生成各世界种子的基准种子
+        seeds (list): 直接指定各世界的种子（优先于 base_seed）
+        temperature (float): 覆盖模型采样温度
+        stop_rule_options (dict): 传给 ConvergenceMonitor 的参数，提供时各世界独立判定收敛
+        poll_interval (float): 等待队列时检查子进程是否异常退出的间隔（秒）
+
+    Yields:
+        dict: 事件字典，type 为
+              - world_start: world, seed, pid
+              - round: world, seed, round_num, final_result, robbed
+              - world_end: world, seed, logs, stats, convergence, elapsed
+              - world_error: world, seed, error
+    """
+    if seeds is None:
+        seeds = world_seeds(worlds, base_seed)
+    elif len(seeds) != worlds:
+        raise ValueError(f"seeds 的数量({len(seeds)})必须等于 worlds({worlds})")
+    processes = processes or min(worlds, os.cpu_count() or 1)
+
+    logger.info("monte_carlo: %d 个世界，%d 个进程，请求并发上限 %s", worlds, processes,
+                max_concurrent_calls)
+
+    with Manager() as manager:
+        events = manager.Queue()
+        limiter = manager.BoundedSemaphore(max_concurrent_calls) if max_concurrent_calls else None
+
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(limiter,)) as executor:
+            futures = {
+                executor.submit(_run_world, world_id, seed, events, rounds, max_persuasion_attempts,
+                                temperature, stop_rule_options): world_id
+                for world_id, seed in enumerate(seeds)
+            }
+
+            finished = set()
+            while len(finished) < worlds:
+                try:
+                    event = events.get(timeout=poll_interval)
+                except queue.Empty:
+                    # 子进程崩溃（例如被杀死）时不会再放入事件，由 future 补发错误事件
+                    for future, world_id in futures.items():
+                        if world_id not in finished and future.done() and future.exception() is not None:
+                            finished.add(world_id)
+                            yield {'type': 'world_error', 'world': world_id, 'seed': seeds[world_id],
+                                   'error': repr(future.exception())}
+                    continue
+
+                if event['type'] in ('world_end', 'world_error'):
+                    finished.add(event['world'])
+                yield event
+
+
+def run_worlds(worlds: int, rounds: int, **kwargs) -> dict:
+    """
+    并行运行多个世界并汇总结果
+
+    参数同 iter_worlds。
+
+    Returns:
+        dict: {world_id: {'seed', 'logs', 'stats', 'convergence', 'elapsed'} 或 {'seed', 'error'}}
+    """
+    results = {}
+    for event in iter_worlds(worlds, rounds, **kwargs):
+        if event['type'] == 'round':
+            logger.info("世界 %d 第 %d 轮完成", event['world'], event['round_num'])
+        elif event['type'] in ('world_end', 'world_error'):
+            world_id = event['world']
+            results[world_id] = {k: v for k, v in event.items() if k not in ('type', 'world')}
+    return dict(sorted(results.items()))
+
+
+if __name__ == "__main__":
+    # 4 个世界，每个 3 轮，合计最多 4 个并发请求
+    for event in iter_worlds(worlds=4, rounds=3, processes=4, max_concurrent_calls=4, base_seed=0):
+        if event['type'] == 'round':
+            print(f">>> 世界 {event['world']} 第 {event['round_num']} 轮: {event['final_result']}")
+        elif event['type'] == 'world_end':
+            print(f">>> 世界 {event['world']} 完成，耗时 {event['elapsed']:.1f}s，"
+                  f"LLM 调用 {event['stats']['llm_calls']} 次")
+        elif event['type'] == 'world_error':
+            print(f">>> 世界 {event['world']} 出错: {event['error']}")
@@ -0,0 +1,326 @@
+"""
+outcome_store.py - 列式存储的回合结局
+
+eternal_regression 的日志是 {'第X次永劫回归': ({角色: 状态字符串}, [被强夺角色])}，
+统计时要逐轮遍历字典、比较中文字符串；积累成千上万轮后，分析的开销主要花在这里。
+OutcomeStore 把结局保存为 轮次 × 角色 的 int8 矩阵（状态用 Status 编码）和同形状的被强夺掩码，
+各类人数等统计都是对整块矩阵的向量运算；原有的字典 / JSON 格式在需要时再生成。
+
+一个 store 可以容纳多次运行（run_id 区分），便于把多个世界的结果汇总后交给 pandas 分析。
+
+用法:
+    from outcome_store import OutcomeStore, Status
+
+    store = OutcomeStore()
+    logs = eternal_regression(rounds=20, store=store)
+    print(store.summary())                  # 每轮各类人数（numpy 数组）
+    print((store.codes == Status.ROBBED).sum(axis=0))   # 每位角色被强夺的次数
+
+    df = store.to_dataframe()               # 长表：run / round / char_id / status / robbed
+    store.save("outcomes.npz")
+"""
+
+from enum import IntEnum
+
+import numpy as np
+
+
+class Status(IntEnum):
+    """角色状态编码（int8）"""
+
+    MISSING = -1        # 该轮没有这位角色的记录
+    FIRE = 0            # 逐火（尚未决定是否交出火种）
+    NO_FIRE = 1         # 不逐火
+    HANDED_OVER = 2     # 逐火_交出火种
+    REFUSED = 3         # 逐火_不交出火种
+    ROBBED = 4          # 逐火_火种被强夺
+
+    @property
+    def label(self) -> str:
+        """日志中使用的中文状态"""
+        return STATUS_LABELS[self]
+
+    @classmethod
+    def from_label(cls, label: str) -> "Status":
+        return _LABEL_TO_STATUS[label]
+
+
+STATUS_LABELS = {
+    Status.MISSING: '',
+    Status.FIRE: '逐火',
+    Status.NO_FIRE: '不逐火',
+    Status.HANDED_OVER: '逐火_交出火种',
+    Status.REFUSED: '逐火_不交出火种',
+    Status.ROBBED: '逐火_火种被强夺',
+}
+_LABEL_TO_STATUS = {label: status for status, label in STATUS_LABELS.items() if label}
+
+# 计入“逐火者”的状态
+FIRE_CODES = (Status.FIRE, Status.HANDED_OVER, Status.REFUSED, Status.ROBBED)
+
+
+def round_key(round_num: int) -> str:
+    """日志字典中的轮次键"""
+    return f'第{round_num}次永劫回归'
+
+
+def parse_round_key(key: str) -> int:
+    return int(key.replace('第', '').replace('次永劫回归', ''))
+
+
+class OutcomeStore:
+    """
+    轮次 × 角色 的结局矩阵
+
+    Attributes:
+        characters: 列对应的角色 ID（出现新角色时追加列）
+        codes: int8 矩阵，形状 (轮数, 角色数)，取值为 Status
+        robbed: bool 矩阵，与 codes 同形状，标记该轮被强夺的角色
+        attempts: int8 矩阵，与 codes 同形状，劝说后交出火种的角色记为第几次劝说，其余为 0
+        round_nums / run_ids: 每一行对应的轮次与运行编号
+        memory_chars: 每轮结束时盗火行者记忆的总字符数（未记录为 NaN）
+    """
+
+    def __init__(self, characters=(), capacity: int = 64):
+        self.characters = list(characters)
+        self._columns = {char_id: i for i, char_id in enumerate(self.characters)}
+        self._size = 0
+        # 预分配容量，满了按倍数扩展，追加一轮是均摊 O(角色数)
+        self._codes = np.full((capacity, len(self.characters)), Status.MISSING, dtype=np.int8)
+        self._robbed = np.zeros((capacity, len(self.characters)), dtype=bool)
+        self._attempts = np.zeros((capacity, len(self.characters)), dtype=np.int8)
+        self._round_nums = np.zeros(capacity, dtype=np.int32)
+        self._run_ids = np.zeros(capacity, dtype=np.int32)
+        self._memory_chars = np.full(capacity, np.nan)
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def __len__(self):
+        return self._size
+
+    def _column(self, char_id: str) -> int:
+        column = self._columns.get(char_id)
+        if column is None:
+            column = len(self.characters)
+            self.characters.append(char_id)
+            self._columns[char_id] = column
+            rows = self._codes.shape[0]
+            self._codes = np.hstack([self._codes, np.full((rows, 1), Status.MISSING, dtype=np.int8)])
+            self._robbed = np.hstack([self._robbed, np.zeros((rows, 1), dtype=bool)])
+            self._attempts = np.hstack([self._attempts, np.zeros((rows, 1), dtype=np.int8)])
+        return column
+
+    def _reserve(self, rows: int):
+        capacity = self._codes.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2)
+        codes = np.full((new_capacity, self._codes.shape[1]), Status.MISSING, dtype=np.int8)
+        codes[:self._size] = self._codes[:self._size]
+        robbed = np.zeros((new_capacity, self._robbed.shape[1]), dtype=bool)
+        robbed[:self._size] = self._robbed[:self._size]
+        attempts = np.zeros((new_capacity, self._attempts.shape[1]), dtype=np.int8)
+        attempts[:self._size] = self._attempts[:self._size]
+        self._codes, self._robbed, self._attempts = codes, robbed, attempts
+        self._round_nums = np.resize(self._round_nums, new_capacity)
+        self._run_ids = np.resize(self._run_ids, new_capacity)
+        self._memory_chars = np.resize(self._memory_chars, new_capacity)
+
+    def append(self, final_result: dict, robbed_list=(), round_num: int = None, run_id: int = 0,
+               persuaded_at: dict = None, memory_chars: int = None) -> int:
+        """
+        追加一轮结果
+
+        Args:
+            final_result: {角色: 状态字符串}
+            robbed_list: 被强夺火种的角色
+            round_num: 轮次，默认为该运行的上一轮 + 1
+            run_id: 运行编号
+            persuaded_at: 可选的 {劝说后交出火种的角色: 第几次劝说}
+            memory_chars: 可选，本轮结束时盗火行者记忆的总字符数
+
+        Returns:
+            int: 新行的下标
+        """
+        columns = [self._column(char_id) for char_id in final_result]
+        robbed_columns = [self._column(char_id) for char_id in robbed_list]
+        persuaded_at = persuaded_at or {}
+        persuaded_columns = [self._column(char_id) for char_id in persuaded_at]
+
+        if round_num is None:
+            previous = self._round_nums[:self._size][self._run_ids[:self._size] == run_id]
+            round_num = int(previous.max()) + 1 if previous.size else 1
+
+        self._reserve(self._size + 1)
+        row = self._size
+        self._codes[row] = Status.MISSING
+        self._codes[row, columns] = [_LABEL_TO_STATUS[status] for status in final_result.values()]
+        self._robbed[row] = False
+        self._robbed[row, robbed_columns] = True
+        self._attempts[row] = 0
+        self._attempts[row, persuaded_columns] = list(persuaded_at.values())
+        self._round_nums[row] = round_num
+        self._run_ids[row] = run_id
+        self._memory_chars[row] = np.nan if memory_chars is None else memory_chars
+        self._size += 1
+        return row
+
+    @classmethod
+    def from_logs_dict(cls, logs_dict: dict, run_id: int = 0, store: "OutcomeStore" = None) -> "OutcomeStore":
+        """由 eternal_regression 的日志字典构建（或追加到已有的 store）"""
+        store = store if store is not None else cls()
+        for key, (final_result, robbed_list) in logs_dict.items():
+            store.append(final_result, robbed_list, round_num=parse_round_key(key), run_id=run_id)
+        return store
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    @property
+    def codes(self) -> np.ndarray:
+        return self._codes[:self._size]
+
+    @property
+    def robbed(self) -> np.ndarray:
+        return self._robbed[:self._size]
+
+    @property
+    def attempts(self) -> np.ndarray:
+        return self._attempts[:self._size]
+
+    @property
+    def memory_chars(self) -> np.ndarray:
+        return self._memory_chars[:self._size]
+
+    @property
+    def round_nums(self) -> np.ndarray:
+        return self._round_nums[:self._size]
+
+    @property
+    def run_ids(self) -> np.ndarray:
+        return self._run_ids[:self._size]
+
+    def status_counts(self) -> np.ndarray:
+        """每轮各状态人数，形状 (轮数, len(Status) - 1)，列顺序为 FIRE..ROBBED"""
+        codes = self.codes
+        return np.stack([(codes == status).sum(axis=1) for status in Status if status != Status.MISSING],
+                        axis=1)
+
+    def summary(self) -> dict:
+        """
+        每轮的各类人数（与 run_stats.count_statuses 的含义相同，但一次算出所有轮）
+
+        Returns:
+            dict: {'逐火者总数', '主动交出火种', '被强夺火种', '不逐火者'} -> 长度为轮数的数组
+        """
+        codes = self.codes
+        return {
+            '逐火者总数': np.isin(codes, FIRE_CODES).sum(axis=1),
+            '主动交出火种': (codes == Status.HANDED_OVER).sum(axis=1),
+            '被强夺火种': (codes == Status.ROBBED).sum(axis=1),
+            '不逐火者': (codes == Status.NO_FIRE).sum(axis=1),
+        }
+
+    def round_summary(self, row: int = -1) -> dict:
+        """单轮的各类人数（默认最后一轮），值为 int"""
+        codes = self.codes[row]
+        return {
+            '逐火者总数': int(np.isin(codes, FIRE_CODES).sum()),
+            '主动交出火种': int((codes == Status.HANDED_OVER).sum()),
+            '被强夺火种': int((codes == Status.ROBBED).sum()),
+            '不逐火者': int((codes == Status.NO_FIRE).sum()),
+        }
+
+    def rows(self, run_id: int = None) -> np.ndarray:
+        """某次运行的行下标（run_id 为 None 时为全部行）"""
+        if run_id is None:
+            return np.arange(self._size)
+        return np.flatnonzero(self.run_ids == run_id)
+
+    def final_result(self, row: int) -> dict:
+        """第 row 行的 {角色: 状态字符串}"""
+        codes = self.codes[row]
+        return {self.characters[c]: STATUS_LABELS[Status(int(codes[c]))]
+                for c in np.flatnonzero(codes != Status.MISSING)}
+
+    def robbed_list(self, row: int) -> list:
+        return [self.characters[c] for c in np.flatnonzero(self.robbed[row])]
+
+    def to_logs_dict(self, run_id: int = 0) -> dict:
+        """生成 eternal_regression 格式的日志字典"""
+        return {round_key(int(self.round_nums[row])): (self.final_result(row), self.robbed_list(row))
+                for row in self.rows(run_id)}
+
+    def to_dataframe(self):
+        """
+        转换为 pandas 长表，每行是一位角色在一轮中的结局
+
+        列：run_id, round, char_id, code, status（分类类型）, robbed, persuaded_at, memory_chars
+        """
+        import pandas as pd
+
+        rows, columns = np.nonzero(self.codes != Status.MISSING)
+        codes = self.codes[rows, columns]
+        labels = [STATUS_LABELS[s] for s in Status if s != Status.MISSING]
+        return pd.DataFrame({
+            'run_id': self.run_ids[rows],
+            'round': self.round_nums[rows],
+            'char_id': pd.Categorical.from_codes(columns, self.characters),
+            'code': codes,
+            'status': pd.Categorical.from_codes(codes, labels),
+            'robbed': self.robbed[rows, columns],
+            'persuaded_at': self.attempts[rows, columns],
+            'memory_chars': self.memory_chars[rows],
+        })
+
+    def copy(self) -> "OutcomeStore":
+        """只复制已使用行的独立副本：在锁内取副本，之后的分析不必持有锁"""
+        size = self._size
+        store = OutcomeStore(characters=self.characters, capacity=max(size, 1))
+        store._codes[:size] = self.codes
+        store._robbed[:size] = self.robbed
+        store._attempts[:size] = self.attempts
+        store._round_nums[:size] = self.round_nums
+        store._run_ids[:size] = self.run_ids
+        store._memory_chars[:size] = self.memory_chars
+        store._size = size
+        return store
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+
+    def save(self, path: str):
+        """保存为 .npz"""
+        np.savez_compressed(path, codes=self.codes, robbed=self.robbed, attempts=self.attempts,
+                            round_nums=self.round_nums, run_ids=self.run_ids, memory_chars=self.memory_chars,
+                            characters=np.array(self.characters))
+
+    @classmethod
+    def load(cls, path: str) -> "OutcomeStore":
+        data = np.load(path)
+        store = cls(characters=[str(c) for c in data['characters']], capacity=max(len(data['codes']), 1))
+        size = len(data['codes'])
+        store._codes[:size] = data['codes']
+        store._robbed[:size] = data['robbed']
+        store._attempts[:size] = data['attempts']
+        store._round_nums[:size] = data['round_nums']
+        store._run_ids[:size] = data['run_ids']
+        store._memory_chars[:size] = data['memory_chars']
+        store._size = size
+        return store
+
+
+if __name__ == "__main__":
+    logs = {
+        '第1次永劫回归': ({'A': '不逐火', 'B': '逐火_交出火种', 'C': '逐火_火种被强夺'}, ['C']),
+        '第2次永劫回归': ({'A': '逐火_交出火种', 'B': '逐火_交出火种', 'C': '不逐火'}, []),
+    }
+    store = OutcomeStore.from_logs_dict(logs)
+    print(store.codes)
+    print(store.summary())
+    print(store.to_logs_dict() == logs)
+    print(store.to_dataframe())
@@ -0,0 +1,193 @@
+"""
+parallel.py - 阶段内并发执行工具
+
+同一阶段中各黄金裔的 LLM 调用互不依赖（每位黄金裔只读写自己的记忆），
+可以同时发出以缩短整个阶段的耗时。本模块提供线程与 asyncio 两种后端，
+无论任务以何种顺序完成，结果都按提交顺序返回，保证输出可复现。
+
+用法:
+    from parallel import run_tasks
+
+    results = run_tasks([lambda: heir.make_decision(q) for ...], max_workers=4)
+
+    # 需要先处理先完成的任务时（例如流水线中先完成的角色先产生事件）
+    for index, result in iter_completed(tasks, max_workers=4):
+        ...
+
+    # 同时推进多个互不依赖的生成器，按产生顺序合并它们的元素
+    for item in iter_merged([partial(phase_a, state), partial(phase_b, state)]):
+        ...
+
+    # 在协程中消费会阻塞的同步生成器（每次取值都在线程中进行，不占用事件循环）
+    async for event in iterate_in_thread(events):
+        ...
+"""
+
+import asyncio
+import contextvars
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import tracing
+
+
+BACKENDS = ("thread", "asyncio")
+
+
+def _validate(backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"backend 必须是 {BACKENDS} 之一，当前为: {backend}")
+
+
+def _run_with_threads(tasks: list, max_workers: int) -> list:
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # 每个任务在提交时上下文的副本中运行，使追踪 span 的父子关系跨线程保持
+        futures = [executor.submit(tracing.wrap_context(task)) for task in tasks]
+        # 按提交顺序取结果；任一任务抛出的异常会在此处原样抛出
+        return [future.result() for future in futures]
+
+
+async def _gather_with_limit(tasks: list, max_workers: int) -> list:
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def _run(task):
+        async with semaphore:
+            return await asyncio.to_thread(task)
+
+    return await asyncio.gather(*(_run(task) for task in tasks))
+
+
+def _run_with_asyncio(tasks: list, max_workers: int) -> list:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_gather_with_limit(tasks, max_workers))
+    # 已处于事件循环中（例如在 FastAPI 协程里被调用）时无法嵌套 asyncio.run，退回线程后端
+    return _run_with_threads(tasks, max_workers)
+
+
+def run_tasks(tasks, max_workers: int = 1, backend: str = "thread") -> list:
+    """
+    并发执行一组无参任务，并按提交顺序返回结果
+
+    Args:
+        tasks: 无参可调用对象的序列
+        max_workers: 最大并发数，小于等于 1 时在当前线程顺序执行
+        backend: 并发后端，"thread"（线程池）或 "asyncio"（事件循环 + to_thread）
+
+    Returns:
+        list: 与 tasks 一一对应的返回值
+    """
+    _validate(backend)
+    tasks = list(tasks)
+    if max_workers is None or max_workers <= 1 or len(tasks) <= 1:
+        return [task() for task in tasks]
+
+    max_workers = min(max_workers, len(tasks))
+    if backend == "asyncio":
+        return _run_with_asyncio(tasks, max_workers)
+    return _run_with_threads(tasks, max_workers)
+
+
+def iter_completed(tasks, max_workers: int = 1, backend: str = "thread"):
+    """
+    并发执行一组无参任务，按完成顺序逐个产出 (提交序号, 返回值)
+
+    与 run_tasks 不同，调用方无需等待最慢的任务即可处理已完成的结果。
+    asyncio 后端同样使用线程池（其任务本身也是通过 to_thread 在线程中执行），
+    因为生成器无法在 asyncio.run 的事件循环中途交出结果。
+
+    Args:
+        tasks: 无参可调用对象的序列
+        max_workers: 最大并发数，小于等于 1 时在当前线程按提交顺序执行
+        backend: "thread" 或 "asyncio"
+    """
+    _validate(backend)
+    tasks = list(tasks)
+    if max_workers is None or max_workers <= 1 or len(tasks) <= 1:
+        for index, task in enumerate(tasks):
+            yield index, task()
+        return
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+        futures = {executor.submit(tracing.wrap_context(task)): index for index, task in enumerate(tasks)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def iter_merged(factories):
+    """
+    同时推进多个生成器，按产生顺序逐个产出它们的元素
+
+    每个生成器在自己的线程中推进（携带调用时的上下文），元素经队列交回调用方。
+    任一生成器抛出异常时，等其余生成器结束后把第一个异常原样抛出；
+    调用方提前关闭时同样等各线程结束（取消令牌会让尚未发出的模型调用不再进行）。
+
+    Args:
+        factories: 无参可调用对象的序列，每个调用返回一个生成器
+    """
+    factories = list(factories)
+    items = queue.Queue()
+
+    def drive(factory):
+        try:
+            for item in factory():
+                items.put(("item", item))
+        except BaseException as e:
+            items.put(("error", e))
+        finally:
+            items.put(("done", None))
+
+    error = None
+    executor = ThreadPoolExecutor(max_workers=max(len(factories), 1))
+    try:
+        for factory in factories:
+            executor.submit(tracing.wrap_context(lambda factory=factory: drive(factory)))
+        remaining = len(factories)
+        while remaining:
+            kind, value = items.get()
+            if kind == "item":
+                yield value
+            elif kind == "error":
+                error = error or value
+            else:
+                remaining -= 1
+    finally:
+        executor.shutdown(wait=True)
+    if error is not None:
+        raise error
+
+
+_DONE = object()
+
+# iterate_in_thread 推进生成器所用的线程池（每一路流同一时刻最多占用一个线程）
+_STEP_EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix="stream-step")
+
+
+async def iterate_in_thread(generator):
+    """
+    把同步生成器转换为异步生成器
+
+    每次 next() 都在线程中执行（携带当前上下文，追踪 span 与取消令牌随之传入），
+    生成器内部的阻塞调用（LLM 请求）不会阻塞事件循环；同一时刻只有一个线程推进该生成器。
+    异步生成器被关闭或所在任务被取消时同时关闭原生成器，使其 finally 块得以执行；
+    若此时仍有一步在线程中执行，则等这一步结束后再关闭。
+
+    Args:
+        generator: 同步生成器
+    """
+    step = None
+    try:
+        while True:
+            context = contextvars.copy_context()
+            step = _STEP_EXECUTOR.submit(context.run, next, generator, _DONE)
+            item = await asyncio.wrap_future(step)
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        if step is not None and not step.done():
+            # 执行中的生成器不能 close，等这一步结束后在工作线程中关闭
+            step.add_done_callback(lambda _: generator.close())
+        else:
+            generator.close()
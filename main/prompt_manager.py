@@ -13,6 +13,20 @@ import yaml
 from pathlib import Path
 
 
+class ScenePrompt(str):
+    """
+    带场景名的提示词字符串
+
+    行为与普通 str 完全一致，额外的 scene 属性让 Agent 与追踪记录
+    能够知道一次调用属于哪个场景，而无需调用方另外传参。
+    """
+
+    def __new__(cls, text: str, scene: str):
+        obj = super().__new__(cls, text)
+        obj.scene = scene
+        return obj
+
+
 class PromptManager:
     """
     提示词管理器：从 prompts/ 目录加载角色配置、基础提示词、场景提示词，
@@ -142,7 +156,7 @@ class PromptManager:
         template = self.scenes.get(scene_name)
         if not template:
             raise ValueError(f"未找到场景提示词: {scene_name}")
-        return template.format(**kwargs)
+        return ScenePrompt(template.format(**kwargs), scene_name)
 
     def get_decision_format(self) -> str:
         """获取决策输出格式要求"""
@@ -155,6 +169,19 @@ class PromptManager:
             raise ValueError("未找到 decode_fallback 提示词模板")
         return template.format(text=text)
 
+    def get_decode_fallback_batch_prompt(self, texts: dict) -> str:
+        """
+        获取批量兜底解析提示词：一次请求解析多位角色的决策
+
+        Args:
+            texts: {char_id: 待解析文本}
+        """
+        template = self.base.get("decode_fallback_batch")
+        if not template:
+            raise ValueError("未找到 decode_fallback_batch 提示词模板")
+        items = "\n\n".join(f"【{char_id}】\n{text}" for char_id, text in texts.items())
+        return template.format(items=items)
+
 
 # 全局单例，方便各模块直接导入使用
 _prompt_manager = None
@@ -0,0 +1,186 @@
+"""
+round_graph.py - 基于依赖图的回合调度器
+
+一轮迭代可以拆成若干步骤（神谕、逐火决策、盗火行者劝诫……），
+步骤之间只有部分存在数据依赖。RoundGraph 把回合描述为有向无环图，
+每个步骤在其全部前置步骤完成后立即开始，互不依赖的步骤并行执行，
+从而让整轮耗时只取决于关键路径。
+
+每次运行都会记录各步骤的起止时间，并给出关键路径与顺序执行耗时的对比。
+
+用法:
+    from round_graph import Step, RoundGraph
+
+    graph = RoundGraph([
+        Step("oracle", step_oracle),
+        Step("fire_decisions", step_fire_decisions, deps=("oracle",)),
+        Step("black_heir_persuade", step_black_heir_persuade),
+    ])
+    report = graph.run(ctx)
+    print("\\n".join(report.summary_lines()))
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import tracing
+
+
+class Step:
+    """图中的一个步骤：名称、执行函数（接收共享的 ctx）和前置步骤名"""
+
+    def __init__(self, name: str, fn, deps=()):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+
+    def __repr__(self):
+        return f"Step({self.name!r}, deps={self.deps})"
+
+
+class StepTiming:
+    """单个步骤的计时结果（相对于整轮开始的秒数）"""
+
+    def __init__(self, name: str, start: float, end: float):
+        self.name = name
+        self.start = start
+        self.end = end
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class GraphReport:
+    """一次图调度的计时报告"""
+
+    def __init__(self, steps: list, timings: dict, wall_time: float):
+        self.steps = steps
+        self.timings = timings
+        self.wall_time = wall_time
+
+    @property
+    def serial_time(self) -> float:
+        """所有步骤顺序执行时的总耗时"""
+        return sum(t.duration for t in self.timings.values())
+
+    def critical_path(self) -> tuple:
+        """
+        按实测耗时计算关键路径
+
+        Returns:
+            tuple: (步骤名列表, 关键路径耗时)
+        """
+        best = {}
+        for step in self.steps:
+            duration = self.timings[step.name].duration if step.name in self.timings else 0.0
+            prev_path, prev_time = [], 0.0
+            for dep in step.deps:
+                dep_path, dep_time = best[dep]
+                if dep_time > prev_time:
+                    prev_path, prev_time = dep_path, dep_time
+            best[step.name] = (prev_path + [step.name], prev_time + duration)
+
+        if not best:
+            return [], 0.0
+        return max(best.values(), key=lambda item: item[1])
+
+    def summary_lines(self) -> list:
+        """生成可直接打印的计时摘要"""
+        lines = ["各步骤耗时："]
+        for step in self.steps:
+            timing = self.timings.get(step.name)
+            if timing is None:
+                continue
+            lines.append(
+                f"  {step.name}: {timing.duration:.2f}秒"
+                f"（{timing.start:.2f}s → {timing.end:.2f}s）"
+            )
+        path, path_time = self.critical_path()
+        lines.append(f"关键路径：{' → '.join(path)}（{path_time:.2f}秒）")
+        lines.append(f"顺序执行耗时：{self.serial_time:.2f}秒，实际耗时：{self.wall_time:.2f}秒，"
+                     f"节省：{self.serial_time - self.wall_time:.2f}秒")
+        return lines
+
+
+class RoundGraph:
+    """由 Step 组成的有向无环图，负责按依赖关系调度执行"""
+
+    def __init__(self, steps):
+        self.steps = self._topological_order(list(steps))
+
+    @staticmethod
+    def _topological_order(steps: list) -> list:
+        """
+        校验依赖并返回拓扑序
+
+        每次取声明顺序中第一个前置步骤均已完成的步骤：依赖允许时完全保持声明顺序，
+        顺序执行（concurrent=False）的输出顺序即步骤的声明顺序。
+        """
+        by_name = {}
+        for step in steps:
+            if step.name in by_name:
+                raise ValueError(f"步骤名重复: {step.name}")
+            by_name[step.name] = step
+        for step in steps:
+            for dep in step.deps:
+                if dep not in by_name:
+                    raise ValueError(f"步骤 {step.name} 依赖了不存在的步骤: {dep}")
+
+        ordered, done = [], set()
+        while len(ordered) < len(steps):
+            step = next((s for s in steps if s.name not in done and all(d in done for d in s.deps)), None)
+            if step is None:
+                remaining = [s.name for s in steps if s.name not in done]
+                raise ValueError(f"步骤之间存在循环依赖: {remaining}")
+            ordered.append(step)
+            done.add(step.name)
+        return ordered
+
+    def run(self, ctx: dict, concurrent: bool = True) -> GraphReport:
+        """
+        执行整张图
+
+        Args:
+            ctx: 各步骤共享的上下文字典，步骤通过它读写输入与输出
+            concurrent: True 时依赖满足即并行执行；False 时按拓扑序逐个执行
+
+        Returns:
+            GraphReport: 各步骤计时与关键路径
+        """
+        origin = time.perf_counter()
+        timings = {}
+
+        def _execute(step):
+            start = time.perf_counter() - origin
+            with tracing.span("phase", phase=step.name):
+                step.fn(ctx)
+            timings[step.name] = StepTiming(step.name, start, time.perf_counter() - origin)
+
+        if not concurrent:
+            for step in self.steps:
+                _execute(step)
+            return GraphReport(self.steps, timings, time.perf_counter() - origin)
+
+        done = set()
+        pending = {}
+        with ThreadPoolExecutor(max_workers=len(self.steps) or 1) as executor:
+            def _submit_ready():
+                for step in self.steps:
+                    if step.name in done or step.name in pending.values():
+                        continue
+                    if all(dep in done for dep in step.deps):
+                        task = tracing.wrap_context(lambda step=step: _execute(step))
+                        pending[executor.submit(task)] = step.name
+
+            _submit_ready()
+            while pending:
+                finished, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = pending.pop(future)
+                    # 步骤失败时让异常直接抛出，已提交的步骤随线程池退出而结束
+                    future.result()
+                    done.add(name)
+                _submit_ready()
+
+        return GraphReport(self.steps, timings, time.perf_counter() - origin)
@@ -0,0 +1,152 @@
+"""
+run_stats.py - 运行期计数器与输出通道
+
+批量运行（永劫回归）时，逐条打印模型回复、每轮遍历盗火行者的全部记忆统计字符数，
+这些开销会随记忆增长而线性变大，而输出往往无人阅读。本模块提供：
+
+    - RunStats：记忆条数、字符数、LLM 调用次数、token 用量、各状态决策数，
+      全部在写入时增量累加，读取是 O(1)
+    - ConsoleReporter / HeadlessReporter：进度输出通道。默认直接 print；
+      无界面（headless）模式下交给 logging 的 DEBUG 级别，并用 % 惰性格式化，
+      未开启 DEBUG 时连字符串都不会拼接
+
+用法:
+    from run_stats import get_run_stats, get_reporter
+
+    out = get_reporter(headless=True)
+    out("%s: %s", name, response)          # 与 logging 一样的 % 参数
+
+    stats = get_run_stats()
+    stats.record_decisions(final_result)   # 每轮结束时累计各状态数量
+    print(stats.snapshot())
+"""
+
+import logging
+import threading
+from collections import Counter
+
+
+logger = logging.getLogger("amphoreus")
+
+# 最终状态（逐火结果 + 交火种结果）
+FIRE_STATUSES = ('逐火_交出火种', '逐火_不交出火种', '逐火_火种被强夺')
+ALL_STATUSES = ('逐火', '不逐火') + FIRE_STATUSES
+
+
+def count_statuses(final_result: dict) -> dict:
+    """
+    统计一轮结果中的各类人数（一次遍历，不做子串匹配）
+
+    Returns:
+        dict: 逐火者总数、主动交出火种、被强夺火种、不逐火者
+    """
+    counts = Counter(final_result.values())
+    return {
+        '逐火者总数': sum(n for status, n in counts.items() if status.startswith('逐火')),
+        '主动交出火种': counts['逐火_交出火种'],
+        '被强夺火种': counts['逐火_火种被强夺'],
+        '不逐火者': counts['不逐火'],
+    }
+
+
+class RunStats:
+    """
+    一次运行的累计计数器（线程安全）
+
+    所有数值都在事件发生时累加，不会回头遍历记忆或结果。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """清零所有计数"""
+        with self._lock:
+            self.memory_entries = 0
+            self.memory_chars = 0
+            self.llm_calls = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.total_tokens = 0
+            self.rounds = 0
+            self.decisions = Counter()
+
+    def record_memory(self, entries: int, chars: int):
+        """记忆写入（MemoryList 在 append 时调用）"""
+        with self._lock:
+            self.memory_entries += entries
+            self.memory_chars += chars
+
+    def record_llm_usage(self, usage: dict):
+        """一次 LLM 调用完成，usage 为接口返回的 token 用量（可能为空）"""
+        with self._lock:
+            self.llm_calls += 1
+            if usage:
+                self.prompt_tokens += usage.get('prompt_tokens') or 0
+                self.completion_tokens += usage.get('completion_tokens') or 0
+                self.total_tokens += usage.get('total_tokens') or 0
+
+    def record_decisions(self, final_result: dict):
+        """一轮结束，按最终状态累计人数"""
+        with self._lock:
+            self.rounds += 1
+            self.decisions.update(final_result.values())
+
+    def snapshot(self) -> dict:
+        """当前计数的副本"""
+        with self._lock:
+            return {
+                'rounds': self.rounds,
+                'memory_entries': self.memory_entries,
+                'memory_chars': self.memory_chars,
+                'llm_calls': self.llm_calls,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'total_tokens': self.total_tokens,
+                'decisions': dict(self.decisions),
+            }
+
+
+_run_stats = RunStats()
+
+
+def get_run_stats() -> RunStats:
+    """获取全局计数器"""
+    return _run_stats
+
+
+def record_llm_usage(usage: dict):
+    """供 API 客户端调用的钩子"""
+    _run_stats.record_llm_usage(usage)
+
+
+class ConsoleReporter:
+    """默认输出通道：格式化后直接打印"""
+
+    headless = False
+
+    def __call__(self, msg: str, *args):
+        print(msg % args if args else msg)
+
+
+class HeadlessReporter:
+    """无界面输出通道：交给 logging 的 DEBUG 级别，未开启时不做任何格式化"""
+
+    headless = True
+
+    def __init__(self, log=None):
+        self.log = log or logger
+
+    def __call__(self, msg: str, *args):
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(msg, *args)
+
+
+_CONSOLE = ConsoleReporter()
+_HEADLESS = HeadlessReporter()
+
+
+def get_reporter(headless: bool = False):
+    """按模式返回输出通道"""
+    return _HEADLESS if headless else _CONSOLE
@@ -0,0 +1,437 @@
+"""
+session_store.py - 交互式游戏的会话存储
+
+每个会话持有 13 个角色的完整记忆与不断增长的事件流，长时间运行的服务端
+不能无限保留。SessionStore 在内存中保存会话，并限制其总量：
+
+    - 空闲超时：超过 idle_ttl 秒未被访问的会话由清理时移除
+    - 数量上限：超过 max_sessions 时按最近最少使用（LRU）淘汰
+    - 内存估算：按会话的记忆与事件字符数（GameSession.footprint）统计，
+      超过 max_total_chars 时同样按 LRU 淘汰
+    - 后台清理：start_sweeper() 启动守护线程，每 sweep_interval 秒清理一次
+
+被移除的会话会调用 close() 释放模型客户端并结束追踪 span。
+
+SQLiteSessionStore 把会话保存到 SQLite 数据库，多个 worker 进程共用同一个文件，
+任意进程都能处理任意会话，服务重启后进行中的游戏也不会丢失；
+它以 SessionStore 作为已加载会话的内存缓存。
+
+配置方式二选一：
+    - 环境变量 AMPHOREUS_MAX_SESSIONS、AMPHOREUS_SESSION_TTL（秒）、
+      AMPHOREUS_SESSION_MAX_CHARS（0 表示不限制）；
+      设置 AMPHOREUS_SESSION_DB=sessions.db 时使用 SQLite 存储，
+      AMPHOREUS_SESSION_RETENTION 为数据库中会话的保留时间（秒）
+    - 代码中调用 interactive_game.set_session_store(SessionStore(...))
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import fast_json
+from run_stats import logger
+
+
+class SessionNotFound(ValueError):
+    """会话不存在，或已被删除、超时移除、淘汰"""
+
+
+class SessionConflict(ValueError):
+    """保存时发现会话已被删除或在其他进程中更新，本次修改未保存"""
+
+
+class SessionStore:
+    """
+    内存中的会话存储（线程安全）
+
+    Args:
+        max_sessions: 会话数量上限，None 表示不限制
+        idle_ttl: 空闲超时（秒），None 表示不过期
+        max_total_chars: 全部会话的记忆与事件字符数上限，None 表示不限制
+        sweep_interval: 后台清理的间隔（秒）
+    """
+
+    def __init__(self, max_sessions: int = 200, idle_ttl: float = 1800.0, max_total_chars: int = None,
+                 sweep_interval: float = 60.0):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_total_chars = max_total_chars
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        # session_id -> (会话, 最近访问时间)，按访问先后排列，最久未访问的在前
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._removed = 0
+        self._sweeper = None
+        self._stop = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str):
+        """取出会话并标记为最近使用；不存在时抛出 SessionNotFound"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                raise SessionNotFound(f"未找到游戏会话: {session_id}")
+            self._sessions[session_id] = (entry[0], time.monotonic())
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def add(self, session):
+        """保存新会话，超出上限时淘汰最久未使用的会话"""
+        with self._lock:
+            self._sessions[session.session_id] = (session, time.monotonic())
+            evicted = self._evict_over_limit(keep=session.session_id)
+        self._close(evicted, "超出上限")
+
+    def delete(self, session_id: str) -> bool:
+        """删除会话，返回是否存在"""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        if entry is None:
+            return False
+        self._close([entry[0]], "删除")
+        return True
+
+    def peek(self, session_id: str):
+        """取出会话但不标记为最近使用（推送流检查会话是否仍存在时调用）；不存在时抛出 SessionNotFound"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        if entry is None:
+            raise SessionNotFound(f"未找到游戏会话: {session_id}")
+        return entry[0]
+
+    def save(self, session):
+        """一次请求结束后调用；内存存储中会话对象本身就是状态，无需保存"""
+
+    def _evict_over_limit(self, keep: str = None) -> list:
+        """按 LRU 淘汰超出数量或字符数上限的会话（调用方持有锁），返回被淘汰的会话"""
+        evicted = []
+        while self.max_sessions is not None and len(self._sessions) > self.max_sessions:
+            evicted.append(self._pop_oldest(keep))
+        if self.max_total_chars is not None:
+            total = sum(session.footprint() for session, _ in self._sessions.values())
+            while total > self.max_total_chars and len(self._sessions) > 1:
+                session = self._pop_oldest(keep)
+                total -= session.footprint()
+                evicted.append(session)
+        return evicted
+
+    def _pop_oldest(self, keep: str = None):
+        for session_id in self._sessions:
+            if session_id != keep:
+                return self._sessions.pop(session_id)[0]
+        raise RuntimeError("没有可淘汰的会话")
+
+    def _close(self, sessions: list, reason: str):
+        for session in sessions:
+            self._removed += 1
+            logger.info("移除会话 %s（%s）", session.session_id, reason)
+            try:
+                session.close()
+            except Exception as e:
+                logger.warning("关闭会话 %s 出错: %s", session.session_id, e)
+
+    def sweep(self) -> list:
+        """
+        清理一次：移除空闲超时的会话，再按上限淘汰
+
+        Returns:
+            list: 被移除的会话 ID
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = []
+            if self.idle_ttl is not None:
+                # 按访问先后排列，遇到第一个未过期的即可停止
+                for session_id, (session, last_access) in list(self._sessions.items()):
+                    if now - last_access <= self.idle_ttl:
+                        break
+                    del self._sessions[session_id]
+                    expired.append(session)
+            evicted = self._evict_over_limit()
+        self._close(expired, "空闲超时")
+        self._close(evicted, "超出上限")
+        return [session.session_id for session in expired + evicted]
+
+    def stats(self) -> dict:
+        """当前会话数、估算字符数与累计移除数"""
+        with self._lock:
+            sessions = [session for session, _ in self._sessions.values()]
+        return {
+            "sessions": len(sessions),
+            "total_chars": sum(session.footprint() for session in sessions),
+            "removed": self._removed,
+        }
+
+    # ------------------------------------------------------------------
+    # 后台清理
+    # ------------------------------------------------------------------
+
+    def start_sweeper(self):
+        """启动后台清理线程（重复调用无效）"""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+            self._sweeper = None
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                removed = self.sweep()
+                if removed:
+                    logger.info("会话清理：移除 %d 个，剩余 %d 个", len(removed), len(self))
+            except Exception as e:
+                logger.warning("会话清理出错: %s", e)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id  TEXT PRIMARY KEY,
+    version     INTEGER NOT NULL,
+    event_count INTEGER NOT NULL,
+    record      TEXT NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at);
+CREATE TABLE IF NOT EXISTS session_events (
+    session_id TEXT NOT NULL,
+    seq        INTEGER NOT NULL,
+    event      TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite 持久化的会话存储（WAL 模式，读写互不阻塞）
+
+    sessions 表每个会话一行，保存 GameSession.to_record() 快照与版本；
+    session_events 是只追加的事件日志，每次保存只写入新事件。
+
+    已加载的会话按 SessionStore 的规则（LRU / 空闲超时）缓存在内存中。取会话时先比较数据库中的版本：
+    未变化直接使用缓存；被其他进程更新过时重新读取状态快照，事件只读取缓存中没有的部分。
+
+    不同进程同时推进同一会话时按版本做乐观并发控制：保存时发现版本已被他人更新则抛出 SessionConflict，
+    本次修改不写入。推进过程中产生的事件在请求结束保存后才对其他进程可见。
+
+    Args:
+        path: 数据库文件路径
+        retention: 会话在数据库中的保留时间（秒，从最后一次保存算起），None 表示永久保留
+        **cache_options: 传给 SessionStore 的内存缓存参数
+    """
+
+    def __init__(self, path, retention: float = 7 * 24 * 3600, **cache_options):
+        super().__init__(**cache_options)
+        self.path = path
+        self.retention = retention
+        self._local = threading.local()
+        self._db().executescript(_SCHEMA)
+
+    def _db(self) -> sqlite3.Connection:
+        """当前线程的数据库连接（sqlite3 连接不能跨线程使用）"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def __len__(self) -> int:
+        return self._db().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def __contains__(self, session_id: str) -> bool:
+        row = self._db().execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row is not None
+
+    @staticmethod
+    def _append_events(db, session_id: str, encoded_events: list, start: int):
+        """写入事件（直接使用会话中已编码的事件）"""
+        db.executemany(
+            "INSERT INTO session_events (session_id, seq, event) VALUES (?, ?, ?)",
+            [(session_id, seq, event.decode("utf-8")) for seq, event in enumerate(encoded_events, start)],
+        )
+
+    def _cache(self, session):
+        """放入内存缓存（替换同 ID 的旧对象），超出上限时淘汰最久未使用的"""
+        with self._lock:
+            self._sessions[session.session_id] = (session, time.monotonic())
+            self._sessions.move_to_end(session.session_id)
+            evicted = self._evict_over_limit(keep=session.session_id)
+        self._close(evicted, "移出缓存")
+
+    def _uncache(self, session_id: str):
+        """丢弃缓存中的会话（不关闭，可能仍有请求在使用）"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def get(self, session_id: str):
+        db = self._db()
+        row = db.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            self._uncache(session_id)
+            raise SessionNotFound(f"未找到游戏会话: {session_id}")
+
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        cached = entry[0] if entry is not None else None
+        if cached is not None and cached.stored_version == row[0]:
+            return super().get(session_id)
+
+        from interactive_game import GameSession
+
+        row = db.execute("SELECT version, event_count, record FROM sessions WHERE session_id = ?",
+                         (session_id,)).fetchone()
+        if row is None:
+            self._uncache(session_id)
+            raise SessionNotFound(f"未找到游戏会话: {session_id}")
+        version, event_count, record = row
+
+        # 事件只追加，缓存中已有的部分不必重新读取
+        known = list(cached.events) if cached is not None and len(cached.events) <= event_count else []
+        rows = db.execute(
+            "SELECT event FROM session_events WHERE session_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (session_id, len(known), event_count),
+        ).fetchall()
+        events = known + [json.loads(event) for event, in rows]
+
+        session = GameSession.from_record(json.loads(record), events)
+        session.stored_version = version
+        # 替换缓存中的旧对象但不关闭它（同 _uncache）：本进程中可能仍有请求或推送通道在使用，
+        # 不再被引用后由垃圾回收释放
+        self._cache(session)
+        return session
+
+    def peek(self, session_id: str):
+        """同 get：数据库中的版本更新时重新加载，推送流借此发现其他进程推进的会话"""
+        return self.get(session_id)
+
+    def add(self, session):
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO sessions (session_id, version, event_count, record, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (session.session_id, session.version, len(session.events),
+                 fast_json.dumps(session.to_record()).decode("utf-8"), time.time()),
+            )
+            self._append_events(db, session.session_id, session.encoded_events(0, len(session.events)), 0)
+        session.stored_version = session.version
+        self._cache(session)
+
+    def save(self, session):
+        """写入新状态与新事件；会话已被删除或被其他进程更新时抛出 SessionConflict"""
+        if session.stored_version == session.version:
+            return
+        record = fast_json.dumps(session.to_record()).decode("utf-8")
+        event_count = len(session.events)
+
+        with self._transaction() as db:
+            row = db.execute("SELECT version, event_count FROM sessions WHERE session_id = ?",
+                             (session.session_id,)).fetchone()
+            conflict = row is None or row[0] != session.stored_version
+            if not conflict:
+                self._append_events(db, session.session_id, session.encoded_events(row[1], event_count), row[1])
+                db.execute(
+                    "UPDATE sessions SET version = ?, event_count = ?, record = ?, updated_at = ? WHERE session_id = ?",
+                    (session.version, event_count, record, time.time(), session.session_id),
+                )
+        if conflict:
+            # 缓存中的会话已与数据库不一致，下次取会话时重新加载
+            self._uncache(session.session_id)
+            raise SessionConflict(f"会话 {session.session_id} 已被删除或在其他进程中更新，本次修改未保存")
+        session.stored_version = session.version
+
+    def delete(self, session_id: str) -> bool:
+        with self._transaction() as db:
+            deleted = db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount > 0
+            db.execute("DELETE FROM session_events WHERE session_id = ?", (session_id,))
+        return super().delete(session_id) or deleted
+
+    def sweep(self) -> list:
+        """
+        清理一次：内存缓存按空闲超时与上限淘汰，数据库删除超过保留时间的会话
+
+        Returns:
+            list: 从数据库中删除的会话 ID
+        """
+        super().sweep()
+        if self.retention is None:
+            return []
+        cutoff = time.time() - self.retention
+        with self._transaction() as db:
+            expired = [session_id for session_id, in db.execute(
+                "SELECT session_id FROM sessions WHERE updated_at < ?", (cutoff,))]
+            db.executemany("DELETE FROM session_events WHERE session_id = ?", [(sid,) for sid in expired])
+            db.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+        for session_id in expired:
+            super().delete(session_id)
+        return expired
+
+    def stats(self) -> dict:
+        """内存缓存的统计，外加数据库中的会话数"""
+        stats = super().stats()
+        stats["stored"] = len(self)
+        return stats
+
+
+def store_from_env() -> SessionStore:
+    """按环境变量创建会话存储"""
+    max_chars = int(os.getenv("AMPHOREUS_SESSION_MAX_CHARS", "0"))
+    options = {
+        "max_sessions": int(os.getenv("AMPHOREUS_MAX_SESSIONS", "200")),
+        "idle_ttl": float(os.getenv("AMPHOREUS_SESSION_TTL", "1800")),
+        "max_total_chars": max_chars or None,
+    }
+    path = os.getenv("AMPHOREUS_SESSION_DB")
+    if path:
+        retention = float(os.getenv("AMPHOREUS_SESSION_RETENTION", str(7 * 24 * 3600)))
+        return SQLiteSessionStore(path, retention=retention, **options)
+    return SessionStore(**options)
+
+
+if __name__ == "__main__":
+    # 用不调用模型的假会话演示 LRU 淘汰与空闲超时
+    class _FakeSession:
+        def __init__(self, session_id):
+            self.session_id = session_id
+
+        def footprint(self):
+            return 1000
+
+        def close(self):
+            print(f">>> 关闭 {self.session_id}")
+
+    store = SessionStore(max_sessions=2, idle_ttl=0.1)
+    for name in ("a", "b"):
+        store.add(_FakeSession(name))
+    store.get("a")
+    store.add(_FakeSession("c"))              # 淘汰最久未使用的 b
+    print(">>> 剩余:", list(store._sessions))
+    time.sleep(0.2)
+    print(">>> 清理:", store.sweep(), store.stats())
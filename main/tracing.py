@@ -0,0 +1,299 @@
+"""
+tracing.py - 轻量级分段追踪（span tracing）
+
+把一次运行拆成嵌套的 span：run → round → phase → agent_call → http_request，
+每个 span 记录起止时间与属性（char_id、scene、提示词字符数、token 数、重试次数等），
+结束时以 JSON Lines 形式写入追踪文件，可转换为 Chrome Trace 格式在
+chrome://tracing 或 https://ui.perfetto.dev 中以瀑布图查看。
+
+默认关闭，开启方式二选一：
+    - 环境变量 AMPHOREUS_TRACE_FILE=trace.jsonl
+    - 代码中调用 tracing.configure("trace.jsonl")
+
+用法:
+    import tracing
+
+    with tracing.span("phase", phase="fire_decisions"):
+        ...                                  # 内部发起的调用自动成为子 span
+
+    # 跨 yield 的长生命周期 span（生成器、跨请求的会话）需手动结束
+    round_span = tracing.start_span("round", round_num=1)
+    with tracing.use_span(round_span):
+        ...                                  # 不含 yield 的代码块
+    round_span.end()
+
+查看追踪文件：
+    python main/tracing.py trace.jsonl                  # 终端瀑布图
+    python main/tracing.py trace.jsonl --chrome out.json  # 导出 Chrome Trace
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+_current_span = contextvars.ContextVar("amphoreus_current_span", default=None)
+
+
+class Span:
+    """一次追踪中的一个时间段"""
+
+    def __init__(self, tracer, name: str, parent=None, **attrs):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.attrs = dict(attrs)
+        self.start = time.time()
+        self.end_time = None
+        self.thread = threading.current_thread().name
+
+    def set(self, **attrs):
+        """追加或覆盖属性"""
+        self.attrs.update(attrs)
+        return self
+
+    def end(self):
+        """结束 span 并写入追踪文件（重复调用无效）"""
+        if self.end_time is not None:
+            return
+        self.end_time = time.time()
+        self.tracer._write(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end_time,
+            "duration": (self.end_time or time.time()) - self.start,
+            "thread": self.thread,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    """追踪关闭时返回的占位 span，所有操作都是空操作"""
+
+    span_id = None
+    trace_id = None
+
+    def set(self, **attrs):
+        return self
+
+    def end(self):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """把结束的 span 追加写入 JSON Lines 文件；path 为 None 时不做任何记录"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1) if path else None
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    def start_span(self, name: str, parent=None, **attrs):
+        """
+        创建并开始一个 span，不改变当前上下文
+
+        Args:
+            name: span 名称
+            parent: 父 span，默认取当前上下文中的 span
+            **attrs: 属性
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        if parent is None:
+            parent = _current_span.get()
+        if isinstance(parent, _NoopSpan):
+            parent = None
+        return Span(self, name, parent=parent, **attrs)
+
+    @contextmanager
+    def span(self, name: str, parent=None, **attrs):
+        """创建 span 并在 with 块内设为当前 span，块结束时自动结束"""
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+        current = self.start_span(name, parent=parent, **attrs)
+        token = _current_span.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.set(error=repr(e))
+            raise
+        finally:
+            _current_span.reset(token)
+            current.end()
+
+    def _write(self, span: Span):
+        if self._file is None:
+            return
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_tracer = Tracer(os.getenv("AMPHOREUS_TRACE_FILE") or None)
+atexit.register(lambda: _tracer.close())
+
+
+def get_tracer() -> Tracer:
+    """获取全局 Tracer"""
+    return _tracer
+
+
+def configure(path=None) -> Tracer:
+    """
+    重新配置全局 Tracer
+
+    Args:
+        path: 追踪文件路径，None 表示关闭追踪
+    """
+    global _tracer
+    _tracer.close()
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def span(name: str, parent=None, **attrs):
+    """在全局 Tracer 上创建 with 形式的 span"""
+    return _tracer.span(name, parent=parent, **attrs)
+
+
+def start_span(name: str, parent=None, **attrs):
+    """在全局 Tracer 上手动开始一个 span，需要调用 .end() 结束"""
+    return _tracer.start_span(name, parent=parent, **attrs)
+
+
+def current_span():
+    """当前上下文中的 span（可能为 None）"""
+    return _current_span.get()
+
+
+@contextmanager
+def use_span(active):
+    """在 with 块内把已有的 span 设为当前 span（不会结束它）"""
+    if active is None or isinstance(active, _NoopSpan):
+        yield active
+        return
+    token = _current_span.set(active)
+    try:
+        yield active
+    finally:
+        _current_span.reset(token)
+
+
+def wrap_context(fn):
+    """
+    让 fn 在当前上下文的副本中执行，用于把当前 span 带入线程池等其他线程
+
+    Returns:
+        可调用对象，调用时等价于 fn()
+    """
+    ctx = contextvars.copy_context()
+    return lambda: ctx.run(fn)
+
+
+# ===================================================================
+# 追踪文件查看
+# ===================================================================
+
+def load_spans(path: str) -> list:
+    """读取追踪文件中的所有 span 记录"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def to_chrome_trace(spans: list) -> dict:
+    """转换为 Chrome Trace Event 格式（complete 事件），可在 Perfetto 中查看瀑布图"""
+    threads = {}
+    events = []
+    for s in spans:
+        tid = threads.setdefault(s["thread"], len(threads) + 1)
+        events.append({
+            "name": s["name"] if not s["attrs"].get("char_id") else f"{s['name']}:{s['attrs']['char_id']}",
+            "cat": s["name"],
+            "ph": "X",
+            "ts": s["start"] * 1e6,
+            "dur": s["duration"] * 1e6,
+            "pid": s["trace_id"][:8],
+            "tid": tid,
+            "args": s["attrs"],
+        })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def format_waterfall(spans: list, width: int = 60) -> list:
+    """按父子关系缩进、按开始时间排序，生成文本瀑布图"""
+    if not spans:
+        return []
+    children = {}
+    for s in spans:
+        children.setdefault(s["parent_id"], []).append(s)
+    for items in children.values():
+        items.sort(key=lambda item: item["start"])
+
+    origin = min(s["start"] for s in spans)
+    total = max(s["end"] for s in spans) - origin or 1.0
+    known = {s["span_id"] for s in spans}
+    roots = [s for s in spans if s["parent_id"] not in known]
+    roots.sort(key=lambda item: item["start"])
+
+    lines = []
+
+    def _emit(s, depth):
+        offset = int((s["start"] - origin) / total * width)
+        length = max(1, int(s["duration"] / total * width))
+        bar = " " * offset + "█" * length
+        label = s["name"]
+        for key in ("phase", "char_id", "scene", "round_num"):
+            if key in s["attrs"]:
+                label += f" {key}={s['attrs'][key]}"
+        lines.append(f"{bar:<{width + 1}} {s['duration']:8.2f}s {'  ' * depth}{label}")
+        for child in children.get(s["span_id"], []):
+            _emit(child, depth + 1)
+
+    for root in roots:
+        _emit(root, 0)
+    return lines
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("用法: python main/tracing.py trace.jsonl [--chrome out.json]")
+        sys.exit(1)
+
+    records = load_spans(sys.argv[1])
+    if "--chrome" in sys.argv:
+        out_path = sys.argv[sys.argv.index("--chrome") + 1]
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(to_chrome_trace(records), f, ensure_ascii=False)
+        print(f"已导出 {len(records)} 个 span 到 {out_path}")
+    else:
+        for line in format_waterfall(records):
+            print(line)
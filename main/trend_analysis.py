@@ -0,0 +1,229 @@
+"""
+trend_analysis.py - 跨轮次的趋势分析
+
+基于 OutcomeStore 的结局矩阵做向量化统计，几万轮的数据也只需几毫秒，
+因此既可以在批量运行后离线分析，也可以由服务端在每次请求时实时计算：
+
+    - 状态转移矩阵：每位角色相邻两轮之间由状态 i 变为状态 j 的次数与概率
+    - 交出 / 强夺率曲线：按轮次统计逐火者中主动交出、被强夺的比例
+    - 劝说存活曲线：顽固者在第 a 次劝说后仍未交出火种的比例（被强夺者视为始终未交出）
+    - 记忆规模相关性：盗火行者记忆字符数与每轮各类比例的 Pearson 相关系数
+
+用法:
+    from trend_analysis import analyze_trends
+
+    store = OutcomeStore()
+    eternal_regression(rounds=50, store=store)
+    trends = analyze_trends(store)          # 可直接 JSON 序列化
+"""
+
+import numpy as np
+
+from outcome_store import OutcomeStore, Status, STATUS_LABELS
+
+
+# 参与统计的状态（不含 MISSING），下标即 Status 的值
+STATUSES = [status for status in Status if status != Status.MISSING]
+N_STATUSES = len(STATUSES)
+
+
+def _ratio(numerator, denominator) -> np.ndarray:
+    """逐元素相除，分母为 0 处为 NaN"""
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    out = np.full(np.broadcast(numerator, denominator).shape, np.nan)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+def _to_list(values) -> list:
+    """numpy 数组转为 JSON 友好的列表（NaN 转为 None）"""
+    values = np.asarray(values)
+    if values.dtype.kind != 'f':
+        return values.tolist()
+    out = values.astype(object)
+    out[np.isnan(values)] = None
+    return out.tolist()
+
+
+def _fire_mask(codes: np.ndarray) -> np.ndarray:
+    """逐火者掩码（FIRE_CODES 即除 MISSING 与 NO_FIRE 外的全部状态，比 np.isin 快）"""
+    return (codes != Status.MISSING) & (codes != Status.NO_FIRE)
+
+
+def transition_counts(store: OutcomeStore) -> np.ndarray:
+    """
+    相邻两轮的状态转移次数
+
+    只统计同一次运行中轮次相邻的两行，任一轮缺少该角色时跳过。
+
+    Returns:
+        np.ndarray: 形状 (角色数, 状态数, 状态数)，[c, i, j] 为角色 c 由状态 i 变为 j 的次数
+    """
+    codes = store.codes.astype(np.int64)
+    n_chars = codes.shape[1]
+    if len(codes) < 2:
+        return np.zeros((n_chars, N_STATUSES, N_STATUSES), dtype=np.int64)
+
+    consecutive = ((store.run_ids[1:] == store.run_ids[:-1])
+                   & (store.round_nums[1:] == store.round_nums[:-1] + 1))
+    prev, nxt = codes[:-1][consecutive], codes[1:][consecutive]
+    valid = (prev != Status.MISSING) & (nxt != Status.MISSING)
+    chars = np.broadcast_to(np.arange(n_chars), prev.shape)
+
+    index = (chars[valid] * N_STATUSES + prev[valid]) * N_STATUSES + nxt[valid]
+    counts = np.bincount(index, minlength=n_chars * N_STATUSES * N_STATUSES)
+    return counts.reshape(n_chars, N_STATUSES, N_STATUSES)
+
+
+def transition_matrices(store: OutcomeStore, counts: np.ndarray = None) -> np.ndarray:
+    """按行归一化的状态转移概率，从未出现过的起始状态整行为 0（可传入已算好的转移次数）"""
+    if counts is None:
+        counts = transition_counts(store)
+    totals = counts.sum(axis=2, keepdims=True)
+    return np.nan_to_num(_ratio(counts, totals))
+
+
+def rate_curves(store: OutcomeStore) -> dict:
+    """
+    按轮次（跨所有运行合并）统计各类比例
+
+    Returns:
+        dict: round -> 轮次；fire_rate -> 逐火者 / 在场角色；
+              handover_rate / robbery_rate -> 主动交出 / 被强夺 占逐火者的比例
+    """
+    codes = store.codes
+    if not len(codes):
+        return {'round': np.array([], dtype=int), 'fire_rate': np.array([]),
+                'handover_rate': np.array([]), 'robbery_rate': np.array([])}
+
+    rounds, row_round = np.unique(store.round_nums, return_inverse=True)
+
+    def per_round(mask):
+        return np.bincount(row_round, weights=mask.sum(axis=1), minlength=len(rounds))
+
+    present = per_round(codes != Status.MISSING)
+    fire = per_round(_fire_mask(codes))
+    return {
+        'round': rounds,
+        'fire_rate': _ratio(fire, present),
+        'handover_rate': _ratio(per_round(codes == Status.HANDED_OVER), fire),
+        'robbery_rate': _ratio(per_round(codes == Status.ROBBED), fire),
+    }
+
+
+def persuasion_survival(store: OutcomeStore, max_attempts: int = None) -> dict:
+    """
+    劝说存活曲线
+
+    顽固者 = 劝说后才交出火种的角色 + 被强夺的角色。survival[a] 是顽固者中
+    经过 a 次劝说后仍未交出火种的比例（a = 0 时为 1）。
+
+    Returns:
+        dict: attempt -> 0..max_attempts；survival -> 全体曲线；
+              by_character -> 形状 (角色数, max_attempts + 1) 的逐角色曲线
+    """
+    attempts = store.attempts
+    robbed = store.robbed
+    if max_attempts is None:
+        max_attempts = int(attempts.max()) if attempts.size else 0
+
+    steps = np.arange(max_attempts + 1)
+    stubborn = robbed | (attempts > 0)
+    # 每个 a 下仍未交出者：被强夺，或在第 a 次之后才交出
+    still = robbed[None] | (attempts[None] > steps[:, None, None])
+    remaining = still.sum(axis=1)                # (步数, 角色数)
+    total = stubborn.sum(axis=0)                 # (角色数,)
+    return {
+        'attempt': steps,
+        'survival': _ratio(remaining.sum(axis=1), total.sum()),
+        'by_character': _ratio(remaining.T, total[:, None]),
+    }
+
+
+def memory_correlation(store: OutcomeStore) -> dict:
+    """
+    盗火行者记忆规模与每轮结局比例的 Pearson 相关系数（样本不足或方差为 0 时为 NaN）
+
+    Returns:
+        dict: {'fire_rate', 'handover_rate', 'robbery_rate'} -> 相关系数
+    """
+    codes = store.codes
+    memory = store.memory_chars
+    present = (codes != Status.MISSING).sum(axis=1)
+    fire = _fire_mask(codes).sum(axis=1)
+    rates = {
+        'fire_rate': _ratio(fire, present),
+        'handover_rate': _ratio((codes == Status.HANDED_OVER).sum(axis=1), fire),
+        'robbery_rate': _ratio((codes == Status.ROBBED).sum(axis=1), fire),
+    }
+
+    result = {}
+    for name, rate in rates.items():
+        valid = np.isfinite(memory) & np.isfinite(rate)
+        x, y = memory[valid], rate[valid]
+        if len(x) < 2 or x.std() == 0 or y.std() == 0:
+            result[name] = np.nan
+        else:
+            result[name] = float(np.corrcoef(x, y)[0, 1])
+    return result
+
+
+def analyze_trends(store: OutcomeStore) -> dict:
+    """
+    汇总全部趋势指标，结果可直接 JSON 序列化（填入 analyze_regression_logs 的 '趋势分析'）
+    """
+    labels = [STATUS_LABELS[status] for status in STATUSES]
+    counts = transition_counts(store)
+    probabilities = transition_matrices(store, counts)
+
+    transitions = {}
+    for c, char_id in enumerate(store.characters):
+        if not counts[c].any():
+            continue
+        transitions[char_id] = {
+            labels[i]: {labels[j]: round(float(probabilities[c, i, j]), 4) for j in range(N_STATUSES)
+                        if counts[c, i, j]}
+            for i in range(N_STATUSES) if counts[c, i].any()
+        }
+
+    curves = rate_curves(store)
+    survival = persuasion_survival(store)
+    correlation = memory_correlation(store)
+    return {
+        '状态转移概率': transitions,
+        '比例曲线': {
+            '轮次': _to_list(curves['round']),
+            '逐火率': _to_list(curves['fire_rate']),
+            '交出率': _to_list(curves['handover_rate']),
+            '强夺率': _to_list(curves['robbery_rate']),
+        },
+        '劝说存活曲线': {
+            '劝说次数': _to_list(survival['attempt']),
+            '未交出比例': _to_list(survival['survival']),
+            '各角色': {char_id: _to_list(row) for char_id, row in zip(store.characters, survival['by_character'])
+                     if not np.isnan(row[0])},
+        },
+        '记忆规模相关性': {name: None if np.isnan(value) else round(value, 4)
+                       for name, value in correlation.items()},
+    }
+
+
+if __name__ == "__main__":
+    import time
+
+    # 随机生成 2 万轮数据测试耗时
+    rng = np.random.default_rng(0)
+    store = OutcomeStore(characters=[f"char{i}" for i in range(10)], capacity=20000)
+    labels = [STATUS_LABELS[s] for s in (Status.NO_FIRE, Status.HANDED_OVER, Status.ROBBED)]
+    for round_num in range(1, 20001):
+        picks = rng.integers(0, 3, size=10)
+        result = {f"char{i}": labels[p] for i, p in enumerate(picks)}
+        robbed = [c for c, s in result.items() if s == '逐火_火种被强夺']
+        persuaded = {c: int(rng.integers(1, 4)) for c, s in result.items() if s == '逐火_交出火种' and rng.random() < 0.3}
+        store.append(result, robbed, round_num=round_num, persuaded_at=persuaded, memory_chars=round_num * 100)
+
+    start = time.time()
+    trends = analyze_trends(store)
+    print(f"分析 {len(store)} 轮耗时 {(time.time() - start) * 1000:.1f} ms")
+    print(trends['劝说存活曲线']['未交出比例'], trends['记忆规模相关性'])
@@ -0,0 +1,122 @@
+"""
+admission.AdmissionController 的测试：模拟名额、排队深度、单客户端预算、Retry-After 与限制器安装
+
+每个测试使用独立的 CallLoad，用 track() 模拟排队中与在途的模型调用，不发出请求。
+
+运行: python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import threading
+import unittest
+from contextlib import ExitStack
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "main"))
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+
+from admission import AdmissionController, Overloaded, admission_from_env  # noqa: E402
+from config.api_config import CallLoad, get_request_limiter, set_request_limiter  # noqa: E402
+
+
+def _controller(**kwargs) -> AdmissionController:
+    controller = AdmissionController(**kwargs)
+    controller.load = CallLoad()
+    return controller
+
+
+class AdmissionTest(unittest.TestCase):
+
+    def test_simulation_slots(self):
+        admission = _controller(max_simulations=2)
+        leases = [admission.admit_simulation("a") for _ in range(2)]
+        with self.assertRaises(Overloaded) as raised:
+            admission.admit_simulation("b")
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+
+        # release 只生效一次
+        leases[0].release()
+        leases[0].release()
+        self.assertEqual(admission.active_simulations, 1)
+        admission.admit_simulation("b")
+        self.assertEqual(admission.stats()["rejected"], {"simulations": 1})
+
+    def test_queue_depth(self):
+        admission = _controller(max_queued_calls=2, max_client_calls=None)
+        with ExitStack() as stack:
+            # 两个调用在限制器前排队（未调用 started）
+            for _ in range(2):
+                stack.enter_context(admission.load.track("other"))
+            with self.assertRaises(Overloaded) as raised:
+                admission.check("a")
+            self.assertIn("排队", raised.exception.reason)
+        admission.check("a")
+
+    def test_in_flight_calls_are_not_queued(self):
+        admission = _controller(max_queued_calls=1, max_client_calls=None)
+        with admission.load.track("other") as started:
+            started()
+            admission.check("a")
+
+    def test_client_budget(self):
+        admission = _controller(max_queued_calls=None, max_client_calls=2)
+        with ExitStack() as stack:
+            for _ in range(2):
+                stack.enter_context(admission.load.track("greedy"))
+            with self.assertRaises(Overloaded):
+                admission.admit_simulation("greedy")
+            # 其他客户端不受影响
+            admission.admit_simulation("polite").release()
+        self.assertEqual(admission.stats()["rejected"], {"client": 1})
+        self.assertEqual(admission.active_simulations, 0)
+
+    def test_retry_after_grows_with_queue(self):
+        admission = _controller(max_llm_calls=2, retry_after=5, max_retry_after=60)
+        self.assertEqual(admission.retry_after(), 5)
+        admission.load.avg_seconds = 10
+        with ExitStack() as stack:
+            for _ in range(4):
+                stack.enter_context(admission.load.track())
+            # 10 秒 ×（4 个排队 / 2 个并发 + 1）
+            self.assertEqual(admission.retry_after(), 30)
+            for _ in range(20):
+                stack.enter_context(admission.load.track())
+            self.assertEqual(admission.retry_after(), 60)
+
+
+class CallLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        previous = get_request_limiter()
+        set_request_limiter(None)
+        self.addCleanup(set_request_limiter, previous)
+
+    def test_install_default_limiter(self):
+        AdmissionController().install_call_limiter()
+        self.assertIsInstance(get_request_limiter(), threading.BoundedSemaphore)
+
+    def test_keep_existing_limiter(self):
+        limiter = threading.Lock()
+        set_request_limiter(limiter)
+        AdmissionController(max_llm_calls=4).install_call_limiter()
+        self.assertIs(get_request_limiter(), limiter)
+
+    def test_warn_when_queue_budget_is_inert(self):
+        with self.assertLogs("amphoreus", level="WARNING") as logs:
+            AdmissionController(max_llm_calls=None, max_queued_calls=8).install_call_limiter()
+        self.assertIsNone(get_request_limiter())
+        self.assertIn("排队深度上限", logs.output[0])
+
+    def test_from_env(self):
+        env = {"AMPHOREUS_MAX_LLM_CALLS": "0", "AMPHOREUS_MAX_QUEUED_CALLS": "5",
+               "AMPHOREUS_MAX_SIMULATIONS": "3"}
+        with mock.patch.dict(os.environ, env):
+            admission = admission_from_env()
+        self.assertIsNone(admission.max_llm_calls)
+        self.assertEqual((admission.max_queued_calls, admission.max_simulations, admission.max_client_calls),
+                         (5, 3, 16))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+"""
+config.api_config.SimpleAPIClient 的测试：流式请求与 chat 走同一条路径（会话复用、seed / 温度、
+并发限制器、实时负载、指标与取消），以及每次调用的结果按线程保存
+
+HTTP 会话替换为假的响应，不发出网络请求。
+
+运行: python -m unittest discover -s tests
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "main"))
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+
+import metrics  # noqa: E402
+from cancellation import CancelToken, Cancelled, use_token  # noqa: E402
+from config.api_config import SimpleAPIClient, get_call_load, use_request_limiter  # noqa: E402
+
+
+def _sse(*chunks, usage=None):
+    lines = [b"data: " + json.dumps({"choices": [{"delta": {"content": chunk}}]}).encode() for chunk in chunks]
+    if usage:
+        lines.append(b"data: " + json.dumps({"choices": [], "usage": usage}).encode())
+    return lines + [b"", b"data: [DONE]"]
+
+
+class _FakeResponse:
+    def __init__(self, lines=(), status_code=200, payload=None):
+        self.lines = list(lines)
+        self.status_code = status_code
+        self.payload = payload
+        self.text = "错误"
+        self.closed = False
+
+    def iter_lines(self):
+        for line in self.lines:
+            yield line
+
+    def json(self):
+        return self.payload
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+
+class ChatStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = SimpleAPIClient("deepseek", model="deepseek-chat", temperature=0.3, seed=7)
+        self.addCleanup(self.client.close)
+
+    def _stream(self, response, **kwargs):
+        with mock.patch.object(self.client.session, "post", return_value=response) as post:
+            chunks = list(self.client.chat_stream("你好", system_prompt="系统", **kwargs))
+        return chunks, post
+
+    def test_stream_uses_session_and_client_options(self):
+        usage = {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}
+        response = _FakeResponse(_sse("逐", "火", usage=usage))
+        before = metrics.LLM_LATENCY.values().get(("deepseek", "unknown", "ok"), ([], 0, 0))[2]
+        with mock.patch("requests.post") as module_post:
+            chunks, post = self._stream(response)
+
+        self.assertEqual(chunks, ["逐", "火"])
+        module_post.assert_not_called()
+        body = post.call_args.kwargs["json"]
+        self.assertEqual((body["temperature"], body["seed"], body["stream"]), (0.3, 7, True))
+        self.assertTrue(post.call_args.kwargs["stream"])
+        self.assertTrue(response.closed)
+        self.assertTrue(self.client.last_ok)
+        self.assertEqual(self.client.last_usage, usage)
+        self.assertEqual(metrics.LLM_LATENCY.values()[("deepseek", "unknown", "ok")][2], before + 1)
+
+    def test_explicit_temperature(self):
+        _, post = self._stream(_FakeResponse(_sse("好")), temperature=1.0)
+        self.assertEqual(post.call_args.kwargs["json"]["temperature"], 1.0)
+
+    def test_http_error(self):
+        chunks, _ = self._stream(_FakeResponse(status_code=500))
+        self.assertEqual(chunks, ["API调用失败 (HTTP 500): 错误"])
+        self.assertFalse(self.client.last_ok)
+
+    def test_limiter_and_load_are_held_while_streaming(self):
+        limiter = threading.BoundedSemaphore(1)
+        response = _FakeResponse(_sse("一", "二"))
+        with mock.patch.object(self.client.session, "post", return_value=response), use_request_limiter(limiter):
+            stream = self.client.chat_stream("你好")
+            self.assertEqual(next(stream), "一")
+            self.assertFalse(limiter.acquire(blocking=False))
+            self.assertEqual(get_call_load().in_flight, 1)
+            # 提前关闭时释放限额并关闭响应
+            stream.close()
+        self.assertTrue(limiter.acquire(blocking=False))
+        self.assertEqual(get_call_load().in_flight, 0)
+        self.assertTrue(response.closed)
+
+    def test_cancelled(self):
+        token = CancelToken()
+        response = _FakeResponse(_sse("一", "二"))
+        with mock.patch.object(self.client.session, "post", return_value=response) as post, use_token(token):
+            stream = self.client.chat_stream("你好")
+            self.assertEqual(next(stream), "一")
+            token.cancel()
+            with self.assertRaises(Cancelled):
+                next(stream)
+            with self.assertRaises(Cancelled):
+                next(self.client.chat_stream("你好"))
+        self.assertEqual(post.call_count, 1)
+        self.assertTrue(response.closed)
+
+
+class PerThreadResultTest(unittest.TestCase):
+
+    def test_response_time_is_per_thread(self):
+        client = SimpleAPIClient("deepseek", model="deepseek-chat")
+        self.addCleanup(client.close)
+        payload = {"choices": [{"message": {"content": "好"}}], "usage": {"total_tokens": 1}}
+        results = {}
+
+        def post(*args, **kwargs):
+            if threading.current_thread().name == "slow":
+                time.sleep(0.2)
+            return _FakeResponse(payload=payload)
+
+        def run():
+            client.chat("你好")
+            results[threading.current_thread().name] = (client.get_response_time(), client.last_ok)
+
+        with mock.patch.object(client.session, "post", side_effect=post):
+            threads = [threading.Thread(target=run, name=name) for name in ("slow", "fast")]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertGreaterEqual(results["slow"][0], 0.2)
+        self.assertLess(results["fast"][0], 0.2)
+        self.assertTrue(results["slow"][1] and results["fast"][1])
+        # 主线程没有发出过请求
+        self.assertEqual((client.response_time, client.last_ok, client.last_usage), (0, False, {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
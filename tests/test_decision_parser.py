@@ -0,0 +1,103 @@
+"""
+decision_parser 的测试
+
+内置语料按模型实际回复的常见形态整理，每条再做随机变形（加代码块、前后缀、换引号、加噪声），
+逐条核对解析出的 decision 与 reason。
+
+运行: python -m unittest discover -s tests
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "main"))
+
+from decision_parser import extract_reason, normalize_decision, parse_decision, parse_decision_map  # noqa: E402
+
+
+# 按模型实际回复的常见形态整理：(回复, 期望 decision, 期望 reason)
+CORPUS = [
+    ('{"decision": "1", "reason": "我愿为翁法罗斯而战。"}', '1', '我愿为翁法罗斯而战。'),
+    ('```json\n{"decision": "0", "reason": "花海尽头，我只愿守护安宁。"}\n```', '0', '花海尽头，我只愿守护安宁。'),
+    ("{'decision': '1', 'reason': '若这是命运，我便接受它。'}", '1', '若这是命运，我便接受它。'),
+    ('```\n{"decision": 1, "reason": "为了大家。"}\n```', '1', '为了大家。'),
+    ('经过深思熟虑，我的回答是：\n```json\n{"decision": "0", "reason": "火种是我存在的意义，我不会交出。"}\n```\n以上。',
+     '0', '火种是我存在的意义，我不会交出。'),
+    ('{"decision": "1", "reason": "他说\\"交出火种\\"，我信他。"}', '1', '他说"交出火种"，我信他。'),
+    ("{'decision': 0, 'reason': \"I won't give it up.\"}", '0', "I won't give it up."),
+    ('{"decision": true, "reason": "是。"}', '1', '是。'),
+    ('{\n  "decision": "1",\n  "reason": "多行\n理由"\n}', '1', '多行\n理由'),
+    ('{"decision"：“1”, "reason": "全角冒号。"}', '1', '全角冒号。'),
+    ('{"reason": "先写理由，再写决定。", "decision": "0"}', '0', '先写理由，再写决定。'),
+    ('{"decision": "1", "reason": "被截断的理由', '1', ''),
+    ('indecision: 1', '', ''),
+    ('My indecision: 1. {"decision": "0", "reason": "再三犹豫后拒绝。"}', '0', '再三犹豫后拒绝。'),
+    ('我想我会同意吧', '', ''),
+    ('API调用失败 (HTTP 500)', '', ''),
+    ('', '', ''),
+]
+
+
+def mutations(text: str, rng):
+    """对语料做随机变形：加代码块、加前后缀、替换引号风格"""
+    yield text
+    if '```' not in text:
+        yield f"```json\n{text}\n```"
+        yield f"好的。\n```\n{text}\n```\n"
+    yield f"  {text}\n\n（以上是我的回答）"
+    if '"' in text and "'" not in text and '\\' not in text:
+        yield text.replace('"', "'")
+    noise = ''.join(rng.choice('逐火交出火种，。 \n') for _ in range(rng.randint(0, 30)))
+    yield f"{noise}{text}"
+
+
+class ParseDecisionTest(unittest.TestCase):
+
+    def test_corpus_with_mutations(self):
+        rng = random.Random(0)
+        for text, want_decision, want_reason in CORPUS:
+            for variant in mutations(text, rng):
+                with self.subTest(variant=variant):
+                    got = parse_decision(variant)
+                    self.assertEqual(got.decision, want_decision)
+                    if want_reason:
+                        self.assertEqual(got.reason, want_reason)
+
+    def test_decision_key_needs_word_boundary(self):
+        for text in ("indecision: 1", "my_decision: 1", "Indecision：true", "predecision: 0"):
+            with self.subTest(text=text):
+                self.assertEqual(parse_decision(text).decision, "")
+        # 中文紧挨着不带引号的键名仍然可以解析
+        self.assertEqual(parse_decision("回答decision: 1").decision, "1")
+        self.assertEqual(parse_decision("decision: false").decision, "0")
+
+    def test_dict_message(self):
+        self.assertEqual(parse_decision({"Decision": True, "Reason": " 是 "}), ("1", "是"))
+        self.assertEqual(parse_decision(None), ("", ""))
+
+
+class HelpersTest(unittest.TestCase):
+
+    def test_normalize_decision(self):
+        cases = [(True, "1"), (False, "0"), (1, "1"), (0, "0"), (2, ""), (" `1` ", "1"), ("'0'", "0"),
+                 ("yes", ""), (None, "")]
+        for value, want in cases:
+            with self.subTest(value=value):
+                self.assertEqual(normalize_decision(value), want)
+
+    def test_parse_decision_map(self):
+        reply = '```json\n{"ApoRia432": "1", "EleOs252": 0, "KaLos618": "maybe"}\n```'
+        self.assertEqual(parse_decision_map(reply), {"ApoRia432": "1", "EleOs252": "0", "KaLos618": ""})
+        self.assertEqual(parse_decision_map("无法解析"), {})
+        self.assertEqual(parse_decision_map({"A": True}), {"A": "1"})
+
+    def test_extract_reason(self):
+        self.assertEqual(extract_reason('{"decision": "1", "reason": "理由"}'), "理由")
+        self.assertEqual(extract_reason("纯文本", default="纯文本"), "纯文本")
+        self.assertEqual(extract_reason("", default="默认"), "默认")
+
+
+if __name__ == "__main__":
+    unittest.main()
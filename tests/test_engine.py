@@ -0,0 +1,80 @@
+"""
+engine.SimulationEngine 决策阶段的测试
+
+并发调度时每个决策调用完成即产生事件，不等同阶段最慢的调用；
+本地无法解析的决策在阶段末尾合并兜底解析。模型调用替换为按角色设定耗时的假策略。
+
+运行: python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "main"))
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+
+import engine  # noqa: E402
+from engine import RoundState, SimulationEngine  # noqa: E402
+
+
+class _DelayedPolicy:
+    """睡眠 delay 秒后回答 reply，并像真实角色一样写入记忆"""
+
+    is_player = False
+
+    def __init__(self, delay: float, reply: str):
+        self.delay = delay
+        self.reply = reply
+
+    def decide(self, heir, question):
+        time.sleep(self.delay)
+        heir.memory.append(self.reply)
+        return self.reply
+
+
+def _state(names):
+    return RoundState(1, {name: SimpleNamespace(memory=[]) for name in names})
+
+
+class DecideTest(unittest.TestCase):
+
+    def setUp(self):
+        self.policies = {
+            "slow": _DelayedPolicy(0.3, '{"decision": "1", "reason": "慢"}'),
+            "fast": _DelayedPolicy(0.0, '{"decision": "0", "reason": "快"}'),
+            "vague": _DelayedPolicy(0.1, "我想我会同意吧"),
+            "middle": _DelayedPolicy(0.15, '{"decision": "1", "reason": "中"}'),
+        }
+        self.questions = {name: "问题" for name in self.policies}
+
+    def _run(self, scheduler):
+        eng = SimulationEngine(black_heirs={}, policies=self.policies, scheduler=scheduler, max_workers=4)
+        state = _state(self.questions)
+        events = []
+        with mock.patch.object(engine, "decode_decisions", lambda memories: {name: "1" for name in memories}):
+            gen = eng._decide(state, "fire_decision", self.questions)
+            try:
+                while True:
+                    events.append(next(gen))
+            except StopIteration as stop:
+                return events, stop.value
+
+    def test_thread_yields_in_completion_order(self):
+        events, decisions = self._run("thread")
+        # 本地解析成功的按完成顺序产生，兜底解析的在最后
+        self.assertEqual([event["char_id"] for event in events], ["fast", "middle", "slow", "vague"])
+        self.assertEqual(list(decisions), list(self.questions))
+        self.assertEqual(decisions, {"slow": "1", "fast": "0", "vague": "1", "middle": "1"})
+
+    def test_sync_yields_in_question_order(self):
+        events, decisions = self._run("sync")
+        self.assertEqual([event["char_id"] for event in events], ["slow", "fast", "middle", "vague"])
+        self.assertEqual(decisions, {"slow": "1", "fast": "0", "vague": "1", "middle": "1"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+jobs.JobQueue 的测试：取消排队中与运行中的任务、不存在的任务
+
+模型请求替换为固定回复（每次稍作等待），不发出网络请求；取消检查仍由真实的 chat 进行。
+
+运行: python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "main"))
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+
+from config.api_config import SimpleAPIClient  # noqa: E402
+from jobs import JobNotFound, JobQueue  # noqa: E402
+
+
+REPLY = '{"decision": "1", "reason": "测试"}'
+
+
+class JobQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = threading.Event()
+
+        def slow_post(client, body, span):
+            self.calls.set()
+            time.sleep(0.05)
+            return REPLY
+
+        patcher = mock.patch.object(SimpleAPIClient, "_post_chat", slow_post)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue = JobQueue(max_concurrent_jobs=1)
+        self.addCleanup(self.queue.shutdown)
+
+    def test_cancel_queued_and_running(self):
+        running = self.queue.submit(rounds=3, seed=1)
+        queued = self.queue.submit(rounds=1, seed=2)
+        self.assertTrue(self.calls.wait(5))
+
+        # 只有一个工作线程：第二个任务仍在排队，取消后不再运行
+        self.assertEqual(self.queue.cancel(queued.job_id).status, "cancelled")
+        self.queue.cancel(running.job_id)
+        running.future.result(timeout=10)
+
+        self.assertEqual(running.status, "cancelled")
+        self.assertEqual(queued.status, "cancelled")
+        self.assertEqual(queued.events, [])
+        self.assertEqual(self.queue.counts()["cancelled"], 2)
+        # 已结束的任务再取消不变
+        self.assertEqual(self.queue.cancel(running.job_id).status, "cancelled")
+
+    def test_unknown_job(self):
+        with self.assertRaises(JobNotFound):
+            self.queue.get("nope")
+        with self.assertRaises(JobNotFound):
+            self.queue.cancel("nope")
+
+    def test_finished_jobs_are_discarded(self):
+        queue = JobQueue(max_concurrent_jobs=1, max_finished_jobs=1)
+        self.addCleanup(queue.shutdown)
+        first = queue.submit(rounds=1, seed=1)
+        first.future.result(timeout=30)
+        queue.submit(rounds=1, seed=2).future.result(timeout=30)
+        queue.submit(rounds=1, seed=3)
+        with self.assertRaises(JobNotFound):
+            queue.get(first.job_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
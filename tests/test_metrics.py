@@ -0,0 +1,104 @@
+"""
+metrics 的测试：Prometheus 文本格式输出、标签转义、直方图累计分桶、抓取时读取的 fn 指标
+
+运行: python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "main"))
+
+import metrics  # noqa: E402
+from metrics import Counter, Gauge, Registry  # noqa: E402
+
+
+class RenderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_and_gauge(self):
+        requests = self.registry.counter("app_requests_total", "请求数", labels=("route",))
+        requests.inc(route="/b")
+        requests.inc(2, route="/a")
+        self.registry.gauge("app_subscribers", "订阅数").set(3.0)
+
+        self.assertEqual(self.registry.render(), (
+            "# HELP app_requests_total 请求数\n"
+            "# TYPE app_requests_total counter\n"
+            'app_requests_total{route="/a"} 2\n'
+            'app_requests_total{route="/b"} 1\n'
+            "# HELP app_subscribers 订阅数\n"
+            "# TYPE app_subscribers gauge\n"
+            "app_subscribers 3\n"
+        ))
+
+    def test_label_escaping(self):
+        gauge = self.registry.gauge("app_value", "多行\n说明", labels=("name",))
+        gauge.set(0.5, name='a"b\\c\nd')
+        lines = self.registry.render().splitlines()
+        self.assertEqual(lines[0], "# HELP app_value 多行\\n说明")
+        self.assertEqual(lines[2], 'app_value{name="a\\"b\\\\c\\nd"} 0.5')
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram("app_seconds", "耗时", labels=("route",), buckets=(1.0, 0.1))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(value, route="/")
+        with histogram.time(route="/"):
+            pass
+
+        self.assertEqual(self.registry.render().splitlines()[2:], [
+            'app_seconds_bucket{route="/",le="0.1"} 2',
+            'app_seconds_bucket{route="/",le="1"} 4',
+            'app_seconds_bucket{route="/",le="+Inf"} 5',
+            f'app_seconds_sum{{route="/"}} {metrics._format_value(histogram.values()[("/",)][1])}',
+            'app_seconds_count{route="/"} 5',
+        ])
+
+    def test_fn_metrics_read_at_scrape(self):
+        current = {"value": 1}
+        self.registry.gauge("app_live", "当前值", fn=lambda: current["value"])
+        self.registry.counter("app_by_state", "按状态", labels=("state",),
+                              fn=lambda: {("waiting",): 2, ("in_flight",): 1})
+        current["value"] = 7
+        text = self.registry.render()
+        self.assertIn("app_live 7\n", text)
+        self.assertIn('app_by_state{state="in_flight"} 1\napp_by_state{state="waiting"} 2\n', text)
+
+    def test_validation(self):
+        counter = self.registry.counter("app_total", "计数", labels=("kind",))
+        with self.assertRaises(ValueError):
+            counter.inc(-1, kind="a")
+        with self.assertRaises(ValueError):
+            counter.inc(other="a")
+        # 同名同类型返回已注册的指标，类型不同时报错
+        self.assertIs(self.registry.counter("app_total", "计数", labels=("kind",)), counter)
+        with self.assertRaises(ValueError):
+            self.registry.gauge("app_total", "计数")
+        self.assertIsInstance(counter, Counter)
+        self.assertNotIsInstance(counter, Gauge)
+
+
+class LLMMetricsTest(unittest.TestCase):
+
+    def test_record_llm_call_by_scene(self):
+        with metrics.use_scene("test_scene"):
+            metrics.record_llm_call("deepseek", 1.5, {"prompt_tokens": 80, "completion_tokens": 12}, ok=True)
+            metrics.record_llm_call("deepseek", 0.1, {}, ok=False)
+            metrics.record_retry()
+
+        tokens = metrics.LLM_TOKENS.values()
+        self.assertEqual(tokens[("deepseek", "test_scene", "prompt")], 80)
+        self.assertEqual(tokens[("deepseek", "test_scene", "completion")], 12)
+        latency = metrics.LLM_LATENCY.values()
+        self.assertEqual(latency[("deepseek", "test_scene", "ok")][2], 1)
+        self.assertEqual(latency[("deepseek", "test_scene", "error")][2], 1)
+        self.assertEqual(metrics.LLM_RETRIES.values()[("test_scene",)], 1)
+        self.assertIn('amphoreus_llm_tokens_total{provider="deepseek",scene="test_scene",kind="prompt"} 80',
+                      metrics.get_registry().render())
+
+
+if __name__ == "__main__":
+    unittest.main()
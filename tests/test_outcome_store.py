@@ -0,0 +1,118 @@
+"""
+outcome_store.OutcomeStore 的测试：日志字典 / .npz / DataFrame 往返、统计与副本
+
+运行: python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "main"))
+
+from outcome_store import OutcomeStore, Status  # noqa: E402
+
+
+LOGS = {
+    '第1次永劫回归': ({'A': '不逐火', 'B': '逐火_交出火种', 'C': '逐火_火种被强夺'}, ['C']),
+    '第2次永劫回归': ({'A': '逐火_交出火种', 'B': '逐火_交出火种', 'C': '不逐火'}, []),
+}
+
+
+class RoundTripTest(unittest.TestCase):
+
+    def test_logs_dict_round_trip(self):
+        store = OutcomeStore.from_logs_dict(LOGS)
+        self.assertEqual(store.characters, ['A', 'B', 'C'])
+        self.assertEqual(store.codes.dtype, np.int8)
+        self.assertEqual(store.codes.tolist(), [[Status.NO_FIRE, Status.HANDED_OVER, Status.ROBBED],
+                                                [Status.HANDED_OVER, Status.HANDED_OVER, Status.NO_FIRE]])
+        self.assertEqual(store.robbed.tolist(), [[False, False, True], [False, False, False]])
+        self.assertEqual(store.to_logs_dict(), LOGS)
+
+    def test_multiple_runs_and_missing_characters(self):
+        store = OutcomeStore.from_logs_dict(LOGS, run_id=0)
+        store.append({'B': '不逐火', 'D': '逐火'}, run_id=1)
+        store.append({'D': '逐火_不交出火种'}, run_id=1)
+
+        self.assertEqual(store.rows(1).tolist(), [2, 3])
+        self.assertEqual(store.round_nums.tolist(), [1, 2, 1, 2])
+        self.assertEqual(store.to_logs_dict(0), LOGS)
+        self.assertEqual(store.to_logs_dict(1), {
+            '第1次永劫回归': ({'B': '不逐火', 'D': '逐火'}, []),
+            '第2次永劫回归': ({'D': '逐火_不交出火种'}, []),
+        })
+        # 新角色加入前的轮次记为 MISSING
+        self.assertEqual(store.codes[0, store.characters.index('D')], Status.MISSING)
+
+    def test_npz_round_trip(self):
+        store = OutcomeStore.from_logs_dict(LOGS)
+        store.append({'A': '逐火_交出火种', 'B': '逐火'}, round_num=3, persuaded_at={'A': 2}, memory_chars=1234)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "outcomes.npz")
+            store.save(path)
+            loaded = OutcomeStore.load(path)
+
+        self.assertEqual(loaded.characters, store.characters)
+        for name in ("codes", "robbed", "attempts", "round_nums", "run_ids"):
+            np.testing.assert_array_equal(getattr(loaded, name), getattr(store, name), err_msg=name)
+        np.testing.assert_array_equal(loaded.memory_chars, store.memory_chars)
+        # 读入后可以继续追加
+        loaded.append({'C': '逐火'})
+        self.assertEqual(len(loaded), 4)
+
+    def test_dataframe(self):
+        store = OutcomeStore.from_logs_dict(LOGS)
+        store.append({'A': '逐火_交出火种'}, round_num=3, persuaded_at={'A': 2}, memory_chars=100)
+        df = store.to_dataframe()
+
+        self.assertEqual(len(df), 7)
+        self.assertEqual(list(df.columns), ['run_id', 'round', 'char_id', 'code', 'status', 'robbed',
+                                            'persuaded_at', 'memory_chars'])
+        robbed = df[df['robbed']]
+        self.assertEqual(robbed[['round', 'char_id', 'status']].values.tolist(), [[1, 'C', '逐火_火种被强夺']])
+        last = df[df['round'] == 3].iloc[0]
+        self.assertEqual((last['status'], last['persuaded_at'], last['memory_chars']), ('逐火_交出火种', 2, 100))
+
+    def test_summary(self):
+        store = OutcomeStore.from_logs_dict(LOGS)
+        summary = store.summary()
+        self.assertEqual(summary['逐火者总数'].tolist(), [2, 2])
+        self.assertEqual(summary['主动交出火种'].tolist(), [1, 2])
+        self.assertEqual(summary['被强夺火种'].tolist(), [1, 0])
+        self.assertEqual(summary['不逐火者'].tolist(), [1, 1])
+        self.assertEqual(store.round_summary(0), {'逐火者总数': 2, '主动交出火种': 1, '被强夺火种': 1, '不逐火者': 1})
+        self.assertEqual(Status.from_label('逐火_交出火种').label, '逐火_交出火种')
+
+
+class CopyTest(unittest.TestCase):
+
+    def test_copy_is_independent(self):
+        store = OutcomeStore.from_logs_dict(LOGS)
+        copy = store.copy()
+        self.assertEqual(copy.to_logs_dict(), LOGS)
+
+        # 原 store 之后的追加（包括新角色的列）不影响副本
+        store.append({'A': '逐火', 'D': '逐火_不交出火种'}, run_id=0, memory_chars=10)
+        self.assertEqual(len(copy), 2)
+        self.assertEqual(copy.characters, ['A', 'B', 'C'])
+        self.assertEqual(copy.to_logs_dict(), LOGS)
+        self.assertTrue(np.isnan(copy.memory_chars).all())
+
+        # 副本可以继续追加
+        copy.append({'A': '不逐火'})
+        self.assertEqual(copy.codes[-1, 0], Status.NO_FIRE)
+        self.assertEqual(len(store), 3)
+
+    def test_copy_empty(self):
+        copy = OutcomeStore().copy()
+        self.assertEqual(len(copy), 0)
+        copy.append({'A': '逐火'})
+        self.assertEqual(copy.round_nums.tolist(), [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+round_graph.RoundGraph 的测试：顺序模式的执行顺序、依赖校验、并发调度与关键路径
+
+运行: python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "main"))
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+
+import stage  # noqa: E402
+from round_graph import RoundGraph, Step  # noqa: E402
+
+
+def _recorder(order, name, delay=0.0):
+    lock = threading.Lock()
+
+    def fn(ctx):
+        time.sleep(delay)
+        with lock:
+            order.append(name)
+    return fn
+
+
+class RoundGraphTest(unittest.TestCase):
+
+    def test_sequential_keeps_declaration_order(self):
+        order = []
+        graph = RoundGraph([
+            Step("oracle", _recorder(order, "oracle")),
+            Step("fire_decisions", _recorder(order, "fire_decisions"), deps=("oracle",)),
+            Step("black_heir_persuade", _recorder(order, "black_heir_persuade")),
+            Step("handover", _recorder(order, "handover"), deps=("fire_decisions", "black_heir_persuade")),
+        ])
+        graph.run({}, concurrent=False)
+        self.assertEqual(order, ["oracle", "fire_decisions", "black_heir_persuade", "handover"])
+
+    def test_declared_before_dependency(self):
+        order = []
+        graph = RoundGraph([
+            Step("b", _recorder(order, "b"), deps=("a",)),
+            Step("a", _recorder(order, "a")),
+        ])
+        graph.run({}, concurrent=False)
+        self.assertEqual(order, ["a", "b"])
+
+    def test_round_steps_match_baseline_output_order(self):
+        # 批量模式顺序执行时，逐火决策在盗火行者劝诫之前输出
+        self.assertEqual([step.name for step in stage.ROUND_GRAPH.steps],
+                         ["oracle", "fire_decisions", "black_heir_persuade", "handover", "persuasion", "collect"])
+
+    def test_invalid_graphs(self):
+        noop = _recorder([], "noop")
+        with self.assertRaisesRegex(ValueError, "重复"):
+            RoundGraph([Step("a", noop), Step("a", noop)])
+        with self.assertRaisesRegex(ValueError, "不存在"):
+            RoundGraph([Step("a", noop, deps=("missing",))])
+        with self.assertRaisesRegex(ValueError, "循环"):
+            RoundGraph([Step("a", noop, deps=("b",)), Step("b", noop, deps=("a",))])
+
+    def test_concurrent_overlaps_independent_steps(self):
+        order = []
+        graph = RoundGraph([
+            Step("slow", _recorder(order, "slow", 0.2)),
+            Step("after_slow", _recorder(order, "after_slow"), deps=("slow",)),
+            Step("fast", _recorder(order, "fast", 0.05)),
+        ])
+        report = graph.run({})
+        self.assertEqual(order, ["fast", "slow", "after_slow"])
+        self.assertLess(report.timings["fast"].start, report.timings["slow"].end)
+        path, _ = report.critical_path()
+        self.assertEqual(path, ["slow", "after_slow"])
+        self.assertLess(report.wall_time, report.serial_time)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+app/server.py 接口的错误状态码测试
+
+不存在或已被丢弃的任务、不存在或已被移除的会话返回 404，而不是 500；
+会话在其他进程中被推进时返回 409，会话方法本身出错时不被保存冲突掩盖。不发出模型请求。
+
+运行: python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "main"))
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+from config.api_config import SimpleAPIClient  # noqa: E402
+from session_store import SQLiteSessionStore  # noqa: E402
+
+
+class NotFoundTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(server.app)
+
+    def test_unknown_job(self):
+        for method, path in (("get", "/api/jobs/nope"), ("post", "/api/jobs/nope/cancel"),
+                             ("get", "/api/jobs/nope/events")):
+            response = getattr(self.client, method)(path)
+            self.assertEqual(response.status_code, 404, path)
+            self.assertIn("nope", response.json()["detail"])
+
+    def test_unknown_session(self):
+        for method, path in (("get", "/api/game/nope/state"), ("post", "/api/game/nope/start"),
+                             ("post", "/api/game/nope/start?background=true"),
+                             ("get", "/api/game/nope/events")):
+            response = getattr(self.client, method)(path)
+            self.assertEqual(response.status_code, 404, path)
+        # 删除不存在的会话不是错误
+        response = self.client.delete("/api/game/nope")
+        self.assertEqual(response.json(), {"session_id": "nope", "deleted": False})
+
+    def test_evicted_session(self):
+        session_id = self.client.post("/api/game/create", json={"max_rounds": 1}).json()["session_id"]
+        self.assertEqual(self.client.get(f"/api/game/{session_id}/state").status_code, 200)
+        server.ig.get_session_store().delete(session_id)
+        self.assertEqual(self.client.get(f"/api/game/{session_id}/state").status_code, 404)
+
+
+class MetricsEndpointTest(unittest.TestCase):
+
+    def test_metrics(self):
+        client = TestClient(server.app)
+        client.get("/api/jobs")
+        response = client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain; version=0.0.4"))
+        text = response.text
+        for name in ("amphoreus_active_sessions", "amphoreus_jobs", "amphoreus_llm_calls",
+                     "amphoreus_http_request_duration_seconds"):
+            self.assertIn(f"# TYPE {name} ", text)
+
+
+class SessionConflictTest(unittest.TestCase):
+    """服务端使用 SQLite 存储，另一个实例（相当于另一个 worker）在请求执行期间推进同一会话"""
+
+    def setUp(self):
+        patcher = mock.patch.object(SimpleAPIClient, "_post_chat",
+                                    lambda client, body, span: '{"decision": "1", "reason": "测试"}')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "sessions.db")
+        previous = server.ig.get_session_store()
+        server.ig.set_session_store(SQLiteSessionStore(path))
+        self.addCleanup(server.ig.set_session_store, previous)
+        self.other = SQLiteSessionStore(path)
+        self.client = TestClient(server.app)
+        self.session_id = self.client.post("/api/game/create", json={"max_rounds": 1}).json()["session_id"]
+        self.start = server.ig.GameSession.start
+
+    def _advance_elsewhere(self):
+        session = self.other.get(self.session_id)
+        self.start(session)
+        self.other.save(session)
+
+    def test_conflict_is_409(self):
+        def start_after_other_worker(session):
+            self._advance_elsewhere()
+            return self.start(session)
+
+        with mock.patch.object(server.ig.GameSession, "start", start_after_other_worker):
+            response = self.client.post(f"/api/game/{self.session_id}/start")
+        self.assertEqual(response.status_code, 409)
+        # 重新取到的是另一实例保存的状态
+        state = self.client.get(f"/api/game/{self.session_id}/state").json()
+        self.assertEqual(state["stage"], "choose_character")
+
+    def test_method_error_not_masked_by_conflict(self):
+        def failing_start(session):
+            self._advance_elsewhere()
+            session.version += 1
+            raise RuntimeError("方法出错")
+
+        with mock.patch.object(server.ig.GameSession, "start", failing_start), \
+                self.assertRaisesRegex(RuntimeError, "方法出错"):
+            self.client.post(f"/api/game/{self.session_id}/start")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+"""
+session_store 的测试：LRU / 字符数 / 空闲超时淘汰，被移除的会话返回 SessionNotFound；
+SQLite 存储在多个实例（进程）间的重新加载与乐观并发冲突
+
+内存存储使用不调用模型的假会话；SQLite 存储使用真实的 GameSession，模型请求替换为固定回复。
+
+运行: python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "main"))
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+
+from config.api_config import SimpleAPIClient  # noqa: E402
+from interactive_game import GameSession  # noqa: E402
+from session_store import SessionConflict, SessionNotFound, SessionStore, SQLiteSessionStore  # noqa: E402
+
+
+class _FakeSession:
+    def __init__(self, session_id, chars=1000):
+        self.session_id = session_id
+        self.chars = chars
+        self.closed = False
+
+    def footprint(self):
+        return self.chars
+
+    def close(self):
+        self.closed = True
+
+
+class SessionStoreTest(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        store = SessionStore(max_sessions=2, idle_ttl=None)
+        a, b, c = _FakeSession("a"), _FakeSession("b"), _FakeSession("c")
+        store.add(a)
+        store.add(b)
+        store.get("a")
+        store.add(c)
+
+        # b 最久未使用，被淘汰并关闭
+        self.assertEqual(list(store._sessions), ["a", "c"])
+        self.assertTrue(b.closed)
+        self.assertFalse(a.closed)
+        with self.assertRaises(SessionNotFound):
+            store.get("b")
+        self.assertEqual(store.stats()["removed"], 1)
+
+    def test_char_budget_keeps_newest(self):
+        store = SessionStore(max_sessions=None, idle_ttl=None, max_total_chars=2500)
+        for name in ("a", "b", "c"):
+            store.add(_FakeSession(name))
+        self.assertEqual(list(store._sessions), ["b", "c"])
+
+        # 单个会话超出预算时仍保留刚加入的会话
+        store.add(_FakeSession("big", chars=10000))
+        self.assertEqual(list(store._sessions), ["big"])
+
+    def test_idle_ttl_sweep(self):
+        store = SessionStore(max_sessions=None, idle_ttl=0.05)
+        store.add(_FakeSession("old"))
+        time.sleep(0.1)
+        store.add(_FakeSession("new"))
+        self.assertEqual(store.sweep(), ["old"])
+        with self.assertRaises(SessionNotFound):
+            store.peek("old")
+        self.assertEqual(store.peek("new").session_id, "new")
+
+    def test_delete(self):
+        store = SessionStore()
+        session = _FakeSession("a")
+        store.add(session)
+        self.assertTrue(store.delete("a"))
+        self.assertTrue(session.closed)
+        self.assertFalse(store.delete("a"))
+
+
+class SQLiteSessionStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(SimpleAPIClient, "_post_chat",
+                                    lambda client, body, span: '{"decision": "1", "reason": "测试"}')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "sessions.db")
+        # 两个实例共用一个数据库文件，相当于两个 worker 进程
+        self.first = SQLiteSessionStore(path)
+        self.second = SQLiteSessionStore(path)
+        self.session = GameSession(max_rounds=1, seed=1)
+        self.first.add(self.session)
+
+    def test_reload_after_other_store_saves(self):
+        other = self.second.get(self.session.session_id)
+        other.start()
+        self.second.save(other)
+
+        reloaded = self.first.get(self.session.session_id)
+        self.assertIsNot(reloaded, self.session)
+        self.assertEqual(reloaded.stage, "choose_character")
+        self.assertEqual(reloaded.events, other.events)
+        # 版本未变化时直接使用缓存
+        self.assertIs(self.first.get(self.session.session_id), reloaded)
+
+    def test_replaced_session_stays_open(self):
+        other = self.second.get(self.session.session_id)
+        other.start()
+        self.second.save(other)
+
+        # 被替换的旧对象可能仍被本进程的请求或推送通道使用，不关闭
+        with mock.patch.object(GameSession, "close") as close:
+            self.first.get(self.session.session_id)
+        close.assert_not_called()
+        self.assertNotIn(self.session, [entry[0] for entry in self.first._sessions.values()])
+
+    def test_conflict(self):
+        other = self.second.get(self.session.session_id)
+        other.start()
+        self.second.save(other)
+
+        self.session.start()
+        with self.assertRaises(SessionConflict):
+            self.first.save(self.session)
+        # 冲突的修改未写入，重新取到的是另一实例保存的状态
+        self.assertEqual(self.first.get(self.session.session_id).events, other.events)
+
+    def test_deleted_elsewhere(self):
+        self.second.delete(self.session.session_id)
+        self.session.start()
+        with self.assertRaises(SessionConflict):
+            self.first.save(self.session)
+        with self.assertRaises(SessionNotFound):
+            self.first.get(self.session.session_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+stage.run_one_iteration 图调度模式的回归测试
+
+盗火行者劝诫没有依赖，会与神谕同时开始；神谕（及黄金裔初始化）较慢时，
+劝诫步骤也必须能拿到本轮状态。模型调用替换为固定回复，不发出网络请求。
+
+运行: python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "main"))
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+
+import agent  # noqa: E402
+import stage  # noqa: E402
+from config.api_config import SimpleAPIClient  # noqa: E402
+from engine import SimulationEngine  # noqa: E402
+
+
+REPLY = '{"decision": "1", "reason": "测试"}'
+
+
+def _fake_chat(self, content, system_prompt=None, **kwargs):
+    return REPLY
+
+
+class SlowOracleGraphTest(unittest.TestCase):
+
+    def test_graph_with_slow_oracle(self):
+        init_chrysos_heir = agent.init_chrysos_heir
+        oracle = SimulationEngine.oracle
+        started = {}
+
+        def slow_init(*args, **kwargs):
+            time.sleep(0.05)
+            return init_chrysos_heir(*args, **kwargs)
+
+        def slow_oracle(engine, state):
+            started["oracle"] = time.time()
+            time.sleep(0.2)
+            yield from oracle(engine, state)
+
+        black_heir_persuade = SimulationEngine.black_heir_persuade
+
+        def recorded_persuade(engine, state):
+            started["black_heir_persuade"] = time.time()
+            yield from black_heir_persuade(engine, state)
+
+        with mock.patch.object(SimpleAPIClient, "chat", _fake_chat), \
+                mock.patch.object(agent, "init_chrysos_heir", slow_init), \
+                mock.patch.object(SimulationEngine, "oracle", slow_oracle), \
+                mock.patch.object(SimulationEngine, "black_heir_persuade", recorded_persuade):
+            statuses, robbed = stage.run_one_iteration(
+                black_heirs=agent.init_black_heir(), max_persuasion_attempts=1,
+                scheduler="graph", headless=True, seed=1,
+            )
+
+        # 劝诫在神谕结束之前就已开始，两者确实同时进行
+        self.assertLess(started["black_heir_persuade"], started["oracle"] + 0.2)
+        self.assertTrue(statuses)
+        self.assertTrue(all(status.startswith("逐火") for status in statuses.values()))
+        self.assertEqual(robbed, [])
+
+
+if __name__ == "__main__":
+    unittest.main()